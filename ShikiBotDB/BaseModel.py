@@ -0,0 +1,4 @@
+from sqlalchemy.ext.declarative import declarative_base
+
+
+BaseModel = declarative_base()
@@ -1,34 +1,35 @@
 from datetime import datetime
-from sqlalchemy import create_engine
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
-
-
-BaseModel = declarative_base()
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKeyConstraint
+from sqlalchemy.orm import relationship
+from ShikiBotDB.BaseModel import BaseModel
+from ShikiBotDB.TitleModel import Title
 
 
 class Callback(BaseModel):
+    """
+    Search made by user.
+    Title data is stored once in the titles table,
+    callback only references it.
+    """
     __tablename__ = 'callbacks'
+    __table_args__ = (
+        ForeignKeyConstraint(['title_kind', 'title_id'], ['titles.kind', 'titles.id']),
+    )
     id = Column(Integer, primary_key=True)
     chat_id = Column(Integer)
-    title_name = Column(String(100))
-    title_score = Column(Float)
-    title_synopsis = Column(Text(1000))
-    title_genres = Column(Text(250))
-    message_datetime = Column(DateTime)
+    title_kind = Column(String(5))
+    title_id = Column(Integer)
+    # Indexed for the expired callbacks sweep
+    message_datetime = Column(DateTime, index=True)
+
+    # Title is loaded in the same query as callback
+    title = relationship(Title, lazy='joined')
 
-    def __init__(self, chat_id, title_name, title_score, title_synopsis, title_genres):
+    def __init__(self, chat_id, title_kind, title_id):
         self.chat_id = chat_id
-        self.title_name = title_name
-        self.title_score = title_score
-        self.title_synopsis = title_synopsis
-        self.title_genres = title_genres
+        self.title_kind = title_kind
+        self.title_id = title_id
         self.message_datetime = datetime.now()
 
     def __str__(self):
-        return f'{self.chat_id}: {self.title_name}'
-
-
-ENGINE = create_engine('sqlite:///callbacks')
-BaseModel.metadata.create_all(bind=ENGINE)
+        return f'{self.chat_id}: {self.title_kind} {self.title_id}'
@@ -1,8 +1,10 @@
 import logging
-from datetime import timedelta
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
-from ShikiBotDB import Callback
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from ShikiBotDB.CallbackModel import Callback
+from ShikiBotDB.TitleModel import Title
+from ShikiBotDB.PosterModel import Poster
+from ShikiBotDB.Engine import Session
 
 
 class CallbackProxy:
@@ -10,54 +12,139 @@ class CallbackProxy:
     This class gives some functionality to work with DB
     How to use:
     - Create CallbackProxy object than work with DB, but...
-    have in mind that you need to create new object for every thread
-    one object can't work in defferent threads
+    have in mind that session belongs to the thread
+    where object was created, don't pass object to other threads
+    - Call close() when work is done, or use object as context manager:
+      with CallbackProxy() as callback_proxy:
+          ...
     """
-    ENGINE = create_engine('sqlite:///callbacks')
 
     def __init__(self):
-        Session = sessionmaker(bind=self.ENGINE)
         self.session = Session()
 
-    def add_callback(self, chat_id, title_name, title_score, title_synopsis, title_genres):
+    def add_callback(self, chat_id, title):
         """
-        Adds record to the Callbacks table.
+        Attributes:
+        - chat_id {int}: chat where title was searched
+        - title {ShikiParser.Title}: found title
+
+        Adds title to the Titles table if it's not there yet,
+        and adds record to the Callbacks table.
         Returns this record's id.
         """
-        callback = Callback(chat_id,
-                            title_name,
-                            title_score, 
-                            title_synopsis,
-                            self.get_genres_ready(title_genres))
+        try:
+            return self.__add_callback(chat_id, title)
+        except IntegrityError:
+            # Same title was inserted by other thread at the same time
+            self.session.rollback()
+            return self.__add_callback(chat_id, title)
+
+    def __add_callback(self, chat_id, title):
+        self.add_title(title)
+        callback = Callback(chat_id, title.kind, title.id)
         self.session.add(callback)
         self.session.commit()
         # logging.debug('Callback record created.')
         return callback.id
 
+    def add_title(self, title):
+        """
+        Adds record to the Titles table or updates it if title data changed.
+        Doesn't commit.
+        Returns Title(model) object.
+        """
+        genres = self.get_genres_ready(title.genres)
+        record = self.session.get(Title, (title.kind, title.id))
+        if record is None:
+            record = Title(title.kind,
+                           title.id,
+                           title.name,
+                           title.score,
+                           title.synopsis,
+                           genres,
+                           title.image_url)
+            self.session.add(record)
+            return record
+
+        fields = {
+            'name': title.name,
+            'score': title.score,
+            'synopsis': title.synopsis,
+            'genres': genres,
+            'image_url': title.image_url
+        }
+        if any(getattr(record, field) != value for field, value in fields.items()):
+            for field, value in fields.items():
+                setattr(record, field, value)
+            record.updated_datetime = datetime.now()
+        return record
+
     def get_callback_by_id(self, _id):
         """
-        Return the Callback(class) object with given id
+        Return the Callback(class) object with given id,
+        callback.title is loaded in the same query.
         if previous not exists returns None
         """
         query = self.session.query(Callback).filter(Callback.id == _id)
         # logging.debug('Got the id from get_callback_id')
         return query.first()
 
-    def delete_old_callbacks(self, days=1, hours=0, minutes=0):
+    def get_title(self, kind, _id):
+        """
+        Return the Title(model) object with given kind and id
+        if previous not exists returns None
+        """
+        return self.session.get(Title, (kind, _id))
+
+    def get_poster_file_id(self, image_url):
+        """
+        Return telegram file_id of poster with given url,
+        if poster wasn't sent yet returns None
+        """
+        poster = self.session.get(Poster, image_url)
+        return poster.file_id if poster is not None else None
+
+    def set_poster_file_id(self, image_url, file_id):
+        """
+        Save telegram file_id of poster, or remove it if file_id is None.
+        """
+        poster = self.session.get(Poster, image_url)
+        if file_id is None:
+            if poster is not None:
+                self.session.delete(poster)
+        elif poster is None:
+            self.session.add(Poster(image_url, file_id))
+        else:
+            poster.file_id = file_id
+            poster.updated_datetime = datetime.now()
+        try:
+            self.session.commit()
+        except IntegrityError:
+            # Same poster was saved by other thread at the same time
+            self.session.rollback()
+
+    def delete_old_callbacks(self, days=1, hours=0, minutes=0, batch_size=500):
         """
         Delete callbacks that older than given number of
-        days + hours + minutes
-        Returns deleted callback.
-        """
-        query = self.session.query(Callback).filter(
-                Callback.message_datetime >= timedelta(days=days,
-                                                       hours=hours,
-                                                       minutes=minutes)
-        )
-        self.session.delete(query)
-        self.session.commit()
-        # logging.debug('deleted_all_callbacks was called')
-        return query.first()
+        days + hours + minutes.
+        Rows are deleted by batches of batch_size, every batch
+        is committed separately, so database isn't locked for long.
+        Returns number of deleted callbacks.
+        """
+        oldest = datetime.now() - timedelta(days=days, hours=hours, minutes=minutes)
+        deleted = 0
+        while True:
+            expired_ids = self.session.query(Callback.id) \
+                .filter(Callback.message_datetime < oldest) \
+                .limit(batch_size)
+            count = self.session.query(Callback) \
+                .filter(Callback.id.in_(expired_ids.scalar_subquery())) \
+                .delete(synchronize_session=False)
+            self.session.commit()
+            deleted += count
+            if count < batch_size:
+                # logging.debug('deleted_all_callbacks was called')
+                return deleted
 
     @staticmethod
     def get_genres_ready(genres):
@@ -69,5 +156,14 @@ class CallbackProxy:
         """
         return ', '.join(genres)
 
-    def __del__(self):
-        self.session.close()
+    def close(self):
+        """
+        Close thread session and return connection to the pool.
+        """
+        Session.remove()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
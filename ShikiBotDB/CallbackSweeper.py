@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from ShikiBotDB.CallbackProxy import CallbackProxy
+
+
+class CallbackSweeper:
+    """
+    Deletes expired callbacks in background thread.
+
+    Attributes:
+    - interval {float}: seconds between sweeps
+    - max_age_minutes {int}: callbacks older than that are deleted
+    - batch_size {int}: max rows deleted in one transaction
+
+    After every sweep number of removed rows and sweep duration
+    are logged and kept in last_removed and last_duration.
+    """
+    def __init__(self, interval=300, max_age_minutes=60, batch_size=500) -> None:
+        self.interval = interval
+        self.max_age_minutes = max_age_minutes
+        self.batch_size = batch_size
+        self.sweeps = 0
+        self.last_removed = 0
+        self.last_duration = 0.0
+        self.total_removed = 0
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name='callback-sweeper', daemon=True)
+        self.__thread.start()
+
+    def stop(self, timeout=None):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def sweep(self):
+        """
+        Delete expired callbacks once.
+        Returns number of removed rows.
+        """
+        started = time.monotonic()
+        with CallbackProxy() as callback_proxy:
+            removed = callback_proxy.delete_old_callbacks(days=0,
+                                                          minutes=self.max_age_minutes,
+                                                          batch_size=self.batch_size)
+        self.last_duration = time.monotonic() - started
+        self.last_removed = removed
+        self.total_removed += removed
+        self.sweeps += 1
+        logging.info(f'Callbacks sweep removed {removed} rows in {self.last_duration:.3f}s')
+        return removed
+
+    def stats(self):
+        return {
+            'sweeps': self.sweeps,
+            'last_removed': self.last_removed,
+            'last_duration': self.last_duration,
+            'total_removed': self.total_removed,
+        }
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception('Callbacks sweep failed')
@@ -0,0 +1,46 @@
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+
+
+DATABASE_URL = os.environ.get('SHIKIBOT_DATABASE_URL', 'sqlite:///callbacks')
+POOL_SIZE = int(os.environ.get('SHIKIBOT_DB_POOL_SIZE', 5))
+# Milliseconds SQLite waits for the write lock before "database is locked" error
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SHIKIBOT_SQLITE_BUSY_TIMEOUT', 5000))
+
+
+def make_engine(url):
+    """
+    Create engine for given database url.
+    SQLite connections are pooled and set to WAL mode,
+    so readers don't wait for the writer.
+    """
+    # Heroku gives postgres:// urls, which SQLAlchemy doesn't accept
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+
+    if not url.startswith('sqlite'):
+        return create_engine(url, pool_size=POOL_SIZE, pool_pre_ping=True)
+
+    engine = create_engine(url,
+                           poolclass=QueuePool,
+                           pool_size=POOL_SIZE,
+                           connect_args={'check_same_thread': False,
+                                         'timeout': SQLITE_BUSY_TIMEOUT / 1000})
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    return engine
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cursor.close()
+
+
+# One engine per process
+ENGINE = make_engine(DATABASE_URL)
+# Every thread gets its own session, Session.remove() closes it
+Session = scoped_session(sessionmaker(bind=ENGINE))
@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime
+from ShikiBotDB.BaseModel import BaseModel
+
+
+class Poster(BaseModel):
+    """
+    Telegram file_id of title poster, which was already sent by url.
+    Key is poster url, so new poster of the same title is uploaded again.
+    """
+    __tablename__ = 'posters'
+    image_url = Column(String(250), primary_key=True)
+    file_id = Column(String(250))
+    updated_datetime = Column(DateTime)
+
+    def __init__(self, image_url, file_id):
+        self.image_url = image_url
+        self.file_id = file_id
+        self.updated_datetime = datetime.now()
+
+    def __str__(self):
+        return f'{self.image_url}: {self.file_id}'
@@ -0,0 +1,23 @@
+from sqlalchemy import inspect
+from ShikiBotDB.BaseModel import BaseModel
+from ShikiBotDB.CallbackModel import Callback
+from ShikiBotDB.Engine import ENGINE
+
+
+def init_db(engine=ENGINE):
+    """
+    Create missing tables and indexes, migrate old tables.
+    Called once by every server worker on start, not on import,
+    so importing ShikiBotDB doesn't touch the database.
+    Tables of all models are known, because the package imports them.
+    """
+    # Callbacks table made before titles table has title data in every row.
+    # Callbacks live about an hour, so old table is just recreated.
+    inspector = inspect(engine)
+    if inspector.has_table('callbacks') and \
+            'title_id' not in [column['name'] for column in inspector.get_columns('callbacks')]:
+        Callback.__table__.drop(bind=engine)
+    BaseModel.metadata.create_all(bind=engine)
+    # create_all doesn't add new indexes to already existing tables
+    for index in Callback.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
+from ShikiBotDB import Callback, CallbackProxy, CallbackSweeper, init_db
+from ShikiBotDB.Engine import ENGINE, make_engine
+from ShikiParser import Title
+
+
+def make_title(name, title_id=1):
+    return Title('anime',
+                 title_id,
+                 f'https://shikimori.one/animes/z{title_id}-title',
+                 name,
+                 8.0,
+                 f'{name} synopsis',
+                 ['Драма'],
+                 'https://shikimori.one/poster.jpg')
+
+
+def add_callbacks(count, age):
+    """
+    Adds count callbacks made age ago, returns their ids.
+    """
+    ids = []
+    with CallbackProxy() as callback_proxy:
+        for chat_id in range(count):
+            ids.append(callback_proxy.add_callback(chat_id, make_title('Made in Abyss', 34599)))
+        callback_proxy.session.query(Callback) \
+            .filter(Callback.id.in_(ids)) \
+            .update({Callback.message_datetime: datetime.now() - age}, synchronize_session=False)
+        callback_proxy.session.commit()
+    return ids
+
+
+class TestCallbackProxy:
+    def test_delete_old_callbacks(self, database):
+        """
+        Test if callbacks older than given age are deleted by batches
+        and recent ones are kept.
+        """
+        add_callbacks(5, timedelta(hours=2))
+        recent = add_callbacks(2, timedelta(minutes=10))
+        with CallbackProxy() as callback_proxy:
+            assert callback_proxy.delete_old_callbacks(days=0, hours=1, batch_size=2) == 5
+            assert [callback.id for callback in callback_proxy.session.query(Callback)] == recent
+            assert callback_proxy.get_callback_by_id(recent[0]).title.name == 'Made in Abyss'
+
+    def test_sweeper(self, database):
+        add_callbacks(3, timedelta(hours=2))
+        add_callbacks(1, timedelta(minutes=10))
+        sweeper = CallbackSweeper(max_age_minutes=60, batch_size=2)
+        assert sweeper.sweep() == 3
+        assert sweeper.sweep() == 0
+        assert sweeper.stats()['total_removed'] == 3
+
+
+class TestInitDb:
+    def test_import(self):
+        """
+        Test if importing ShikiBotDB doesn't create tables.
+        """
+        assert inspect(ENGINE).get_table_names() == []
+
+    def test_old_callbacks_table(self, tmp_path):
+        """
+        Test if callbacks table without title columns is recreated.
+        """
+        engine = make_engine(f'sqlite:///{tmp_path / "callbacks.db"}')
+        with engine.begin() as connection:
+            connection.execute(text('CREATE TABLE callbacks (id INTEGER PRIMARY KEY, title_name TEXT)'))
+        init_db(engine)
+        init_db(engine)
+        inspector = inspect(engine)
+        assert {'callbacks', 'titles', 'posters'} <= set(inspector.get_table_names())
+        assert 'title_id' in [column['name'] for column in inspector.get_columns('callbacks')]
+        assert 'ix_callbacks_message_datetime' in [index['name'] for index in inspector.get_indexes('callbacks')]
+        engine.dispose()
@@ -0,0 +1,32 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime
+from ShikiBotDB.BaseModel import BaseModel
+
+
+class Title(BaseModel):
+    """
+    One record per shikimori title.
+    Primary key is (kind, id), because anime and manga ids can be the same.
+    """
+    __tablename__ = 'titles'
+    kind = Column(String(5), primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(250))
+    score = Column(Float)
+    synopsis = Column(Text)
+    genres = Column(Text(250))
+    image_url = Column(String(250))
+    updated_datetime = Column(DateTime)
+
+    def __init__(self, kind, _id, name, score, synopsis, genres, image_url):
+        self.kind = kind
+        self.id = _id
+        self.name = name
+        self.score = score
+        self.synopsis = synopsis
+        self.genres = genres
+        self.image_url = image_url
+        self.updated_datetime = datetime.now()
+
+    def __str__(self):
+        return f'{self.kind} {self.id}: {self.name}'
@@ -1,2 +1,6 @@
 from ShikiBotDB.CallbackModel import Callback
-from ShikiBotDB.CallbackProxy import CallbackProxy
\ No newline at end of file
+from ShikiBotDB.TitleModel import Title
+from ShikiBotDB.PosterModel import Poster
+from ShikiBotDB.CallbackProxy import CallbackProxy
+from ShikiBotDB.CallbackSweeper import CallbackSweeper
+from ShikiBotDB.Schema import init_db
@@ -0,0 +1,174 @@
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http import HTTPStatus
+from http.client import parse_headers
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+
+class FakeTelegram:
+    """
+    Local stand-in for telegram Bot API, used by the load test.
+
+    How to use:
+        with FakeTelegram() as fake:
+            telebot.apihelper.API_URL = fake.api_url
+
+    sendMessage and sendPhoto are answered with message json
+    (sent photo gets file_id), other methods with true.
+    Text longer than telegram allows is answered with 400, as telegram does,
+    and counted in rejected. telebot sends params in the url, so text of
+    tens of thousands of chars makes url longer than http.server reads,
+    such requests are answered and counted the same way.
+
+    Attributes:
+    - latency {float}: seconds every answer is delayed
+    - error_rate {float}: part of send requests answered with 429,
+      such answers are counted in errors
+    - retry_after {int}: retry_after parameter of 429 answers
+
+    reply_hook attribute is called with (method, params) for every
+    answered send request, by default does nothing.
+    """
+    SEND_METHODS = ('sendMessage', 'sendPhoto')
+    MAX_TEXT_LENGTH = 4096
+    MAX_CAPTION_LENGTH = 1024
+    BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'ShikiBot', 'username': 'shiki_load_bot'}
+    TOO_LONG = {'ok': False, 'error_code': 400, 'description': 'Bad Request: message is too long'}
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0, retry_after=1) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.reply_hook = lambda method, params: None
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.methods = Counter()
+        self.__message_ids = 0
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.__server.daemon_threads = True
+        self.url = f'http://{host}:{self.__server.server_address[1]}'
+        self.api_url = f'{self.url}/bot{{0}}/{{1}}'
+        self.__thread = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def handle(self, method, params):
+        """
+        Returns (status, answer dict) for API method with params.
+        """
+        is_send = method in self.SEND_METHODS
+        with self.__lock:
+            self.requests += 1
+            self.methods[method] += 1
+            is_error = is_send and self.error_rate > 0 and random.random() < self.error_rate
+            if is_error:
+                self.errors += 1
+            self.__message_ids += 1
+            message_id = self.__message_ids
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if is_error:
+            return 429, {'ok': False, 'error_code': 429,
+                         'description': f'Too Many Requests: retry after {self.retry_after}',
+                         'parameters': {'retry_after': self.retry_after}}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': self.BOT_USER}
+        if not is_send:
+            return 200, {'ok': True, 'result': True}
+        if (len(params.get('text', '')) > self.MAX_TEXT_LENGTH
+                or len(params.get('caption', '')) > self.MAX_CAPTION_LENGTH):
+            return self.reject()
+
+        chat_id = int(params.get('chat_id', 0))
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'from': self.BOT_USER,
+        }
+        if method == 'sendPhoto':
+            message['photo'] = [{'file_id': f'photo-{message_id}',
+                                 'file_unique_id': f'unique-{message_id}',
+                                 'width': 225, 'height': 320}]
+            message['caption'] = params.get('caption', '')
+        else:
+            message['text'] = params.get('text', '')
+        self.reply_hook(method, params)
+        return 200, {'ok': True, 'result': message}
+
+    def reject(self):
+        """
+        Returns (status, answer dict) for too long message.
+        """
+        with self.__lock:
+            self.rejected += 1
+        return 400, self.TOO_LONG
+
+    def __make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self.answer()
+
+            def do_POST(self):
+                self.answer()
+
+            def answer(self):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('application/json'):
+                    params.update(json.loads(body))
+                elif content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode('utf-8')))
+                self.write_answer(*fake.handle(url.path.rsplit('/', 1)[-1], params))
+
+            def write_answer(self, status, answer):
+                data = json.dumps(answer).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_error(self, code, message=None, explain=None):
+                if code != HTTPStatus.REQUEST_URI_TOO_LONG:
+                    super().send_error(code, message, explain)
+                    return
+                # Read the rest of the url and headers, so client gets the answer
+                self.rfile.readline()
+                parse_headers(self.rfile)
+                self.request_version = 'HTTP/1.1'
+                self.close_connection = True
+                self.write_answer(*fake.reject())
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
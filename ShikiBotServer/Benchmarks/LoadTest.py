@@ -0,0 +1,452 @@
+"""
+End-to-end load test of the bot server with FakeTelegram and FakeShikimori
+in place of telegram Bot API and shikimori.
+
+How to use (from repository root):
+    python -m ShikiBotServer.Benchmarks.LoadTest --rate 20 --duration 60
+    python -m ShikiBotServer.Benchmarks.LoadTest --rate 10 --duration 3600 --output soak.json
+    python -m ShikiBotServer.Benchmarks.LoadTest --shiki-latency 0.3 --shiki-error-rate 0.05
+
+Server is started with gunicorn in a temporary directory, so its databases,
+caches and logs don't touch the working ones. Updates are POSTed to /bot
+at fixed rate: text searches, and button callbacks for keyboards the bot has sent.
+Latency is time from POST to the bot reply received by FakeTelegram.
+
+Results are written as json: throughput, reply latency percentiles,
+error counts, and server memory (RSS of gunicorn processes) with
+callbacks table size sampled during the run, with growth per hour.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from ShikiParser.Benchmarks import FakeShikimori
+from ShikiParser.Benchmarks.Bench import percentile
+from ShikiBotServer.Benchmarks.FakeTelegram import FakeTelegram
+
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Searches FakeShikimori knows, the rest is not found
+SEARCHES = ('аниме Made in Abyss', 'аниме Claymore', 'аниме Gintama', 'манга Berserk')
+CALLBACK_POOL_SIZE = 1000
+
+
+def make_message_update(update_id, chat_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Load'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': text,
+        },
+    }
+
+
+def make_callback_update(update_id, chat_id, data):
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Load'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Load'},
+                'from': FakeTelegram.BOT_USER,
+                'caption': 'Title',
+            },
+        },
+    }
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_process_tree_rss(pid):
+    """
+    Returns RSS in bytes of process and all its children, taken from /proc,
+    None if process is gone or there is no /proc.
+    """
+    total = None
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total = (total or 0) + int(line.split()[1]) * 1024
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as file:
+                    pids.extend(int(child) for child in file.read().split())
+        except OSError:
+            # Process has just exited
+            continue
+    return total
+
+
+def count_rows(database, table):
+    """
+    Returns number of rows in SQLite table, 0 if there is no table yet.
+    """
+    if database is None or not os.path.exists(database):
+        return None
+    try:
+        with sqlite3.connect(database, timeout=1) as connection:
+            return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def get_growth_per_hour(samples):
+    """
+    Least squares slope of (seconds, value) samples, per hour.
+    """
+    samples = [(seconds, value) for seconds, value in samples if value is not None]
+    if len(samples) < 2:
+        return None
+    mean_x = sum(x for x, _ in samples) / len(samples)
+    mean_y = sum(y for _, y in samples) / len(samples)
+    variance = sum((x - mean_x) ** 2 for x, _ in samples)
+    if not variance:
+        return None
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in samples)
+    return covariance / variance * 3600
+
+
+class LoadTest:
+    """
+    Sends updates to the bot server and waits for its replies.
+
+    Attributes:
+    - bot_url {str}: url of /bot route
+    - telegram {FakeTelegram}: fake API the server sends replies to
+    - rate {float}: updates per second
+    - duration {float}: seconds updates are sent
+    - callback_share {float}: part of updates which are button clicks
+    - miss_share {float}: part of searches for titles which don't exist
+    - concurrency {int}: max number of POST requests at once
+    - reply_timeout {float}: seconds to wait for the replies after the last update
+    """
+    BUTTONS = ('synopsis', 'score', 'genre')
+
+    def __init__(self, bot_url, telegram, rate=10, duration=60, callback_share=0.3,
+                 miss_share=0.2, concurrency=32, reply_timeout=10) -> None:
+        self.bot_url = bot_url
+        self.telegram = telegram
+        self.rate = rate
+        self.duration = duration
+        self.callback_share = callback_share
+        self.miss_share = miss_share
+        self.concurrency = concurrency
+        self.reply_timeout = reply_timeout
+        self.sent = defaultdict(int)
+        self.http_errors = 0
+        self.latencies = []
+        self.last_reply_at = None
+        self.__update_id = 0
+        self.__chat_id = 10 ** 6
+        # chat_id -> send times of updates waiting for reply
+        self.__pending = defaultdict(deque)
+        self.__callbacks = []
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        telegram.reply_hook = self.on_reply
+
+    def next_update(self):
+        """
+        Returns (chat_id, update dict, kind).
+        Clicks go to chats which got a keyboard, searches to new chats.
+        """
+        with self.__lock:
+            self.__update_id += 1
+            update_id = self.__update_id
+            if self.__callbacks and random.random() < self.callback_share:
+                chat_id, data = random.choice(self.__callbacks)
+                return chat_id, make_callback_update(update_id, chat_id, data), 'callback'
+            self.__chat_id += 1
+            chat_id = self.__chat_id
+        if random.random() < self.miss_share:
+            text = f'аниме unknown title {random.getrandbits(32):x}'
+        else:
+            text = random.choice(SEARCHES)
+        return chat_id, make_message_update(update_id, chat_id, text), 'search'
+
+    def post(self, chat_id, update, sent_at):
+        session = getattr(self.__local, 'session', None)
+        if session is None:
+            session = self.__local.session = requests.Session()
+        try:
+            response = session.post(self.bot_url, json=update, timeout=10)
+            is_error = response.status_code != 200
+        except requests.RequestException:
+            is_error = True
+        if is_error:
+            with self.__lock:
+                self.http_errors += 1
+                if sent_at in self.__pending[chat_id]:
+                    self.__pending[chat_id].remove(sent_at)
+
+    def on_reply(self, method, params):
+        """
+        Called by FakeTelegram for every reply, matches it with the oldest
+        update of the chat and keeps keyboard callbacks for later clicks.
+        """
+        received_at = time.monotonic()
+        chat_id = int(params.get('chat_id', 0))
+        with self.__lock:
+            pending = self.__pending.get(chat_id)
+            if pending:
+                self.latencies.append(received_at - pending.popleft())
+                self.last_reply_at = received_at
+                if not pending:
+                    del self.__pending[chat_id]
+            keyboard = params.get('reply_markup')
+            if method == 'sendPhoto' and keyboard:
+                for row in json.loads(keyboard).get('inline_keyboard', []):
+                    for button in row:
+                        self.__add_callback(chat_id, button.get('callback_data'))
+
+    def __add_callback(self, chat_id, data):
+        if not data:
+            return
+        if len(self.__callbacks) < CALLBACK_POOL_SIZE:
+            self.__callbacks.append((chat_id, data))
+        else:
+            self.__callbacks[random.randrange(CALLBACK_POOL_SIZE)] = (chat_id, data)
+
+    def pending_count(self):
+        with self.__lock:
+            return sum(len(pending) for pending in self.__pending.values())
+
+    def run(self):
+        """
+        Send updates at rate for duration, then wait for replies.
+        Returns dict with results.
+        """
+        started = time.monotonic()
+        next_at = started
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            while next_at < started + self.duration:
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                chat_id, update, kind = self.next_update()
+                sent_at = time.monotonic()
+                with self.__lock:
+                    self.__pending[chat_id].append(sent_at)
+                    self.sent[kind] += 1
+                pool.submit(self.post, chat_id, update, sent_at)
+                next_at += 1 / self.rate
+        sending_seconds = time.monotonic() - started
+
+        deadline = time.monotonic() + self.reply_timeout
+        while self.pending_count() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # Updates left without reply don't stretch the run
+        elapsed = max(self.last_reply_at or 0, started + sending_seconds) - started
+
+        with self.__lock:
+            latencies = sorted(self.latencies)
+        sent = sum(self.sent.values())
+        return {
+            'target_rate': self.rate,
+            'sent_rate': sent / sending_seconds,
+            'seconds': elapsed,
+            'updates': dict(self.sent, total=sent),
+            'replies': len(latencies),
+            'throughput': len(latencies) / elapsed,
+            'latency_ms': {
+                'p50': percentile(latencies, 50) * 1000,
+                'p90': percentile(latencies, 90) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'max': latencies[-1] * 1000,
+            } if latencies else None,
+            'errors': {
+                'http': self.http_errors,
+                'no_reply': self.pending_count(),
+                'telegram_injected': self.telegram.errors,
+                'telegram_rejected': self.telegram.rejected,
+            },
+            'telegram_methods': dict(self.telegram.methods),
+        }
+
+
+class ResourceSampler:
+    """
+    Samples server RSS and callbacks table size in background thread.
+    """
+    def __init__(self, pid, database, interval=5) -> None:
+        self.pid = pid
+        self.database = database
+        self.interval = interval
+        self.samples = []
+        self.__started = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        self.__started = time.monotonic()
+        self.sample()
+        self.__thread = threading.Thread(target=self.__run, name='resource-sampler', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        self.__thread.join()
+        self.sample()
+
+    def sample(self):
+        rss = get_process_tree_rss(self.pid) if self.pid is not None else None
+        self.samples.append((round(time.monotonic() - self.__started, 3),
+                             rss / 2 ** 20 if rss is not None else None,
+                             count_rows(self.database, 'callbacks')))
+
+    def results(self):
+        rss = [(seconds, value) for seconds, value, _ in self.samples]
+        rows = [(seconds, value) for seconds, _, value in self.samples]
+        rss_values = [value for _, value in rss if value is not None]
+        return {
+            'rss_start_mb': rss_values[0] if rss_values else None,
+            'rss_end_mb': rss_values[-1] if rss_values else None,
+            'rss_max_mb': max(rss_values) if rss_values else None,
+            'rss_growth_mb_per_hour': get_growth_per_hour(rss),
+            'callbacks_rows_end': rows[-1][1],
+            'callbacks_rows_growth_per_hour': get_growth_per_hour(rows),
+            'samples': self.samples,
+        }
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            self.sample()
+
+
+def start_server(workdir, port, workers, env):
+    """
+    Start gunicorn with the bot app in workdir, wait until it answers.
+    Returns subprocess.Popen.
+    """
+    with open(os.path.join(workdir, 'token.txt'), 'w') as file:
+        file.write('123456:load-test-token')
+    # Bot divides rate limits by WEB_CONCURRENCY, as in Procfile
+    env = {**os.environ, **env, 'WEB_CONCURRENCY': str(workers),
+           'PYTHONPATH': os.pathsep.join(filter(None, [REPOSITORY_DIR, os.environ.get('PYTHONPATH')]))}
+    with open(os.path.join(workdir, 'server.err'), 'w') as errors:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn.app.wsgiapp', 'main:create_app()',
+             '--workers', str(workers), '--threads', '4', '--bind', f'127.0.0.1:{port}'],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=errors
+        )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'Server exited with code {server.returncode}, see {workdir}/server.err')
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/stats', timeout=1).status_code == 200:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'Server is not ready in 30s, see {workdir}/server.err')
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='shikibot-load-')
+    database = os.path.join(workdir, 'callbacks.db')
+    port = get_free_port()
+    with FakeShikimori(latency=args.shiki_latency, error_rate=args.shiki_error_rate) as shikimori, \
+            FakeTelegram(latency=args.telegram_latency, error_rate=args.telegram_error_rate) as telegram:
+        env = {
+            'SHIKI_URL': shikimori.url,
+            'SHIKIBOT_TELEGRAM_API_URL': telegram.api_url,
+            'SHIKIBOT_DATABASE_URL': f'sqlite:///{database}',
+            'SHIKIBOT_LOG_FILE': 'logs-{pid}.log',
+            'SHIKIBOT_STATELESS_CALLBACKS': '1' if args.stateless_callbacks else '0',
+        }
+        if not args.real_limits:
+            # Limits of telegram and shikimori are not what is measured
+            env.update({'SHIKI_RATE': '100000', 'SHIKI_BURST': '100000',
+                        'SHIKIBOT_SEND_RATE': '100000', 'SHIKIBOT_CHAT_RATE': '100000'})
+        server = start_server(workdir, port, args.workers, env)
+        sampler = ResourceSampler(server.pid, database, args.sample_interval)
+        try:
+            sampler.start()
+            test = LoadTest(f'http://127.0.0.1:{port}/bot', telegram, args.rate, args.duration,
+                            args.callback_share, args.miss_share, args.concurrency,
+                            args.reply_timeout)
+            results = test.run()
+            sampler.stop()
+            try:
+                results['server_stats'] = requests.get(f'http://127.0.0.1:{port}/stats', timeout=5).json()
+            except (requests.RequestException, ValueError):
+                results['server_stats'] = None
+        finally:
+            server.terminate()
+            server.wait(30)
+        results['errors']['shikimori_injected'] = shikimori.errors
+        results['shikimori_requests'] = shikimori.requests
+    results['memory'] = sampler.results()
+    results['python'] = platform.python_version()
+    results['workers'] = args.workers
+    results['workdir'] = workdir
+    return results
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description='End-to-end bot server load test')
+    arguments.add_argument('--rate', type=float, default=10, help='updates per second')
+    arguments.add_argument('--duration', type=float, default=60, help='seconds updates are sent')
+    arguments.add_argument('--workers', type=int, default=1, help='gunicorn worker processes')
+    arguments.add_argument('--concurrency', type=int, default=32, help='max POST requests at once')
+    arguments.add_argument('--callback-share', type=float, default=0.3,
+                           help='part of updates which are button clicks')
+    arguments.add_argument('--miss-share', type=float, default=0.2,
+                           help='part of searches for titles which do not exist')
+    arguments.add_argument('--stateless-callbacks', action='store_true',
+                           help='keyboards without callbacks table rows')
+    arguments.add_argument('--telegram-latency', type=float, default=0.05)
+    arguments.add_argument('--telegram-error-rate', type=float, default=0.0,
+                           help='part of send requests answered with 429')
+    arguments.add_argument('--shiki-latency', type=float, default=0.2)
+    arguments.add_argument('--shiki-error-rate', type=float, default=0.0,
+                           help='part of shikimori requests answered with 502')
+    arguments.add_argument('--real-limits', action='store_true',
+                           help='keep bot rate limits for telegram and shikimori')
+    arguments.add_argument('--reply-timeout', type=float, default=10,
+                           help='seconds to wait for replies after the last update')
+    arguments.add_argument('--sample-interval', type=float, default=5,
+                           help='seconds between memory samples')
+    arguments.add_argument('--output', help='file to write json results to')
+    args = arguments.parse_args(argv)
+
+    results = run(args)
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
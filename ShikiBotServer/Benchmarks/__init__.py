@@ -0,0 +1 @@
+from ShikiBotServer.Benchmarks.FakeTelegram import FakeTelegram
@@ -0,0 +1,175 @@
+import os
+import json
+import random
+import logging
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import Queue, Full
+
+
+# Attributes every LogRecord has, the rest came from extra={...}
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats record as one json line:
+    time, level, file, thread, message and fields passed in extra,
+    e.g. logging.info('Title found', extra={'chat_id': 1, 'seconds': 0.2})
+    """
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'file': record.filename,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and name != 'sampled':
+                data[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info))
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only rate part of records logged with extra={'sampled': True}
+    at INFO level or lower. Other records always pass.
+    """
+    def __init__(self, rate=1.0) -> None:
+        super().__init__()
+        self.rate = rate
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not getattr(record, 'sampled', False):
+            return True
+        if random.random() < self.rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler which never blocks: record is dropped if queue is full.
+    Message and traceback are formatted here, the rest in the listener thread.
+    """
+    def __init__(self, queue) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """
+    QueueListener which waits up to stop_timeout seconds for free place
+    in the full queue to put the stop sentinel, so records which are
+    already in the queue are written before stop.
+    If the queue stays full stop() raises queue.Full.
+    """
+    def __init__(self, queue, *handlers, stop_timeout=5) -> None:
+        super().__init__(queue, *handlers)
+        self.stop_timeout = stop_timeout
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel, timeout=self.stop_timeout)
+
+
+class LogQueue:
+    """
+    Logging which doesn't write to disk in the thread that logs:
+    records are put to a queue and written by a background thread
+    as json lines to a rotated file.
+
+    Attributes:
+    - path {str}: log file, '{pid}' in path is replaced with process id,
+      rotation isn't shared between processes, so every server worker
+      should have its own file
+    - max_bytes {int}: file size after which it's rotated
+    - backup_count {int}: number of kept rotated files
+    - level {int}: min level of records
+    - sample_rate {float}: part of sampled info records which is written,
+      records are sampled if logged with extra={'sampled': True}
+    - queue_size {int}: max number of records waiting for the writer,
+      the rest is dropped, so disk stall doesn't block request handling
+
+    How to use:
+        log_queue = LogQueue('logs.log')
+        log_queue.start()
+        logging.info('Title found', extra={'chat_id': 1, 'sampled': True})
+    """
+    def __init__(self, path='logs.log', max_bytes=10 * 1024 * 1024, backup_count=5,
+                 level=logging.INFO, sample_rate=1.0, queue_size=10000) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.level = level
+        self.sampler = SamplingFilter(sample_rate)
+        self.__queue = Queue(maxsize=queue_size)
+        self.__handler = None
+        self.__listener = None
+
+    def start(self):
+        """
+        Replace root logger handlers with the queue handler, start writer thread.
+        """
+        file_handler = RotatingFileHandler(self.path.format(pid=os.getpid()),
+                                           maxBytes=self.max_bytes,
+                                           backupCount=self.backup_count,
+                                           encoding='utf-8',
+                                           delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        self.__handler = DroppingQueueHandler(self.__queue)
+        self.__handler.addFilter(self.sampler)
+        self.__listener = DrainingQueueListener(self.__queue, file_handler)
+
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.__handler)
+        root.setLevel(self.level)
+        self.__listener.start()
+
+    def stop(self):
+        """
+        Write records which are already in the queue and stop writer thread.
+        """
+        if self.__listener is None:
+            return
+        logging.getLogger().removeHandler(self.__handler)
+        try:
+            self.__listener.stop()
+        except Full:
+            # Writer is stuck on disk, records left in the queue are lost
+            self.__listener = None
+            return
+        for handler in self.__listener.handlers:
+            handler.close()
+        self.__listener = None
+
+    def stats(self):
+        return {
+            'queued': self.__queue.qsize(),
+            'dropped': self.__handler.dropped if self.__handler is not None else 0,
+            'sampled_out': self.sampler.sampled_out,
+        }
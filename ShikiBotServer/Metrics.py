@@ -0,0 +1,127 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values, prometheus style.
+
+    Attributes:
+    - buckets {tuple}: upper bounds of buckets in ascending order
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        Returns list of (upper bound, count of values <= bound),
+        last bound is '+Inf'.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, histograms and gauges.
+    render() returns everything in prometheus text format.
+
+    Labels are passed as dict, e.g.:
+        metrics.inc('upstream_responses_total', {'status': 200})
+    """
+    def __init__(self, prefix='shikibot') -> None:
+        self.prefix = prefix
+        self.__counters = {}
+        self.__histograms = {}
+        self.__gauges = {}
+        self.__lock = threading.Lock()
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, self.make_labels(labels))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, self.make_labels(labels))
+        with self.__lock:
+            if key not in self.__histograms:
+                self.__histograms[key] = Histogram()
+            self.__histograms[key].observe(value)
+
+    def gauge(self, name, function, labels=None):
+        """
+        Register gauge, function is called on every render().
+        """
+        with self.__lock:
+            self.__gauges[(name, self.make_labels(labels))] = function
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Observe duration of with-block in stage_seconds histogram.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, {'stage': stage})
+
+    def counter_value(self, name, labels=None):
+        with self.__lock:
+            return self.__counters.get((name, self.make_labels(labels)), 0)
+
+    def render(self):
+        """
+        Returns all metrics in prometheus text format.
+        """
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            histograms = sorted(self.__histograms.items())
+            gauges = sorted(self.__gauges.items())
+
+        lines = []
+        for (name, labels), value in counters:
+            lines.append(f'{self.prefix}_{name}{self.format_labels(labels)} {value}')
+        for (name, labels), function in gauges:
+            lines.append(f'{self.prefix}_{name}{self.format_labels(labels)} {function()}')
+        for (name, labels), histogram in histograms:
+            with self.__lock:
+                buckets = histogram.cumulative_counts()
+                total, count = histogram.sum, histogram.count
+            for bound, bucket_count in buckets:
+                bucket_labels = labels + (('le', str(bound)),)
+                lines.append(f'{self.prefix}_{name}_bucket{self.format_labels(bucket_labels)} {bucket_count}')
+            lines.append(f'{self.prefix}_{name}_sum{self.format_labels(labels)} {total}')
+            lines.append(f'{self.prefix}_{name}_count{self.format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def make_labels(labels):
+        """
+        Make hashable sorted tuple from labels dict.
+        """
+        if not labels:
+            return ()
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
@@ -0,0 +1,217 @@
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from itertools import count
+from telebot.apihelper import ApiTelegramException
+from ShikiParser import RateLimiter
+
+
+class SendQueue:
+    """
+    Sends replies to telegram in background threads with flood limits,
+    so update handlers don't wait for telegram.
+
+    Attributes:
+    - workers {int}: number of sender threads
+    - global_rate {float}: messages per second to all chats
+    - chat_rate {float}: messages per second to one private chat
+    - group_rate {float}: messages per second to one group chat
+    - chat_burst {int}: how many messages can go to one chat at once after idle time
+    - max_retries {int}: how many times message is sent again after 429 answer
+
+    Messages to the same chat are sent one by one in the order they came.
+    On 429 answer chat is paused for retry_after seconds from the answer.
+    latency_hook attribute is called with seconds message waited in the queue,
+    by default does nothing.
+    """
+    # Chats with send times kept after their messages are sent
+    MAX_IDLE_CHATS = 10000
+
+    def __init__(self, workers=4, global_rate=30, chat_rate=1, group_rate=20 / 60,
+                 chat_burst=3, max_retries=3) -> None:
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(rate=global_rate, burst=global_rate)
+        self.latency_hook = lambda seconds: None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.__workers = workers
+        self.__threads = []
+        self.__pending = 0
+        # chat_id -> deque of messages, chat is in __ready heap or is being sent
+        self.__chats = {}
+        # (time chat can send, order, chat_id)
+        self.__ready = []
+        # chat_id -> time when chat rate limit is fully restored
+        self.__full_at = {}
+        self.__order = count()
+        self.__stopping = False
+        self.__condition = threading.Condition()
+
+    def start(self):
+        """
+        Start sender threads.
+        """
+        self.__stopping = False
+        for number in range(self.__workers):
+            thread = threading.Thread(target=self.__work,
+                                      name=f'send-worker-{number}',
+                                      daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Send messages which are already in the queue and stop senders.
+        """
+        with self.__condition:
+            self.__stopping = True
+            self.__condition.notify_all()
+        for thread in self.__threads:
+            thread.join(timeout)
+        self.__threads = []
+
+    def send(self, chat_id, function, *args, **kwargs):
+        """
+        Attributes:
+        - chat_id {int}: chat message goes to, used for per-chat limit
+        - function {callable}: makes telegram request, e.g. bot.send_message
+        - args, kwargs: function arguments
+
+        Returns concurrent.futures.Future with function result.
+        """
+        future = Future()
+        message = [function, args, kwargs, future, time.monotonic(), 0]
+        with self.__condition:
+            messages = self.__chats.get(chat_id)
+            if messages is None:
+                messages = self.__chats[chat_id] = deque()
+                now = time.monotonic()
+                self.__push(chat_id, max(now, self.__get_allowed_at(chat_id, now)))
+            messages.append(message)
+            self.__pending += 1
+            self.__condition.notify()
+        return future
+
+    def stats(self):
+        with self.__condition:
+            return {
+                'workers': self.__workers,
+                'queued': self.__pending,
+                'chats': len(self.__chats),
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+            }
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                chat_id = self.__next_chat()
+                if chat_id is None:
+                    return
+                message = self.__chats[chat_id].popleft()
+            function, args, kwargs, future, queued_at, retries = message
+
+            self.limiter.acquire()
+            self.latency_hook(time.monotonic() - queued_at)
+            retry_after = None
+            try:
+                result = function(*args, **kwargs)
+            except ApiTelegramException as error:
+                if error.error_code == 429 and retries < self.max_retries:
+                    retry_after = self.get_retry_after(error)
+                else:
+                    self.__finish(future, error=error)
+            except Exception as error:
+                self.__finish(future, error=error)
+            else:
+                self.__finish(future, result=result)
+
+            with self.__condition:
+                now = time.monotonic()
+                interval = 1 / self.get_chat_rate(chat_id)
+                full_at = max(self.__full_at.get(chat_id, now), now) + interval
+                self.__full_at[chat_id] = full_at
+                if retry_after is not None:
+                    logging.warning(f'Telegram flood limit for chat {chat_id}, '
+                                    f'retry after {retry_after}s')
+                    message[5] += 1
+                    self.retried += 1
+                    self.__chats[chat_id].appendleft(message)
+                    self.__push(chat_id, now + retry_after)
+                    continue
+                self.__pending -= 1
+                if self.__chats[chat_id]:
+                    self.__push(chat_id, self.__get_allowed_at(chat_id, now))
+                else:
+                    del self.__chats[chat_id]
+                    self.__prune(now)
+                    if self.__stopping and not self.__chats:
+                        # Other senders wait for messages which won't come
+                        self.__condition.notify_all()
+
+    def __next_chat(self):
+        """
+        Wait for chat which can send now and take it from the heap.
+        Returns None if queue is stopped and empty.
+        Called with condition lock held.
+        """
+        while True:
+            now = time.monotonic()
+            if self.__ready and self.__ready[0][0] <= now:
+                return heapq.heappop(self.__ready)[2]
+            if self.__stopping and not self.__chats:
+                return None
+            self.__condition.wait(self.__ready[0][0] - now if self.__ready else None)
+
+    def __finish(self, future, result=None, error=None):
+        with self.__condition:
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+        if error is None:
+            future.set_result(result)
+        else:
+            logging.error(f'Telegram request failed: {error}')
+            future.set_exception(error)
+
+    def __push(self, chat_id, ready_at):
+        heapq.heappush(self.__ready, (ready_at, next(self.__order), chat_id))
+        self.__condition.notify()
+
+    def __get_allowed_at(self, chat_id, now):
+        """
+        Time when next message can be sent to chat, burst is allowed after idle time.
+        """
+        full_at = self.__full_at.get(chat_id, now)
+        return full_at - (self.chat_burst - 1) / self.get_chat_rate(chat_id)
+
+    def __prune(self, now):
+        if len(self.__full_at) > self.MAX_IDLE_CHATS:
+            for chat_id in [chat_id for chat_id, full_at in self.__full_at.items()
+                            if full_at <= now and chat_id not in self.__chats]:
+                del self.__full_at[chat_id]
+
+    def get_chat_rate(self, chat_id):
+        """
+        Group chats have negative ids and lower limit.
+        """
+        if chat_id is not None and chat_id < 0:
+            return self.group_rate
+        return self.chat_rate
+
+    @staticmethod
+    def get_retry_after(error):
+        """
+        Returns seconds from 429 answer parameters, 1 if there are none.
+        """
+        parameters = error.result_json.get('parameters') or {}
+        return parameters.get('retry_after', 1)
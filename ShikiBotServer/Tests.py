@@ -0,0 +1,423 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from queue import Queue
+from types import SimpleNamespace
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+from ShikiBotServer import TitleIndex, SendQueue, UpdateDispatcher, LogQueue, Metrics
+from ShikiBotServer.LogQueue import JsonFormatter, SamplingFilter, DroppingQueueHandler
+from ShikiBotServer.LogQueue import DrainingQueueListener
+from ShikiBotDB import CallbackProxy
+from ShikiParser import Title, TitleNotFoundError
+import main
+
+
+def make_title(name, title_id=1, kind='anime'):
+    return Title(kind,
+                 title_id,
+                 f'https://shikimori.one/{kind}s/z{title_id}-title',
+                 name,
+                 8.0,
+                 f'{name} synopsis',
+                 ['Драма'],
+                 f'https://shikimori.one/poster-{title_id}.jpg')
+
+
+def make_update(update_id, chat_id):
+    return types.Update.de_json(json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': 'аниме Claymore',
+        },
+    }))
+
+
+def make_api_error(error_code, retry_after=None):
+    result_json = {'ok': False, 'error_code': error_code, 'description': 'Test error'}
+    if retry_after is not None:
+        result_json['parameters'] = {'retry_after': retry_after}
+    return ApiTelegramException('sendMessage', None, result_json)
+
+
+class TestTitleIndex:
+    def test_prefix_search(self):
+        """
+        Test if title is found by prefix of any word of any name part.
+        """
+        index = TitleIndex()
+        index.add(make_title('Созданный в Бездне / Made in Abyss', 34599))
+        index.add(make_title('Клеймор / Claymore', 1818))
+        index.add(make_title('Берсерк / Berserk', 2, kind='manga'))
+        assert [title.id for title in index.search('abys')] == [34599]
+        assert [title.id for title in index.search('В БЕЗД')] == [34599]
+        assert [title.id for title in index.search('клей')] == [1818]
+        index.add(make_title('Ёлки', 5))
+        assert [title.id for title in index.search('ЕЛК')] == [5]
+        assert index.search('berserk', kind='anime') == []
+        assert [title.id for title in index.search('berserk', kind='manga')] == [2]
+        assert index.search('') == []
+
+    def test_max_titles(self):
+        """
+        Test if least recently added title is evicted with its index texts.
+        """
+        index = TitleIndex(max_titles=2)
+        index.add(make_title('Claymore', 1))
+        index.add(make_title('Gintama', 2))
+        index.add(make_title('Claymore', 1))
+        index.add(make_title('Berserk', 3))
+        assert len(index) == 2
+        assert index.search('gintama') == []
+        assert [title.id for title in index.search('claymore')] == [1]
+        assert [title.id for title in index.search('berserk')] == [3]
+
+    def test_title_updated(self):
+        """
+        Test if indexed title gets new data and is found by its new name only.
+        """
+        index = TitleIndex()
+        index.add(make_title('Claymore', 1818))
+        index.add(Title('anime', 1818, 'https://shikimori.one/animes/1818', 'Клеймор / Claymore',
+                        8.5, '', [], 'https://shikimori.one/new-poster.jpg'))
+        assert len(index) == 1
+        found, = index.search('claymore')
+        assert (found.name, found.score, found.image_url) == \
+            ('Клеймор / Claymore', 8.5, 'https://shikimori.one/new-poster.jpg')
+        assert [title.id for title in index.search('клей')] == [1818]
+        index.add(make_title('Claymore 2', 1818))
+        assert [title.name for title in index.search('claymore')] == ['Claymore 2']
+        assert index.search('клей') == []
+
+    def test_snapshot(self, tmp_path):
+        """
+        Test if index loaded from snapshot finds the same titles.
+        """
+        path = str(tmp_path / 'title_index.json')
+        index = TitleIndex()
+        index.add(make_title('Созданный в Бездне / Made in Abyss', 34599))
+        index.add(make_title('Берсерк / Berserk', 2, kind='manga'))
+        index.save(path)
+
+        loaded = TitleIndex()
+        assert loaded.load(path) == 2
+        assert loaded.load(str(tmp_path / 'missing.json')) == 0
+        found = loaded.search('бездне')
+        assert [title.to_list() for title in found] == \
+            [['anime', 34599, 'Созданный в Бездне / Made in Abyss', 8.0,
+              'https://shikimori.one/poster-34599.jpg']]
+        assert [title.kind for title in loaded.search('berserk')] == ['manga']
+
+    def test_snapshot_merged_between_processes(self, tmp_path):
+        """
+        Test if snapshot keeps titles saved by other worker index.
+        """
+        path = str(tmp_path / 'title_index.json')
+        first, second = TitleIndex(max_titles=3), TitleIndex(max_titles=3)
+        first.add(make_title('Claymore', 1))
+        first.add(make_title('Gintama', 2))
+        second.add(make_title('Berserk', 3))
+        second.add(make_title('Claymore: Updated', 1))
+        first.save(path)
+        second.save(path)
+        first.save(path)
+
+        loaded = TitleIndex()
+        assert loaded.load(path) == 3
+        assert [title.id for title in loaded.search('berserk')] == [3]
+        assert [title.id for title in loaded.search('gintama')] == [2]
+        assert [title.name for title in loaded.search('claymore')] == ['Claymore']
+
+        second.add(make_title('Made in Abyss', 4))
+        second.save(path)
+        assert len(TitleIndex.read(path)) == 3
+        assert [title[1] for title in TitleIndex.read(path)] == [3, 1, 4]
+
+
+class TestSendPoster:
+    class FakeBot:
+        """
+        Rejects sending by file_id with 400, sends by url.
+        """
+        def __init__(self) -> None:
+            self.photos = []
+
+        def send_photo(self, chat_id, photo, **kwargs):
+            self.photos.append(photo)
+            if not photo.startswith('https://'):
+                raise make_api_error(400)
+            return SimpleNamespace(photo=[SimpleNamespace(file_id='small'),
+                                          SimpleNamespace(file_id='new-file-id')])
+
+    def test_stale_file_id(self, database, monkeypatch):
+        """
+        Test if poster is sent by url when saved file_id isn't accepted,
+        and file_id of the new upload is saved.
+        """
+        fake_bot = self.FakeBot()
+        monkeypatch.setattr(main, 'bot', fake_bot)
+        title = make_title('Claymore', 1818)
+        with CallbackProxy() as callback_proxy:
+            callback_proxy.set_poster_file_id(title.image_url, 'stale-file-id')
+
+        main.send_poster(1, title, None)
+        assert fake_bot.photos == ['stale-file-id', title.image_url]
+        with CallbackProxy() as callback_proxy:
+            assert callback_proxy.get_poster_file_id(title.image_url) == 'new-file-id'
+
+        main.send_poster(1, title, None)
+        assert fake_bot.photos[2:] == ['new-file-id', title.image_url]
+
+
+class TestSearchTitles:
+    def test_markdown_escaped(self, monkeypatch):
+        """
+        Test if user text and title names can't break MarkdownV2 of batch answer.
+        """
+        replies = []
+        found = [TitleNotFoundError('foo_bar'), TitleNotFoundError('x*y'), make_title('[Oshi no Ko]', 52034)]
+        monkeypatch.setattr(main, 'parser', SimpleNamespace(search_many=lambda *args: found))
+        monkeypatch.setattr(main, 'title_index', TitleIndex())
+        monkeypatch.setattr(main, 'bot', SimpleNamespace(send_message=None))
+        monkeypatch.setattr(main, 'reply', lambda chat_id, stage, function, *args, **kwargs:
+                            replies.append((args, kwargs)))
+
+        main.search_titles(1, ['foo_bar', 'x*y', '[Oshi no Ko]'], True)
+        (chat_id, text), kwargs = replies[0]
+        assert kwargs['parse_mode'] == 'MarkdownV2'
+        assert text.split('\n\n') == [
+            f'1\\. foo\\_bar ❌\n{main.ErrorMessage.NOT_FOUND.value}',
+            f'2\\. x\\*y ❌\n{main.ErrorMessage.NOT_FOUND.value}',
+            '3\\. [\\[Oshi no Ko\\]](https://shikimori.one/animes/z52034-title) ✅\n8\\.0 ⭐',
+        ]
+
+
+class TestSendQueue:
+    def test_chat_order(self):
+        """
+        Test if messages to one chat are sent in the order they came
+        while several senders work.
+        """
+        queue = SendQueue(workers=4, global_rate=10 ** 6, chat_rate=10 ** 6, chat_burst=10 ** 6)
+        sent = {1: [], 2: []}
+
+        def send(chat_id, number):
+            time.sleep(0.001 * (number % 3))
+            sent[chat_id].append(number)
+
+        queue.start()
+        futures = [queue.send(chat_id, send, chat_id, number)
+                   for number in range(30) for chat_id in (1, 2)]
+        for future in futures:
+            future.result(timeout=5)
+        queue.stop()
+        assert sent == {1: list(range(30)), 2: list(range(30))}
+        assert queue.stats()['sent'] == 60
+
+    def test_retry_after_429(self):
+        """
+        Test if message is sent again after 429 answer,
+        and fails when retries are over.
+        """
+        queue = SendQueue(workers=2, global_rate=10 ** 6, chat_rate=10 ** 6, max_retries=1)
+        answers = iter([make_api_error(429, retry_after=0), 'sent',
+                        make_api_error(429, retry_after=0), make_api_error(429, retry_after=0)])
+
+        def send():
+            answer = next(answers)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        queue.start()
+        assert queue.send(1, send).result(timeout=5) == 'sent'
+        failed = queue.send(1, send)
+        assert failed.exception(timeout=5).error_code == 429
+        queue.stop()
+        stats = queue.stats()
+        assert (stats['sent'], stats['retried'], stats['failed']) == (1, 2, 1)
+
+
+    def test_stop_while_sending(self):
+        """
+        Test if stop waits for the message being sent and returns.
+        """
+        queue = SendQueue(workers=4)
+        queue.start()
+        future = queue.send(1, time.sleep, 0.05)
+        time.sleep(0.01)
+        stopping = threading.Thread(target=queue.stop, daemon=True)
+        stopping.start()
+        stopping.join(5)
+        assert not stopping.is_alive()
+        assert future.done()
+
+
+class TestUpdateDispatcher:
+    def test_chat_worker(self):
+        """
+        Test if updates from one chat are processed by one worker in order.
+        """
+        handled = []
+
+        def handler(updates):
+            for update in updates:
+                handled.append((update.message.chat.id, update.update_id,
+                                threading.current_thread().name))
+
+        dispatcher = UpdateDispatcher(handler, workers=4)
+        dispatcher.start()
+        for update_id in range(40):
+            assert dispatcher.dispatch(make_update(update_id, chat_id=update_id % 5))
+        dispatcher.stop()
+
+        assert len(handled) == 40
+        for chat_id in range(5):
+            chat_updates = [(update_id, thread) for chat, update_id, thread in handled if chat == chat_id]
+            assert [update_id for update_id, _ in chat_updates] == list(range(chat_id, 40, 5))
+            assert len({thread for _, thread in chat_updates}) == 1
+
+    def test_full_queue(self):
+        """
+        Test if update is dropped when worker queue stays full.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def handler(updates):
+            started.set()
+            release.wait(5)
+
+        dispatcher = UpdateDispatcher(handler, workers=1, queue_size=1, put_timeout=0.01)
+        dispatcher.start()
+        assert dispatcher.dispatch(make_update(1, chat_id=1))
+        assert started.wait(5)
+        assert dispatcher.dispatch(make_update(2, chat_id=1))
+        assert not dispatcher.dispatch(make_update(3, chat_id=1))
+        release.set()
+        dispatcher.stop()
+        stats = dispatcher.stats()
+        assert (stats['processed'], stats['dropped']) == (2, 1)
+
+
+def make_record(message, level=logging.INFO, exc_info=None, **extra):
+    record = logging.LogRecord('test', level, 'Tests.py', 1, message, (), exc_info)
+    for name, value in extra.items():
+        setattr(record, name, value)
+    return record
+
+
+class TestLogQueue:
+    def test_json_format(self):
+        """
+        Test if extra fields and traceback are written to json line.
+        """
+        try:
+            raise ValueError('broken title')
+        except ValueError:
+            record = make_record('Title failed', logging.ERROR, exc_info=sys.exc_info(),
+                                 chat_id=1, sampled=True)
+        data = json.loads(JsonFormatter().format(record))
+        assert (data['level'], data['message'], data['chat_id']) == ('ERROR', 'Title failed', 1)
+        assert 'sampled' not in data
+        assert 'ValueError: broken title' in data['exception']
+
+    def test_sampling(self):
+        """
+        Test if only sampled info records are filtered out.
+        """
+        sampler = SamplingFilter(rate=0)
+        assert not sampler.filter(make_record('Title found', sampled=True))
+        assert sampler.filter(make_record('Title found'))
+        assert sampler.filter(make_record('Title failed', logging.WARNING, sampled=True))
+        assert sampler.sampled_out == 1
+
+    def test_full_queue_dropped(self):
+        handler = DroppingQueueHandler(Queue(maxsize=1))
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+        assert handler.dropped == 1
+        assert handler.queue.get_nowait().msg == 'first'
+
+    def test_stop_with_full_queue(self):
+        """
+        Test if records in the full queue are written before stop.
+        """
+        written, release = [], threading.Event()
+
+        class SlowHandler(logging.Handler):
+            def emit(self, record):
+                release.wait(5)
+                written.append(record.msg)
+
+        queue = Queue(maxsize=2)
+        listener = DrainingQueueListener(queue, SlowHandler())
+        listener.start()
+        for message in ('first', 'second', 'third'):
+            queue.put(make_record(message))
+        threading.Timer(0.1, release.set).start()
+        listener.stop()
+        assert written == ['first', 'second', 'third']
+
+    def test_written_to_file(self, tmp_path):
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        log_queue = LogQueue(str(tmp_path / 'logs-{pid}.log'))
+        try:
+            log_queue.start()
+            logging.info('Title found', extra={'chat_id': 1})
+        finally:
+            log_queue.stop()
+            for handler in handlers:
+                root.addHandler(handler)
+            root.setLevel(level)
+        path = tmp_path / f'logs-{os.getpid()}.log'
+        data = json.loads(path.read_text(encoding='utf-8'))
+        assert (data['message'], data['chat_id']) == ('Title found', 1)
+
+
+class TestMetrics:
+    def test_render(self):
+        """
+        Test prometheus text of counter with labels, cumulative histogram and gauge.
+        """
+        metrics = Metrics()
+        metrics.inc('searches_total')
+        metrics.inc('upstream_responses_total', {'status': 200}, value=2)
+        metrics.inc('upstream_responses_total', {'status': 200})
+        sizes = iter([1, 2])
+        metrics.gauge('title_cache_size', lambda: next(sizes))
+        for seconds in (0.005, 0.3, 20):
+            metrics.observe('stage_seconds', seconds, {'stage': 'search_fetch'})
+
+        lines = metrics.render().splitlines()
+        assert 'shikibot_searches_total 1' in lines
+        assert 'shikibot_upstream_responses_total{status="200"} 3' in lines
+        assert 'shikibot_title_cache_size 1' in lines
+        assert 'shikibot_stage_seconds_bucket{stage="search_fetch",le="0.005"} 1' in lines
+        assert 'shikibot_stage_seconds_bucket{stage="search_fetch",le="0.25"} 1' in lines
+        assert 'shikibot_stage_seconds_bucket{stage="search_fetch",le="0.5"} 2' in lines
+        assert 'shikibot_stage_seconds_bucket{stage="search_fetch",le="10"} 2' in lines
+        assert 'shikibot_stage_seconds_bucket{stage="search_fetch",le="+Inf"} 3' in lines
+        assert 'shikibot_stage_seconds_count{stage="search_fetch"} 3' in lines
+        assert 'shikibot_title_cache_size 2' in metrics.render().splitlines()
+
+    def test_timer(self):
+        metrics = Metrics()
+        with metrics.timer('db_read_poster'):
+            time.sleep(0.01)
+        try:
+            with metrics.timer('db_write_poster'):
+                raise ValueError
+        except ValueError:
+            pass
+        lines = metrics.render().splitlines()
+        assert 'shikibot_stage_seconds_count{stage="db_read_poster"} 1' in lines
+        assert 'shikibot_stage_seconds_count{stage="db_write_poster"} 1' in lines
+        assert 'shikibot_stage_seconds_bucket{stage="db_read_poster",le="0.005"} 0' in lines
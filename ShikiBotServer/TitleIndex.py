@@ -0,0 +1,196 @@
+import os
+import json
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from ShikiParser import LocalTitleIndex, lock_file
+
+
+class IndexedTitle:
+    """
+    Title data kept in the index, only what inline answer needs.
+    """
+    __slots__ = ('kind', 'id', 'name', 'score', 'image_url')
+
+    def __init__(self, kind, id, name, score, image_url) -> None:
+        self.kind = kind
+        self.id = id
+        self.name = name
+        self.score = score
+        self.image_url = image_url
+
+    def to_list(self):
+        return [self.kind, self.id, self.name, self.score, self.image_url]
+
+
+class TitleIndex:
+    """
+    In-memory prefix index of titles which bot has already found.
+    Used for inline query suggestions without requests to shikimori.
+
+    Attributes:
+    - max_titles {int}: max number of titles in index,
+      least recently added/found title is evicted when limit is reached
+
+    Every name part ('Клеймор / Claymore' -> 'клеймор', 'claymore')
+    is indexed from every word, so 'abyss' finds 'Made in Abyss'.
+    Names are normalized the same way as in LocalTitleIndex.
+    Index is kept as sorted list of (normalized text, title key),
+    search is a binary search of the prefix.
+    Object is thread-safe.
+    """
+    def __init__(self, max_titles=10000) -> None:
+        self.max_titles = max_titles
+        self.__titles = OrderedDict()
+        self.__keys = []
+        self.__lock = threading.Lock()
+        self.__autosave_stop = threading.Event()
+        self.__autosave_thread = None
+
+    @staticmethod
+    def get_index_texts(name):
+        """
+        Returns set of texts which title is found by:
+        every name part from every word.
+        Example:
+        In: 'Созданный в Бездне / Made in Abyss'
+        Out: {'созданный в бездне', 'в бездне', 'бездне', 'made in abyss', 'in abyss', 'abyss'}
+        """
+        texts = set()
+        for part in name.split(' / '):
+            words = LocalTitleIndex.normalize(part).split()
+            for start in range(len(words)):
+                texts.add(' '.join(words[start:]))
+        return texts
+
+    def add(self, title):
+        """
+        Add title (any object with kind, id, name, score and image_url).
+        If it's already indexed its data is replaced and it's moved
+        to the end of eviction queue.
+        """
+        key = (title.kind, title.id)
+        indexed = IndexedTitle(title.kind, title.id, title.name, title.score, title.image_url)
+        with self.__lock:
+            old = self.__titles.get(key)
+            if old is not None and old.name == title.name:
+                self.__titles[key] = indexed
+                self.__titles.move_to_end(key)
+                return
+            if old is not None:
+                self.__remove(key)
+            self.__titles[key] = indexed
+            for text in self.get_index_texts(title.name):
+                insort(self.__keys, (text, key))
+            while len(self.__titles) > self.max_titles:
+                self.__remove(next(iter(self.__titles)))
+
+    def search(self, prefix, kind=None, limit=10):
+        """
+        Returns list of IndexedTitle which names start with prefix.
+        If kind ('anime' or 'manga') given, only titles of this kind are returned.
+        """
+        prefix = LocalTitleIndex.normalize(prefix)
+        found = OrderedDict()
+        if not prefix:
+            return []
+        with self.__lock:
+            position = bisect_left(self.__keys, (prefix,))
+            while position < len(self.__keys) and len(found) < limit:
+                text, key = self.__keys[position]
+                if not text.startswith(prefix):
+                    break
+                if kind is None or key[0] == kind:
+                    found[key] = self.__titles[key]
+                position += 1
+        return list(found.values())
+
+    def save(self, path):
+        """
+        Write index snapshot to json file.
+        Every server worker has its own index, so titles already in the file
+        are kept: titles of this index are added to them as the most recent,
+        and the least recent ones which don't fit into max_titles are dropped.
+        File is replaced at once, so broken snapshot is never left.
+        """
+        with self.__lock:
+            titles = [title.to_list() for title in self.__titles.values()]
+        with lock_file(path):
+            merged = OrderedDict(((kind, title_id), [kind, title_id, *rest])
+                                 for kind, title_id, *rest in self.read(path))
+            for title in titles:
+                key = (title[0], title[1])
+                merged.pop(key, None)
+                merged[key] = title
+            # Every server worker process writes its own temporary file
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(list(merged.values())[-self.max_titles:], file,
+                          ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_path, path)
+
+    def load(self, path):
+        """
+        Add titles from snapshot file, if file doesn't exist does nothing.
+        Returns number of loaded titles.
+        """
+        with lock_file(path):
+            titles = self.read(path)
+        for title in titles:
+            self.add(IndexedTitle(*title))
+        return len(titles)
+
+    @staticmethod
+    def read(path):
+        """
+        Returns list of titles from snapshot file as lists,
+        empty if there is no file or it's broken.
+        """
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, encoding='utf-8') as file:
+                return [list(title) for title in json.load(file)]
+        except (OSError, ValueError, TypeError):
+            logging.exception('Title index snapshot is not loaded')
+            return []
+
+    def start_autosave(self, path, interval=300):
+        """
+        Save snapshot every interval seconds in background thread.
+        """
+        self.__autosave_stop.clear()
+        self.__autosave_thread = threading.Thread(target=self.__autosave,
+                                                  args=(path, interval),
+                                                  name='title-index-autosave',
+                                                  daemon=True)
+        self.__autosave_thread.start()
+
+    def stop_autosave(self, path=None):
+        """
+        Stop background saving, if path given saves the last snapshot.
+        """
+        self.__autosave_stop.set()
+        if self.__autosave_thread is not None:
+            self.__autosave_thread.join()
+            self.__autosave_thread = None
+        if path is not None:
+            self.save(path)
+
+    def __autosave(self, path, interval):
+        while not self.__autosave_stop.wait(interval):
+            try:
+                self.save(path)
+            except OSError:
+                logging.exception('Title index snapshot failed')
+
+    def __remove(self, key):
+        title = self.__titles.pop(key)
+        for text in self.get_index_texts(title.name):
+            position = bisect_left(self.__keys, (text, key))
+            if position < len(self.__keys) and self.__keys[position] == (text, key):
+                del self.__keys[position]
+
+    def __len__(self):
+        return len(self.__titles)
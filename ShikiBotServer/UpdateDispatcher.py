@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from queue import Queue, Full
+
+
+class UpdateDispatcher:
+    """
+    Processes telegram updates in background worker threads,
+    so webhook request returns without waiting for the handlers.
+
+    Attributes:
+    - handler {callable}: takes list of updates, e.g. bot.process_new_updates
+    - workers {int}: number of worker threads
+    - queue_size {int}: max number of updates waiting in one worker queue
+    - put_timeout {float}: seconds to wait for free place in a full queue,
+      after that update is dropped
+
+    Updates from the same chat always go to the same worker,
+    so they are processed in the order they came.
+    """
+    def __init__(self, handler, workers=4, queue_size=100, put_timeout=1.0) -> None:
+        self.handler = handler
+        self.put_timeout = put_timeout
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.__queues = [Queue(maxsize=queue_size) for _ in range(workers)]
+        self.__threads = []
+        self.__busy = 0
+        self.__busy_seconds = 0.0
+        self.__started_at = None
+        self.__lock = threading.Lock()
+
+    def start(self):
+        """
+        Start worker threads.
+        """
+        self.__started_at = time.monotonic()
+        for number, queue in enumerate(self.__queues):
+            thread = threading.Thread(target=self.__work,
+                                      args=(queue,),
+                                      name=f'update-worker-{number}',
+                                      daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Process updates which are already in queues and stop workers.
+        """
+        for queue in self.__queues:
+            queue.put(None)
+        for thread in self.__threads:
+            thread.join(timeout)
+        self.__threads = []
+
+    def dispatch(self, update):
+        """
+        Put update to its chat worker queue.
+        Returns False if queue stayed full and update was dropped.
+        """
+        chat_id = self.get_chat_id(update)
+        queue = self.__queues[hash(chat_id) % len(self.__queues)]
+        try:
+            queue.put(update, timeout=self.put_timeout)
+        except Full:
+            with self.__lock:
+                self.dropped += 1
+            logging.warning(f'Update queue is full, update {update.update_id} dropped')
+            return False
+        return True
+
+    def stats(self):
+        """
+        Returns dict with queue depth and worker utilization.
+        """
+        with self.__lock:
+            busy = self.__busy
+            busy_seconds = self.__busy_seconds
+            processed, dropped, errors = self.processed, self.dropped, self.errors
+        workers = len(self.__queues)
+        uptime = time.monotonic() - self.__started_at if self.__started_at else 0
+        return {
+            'workers': workers,
+            'busy_workers': busy,
+            'utilization': busy_seconds / (uptime * workers) if uptime else 0.0,
+            'queue_depth': sum(queue.qsize() for queue in self.__queues),
+            'queue_depth_per_worker': [queue.qsize() for queue in self.__queues],
+            'processed': processed,
+            'dropped': dropped,
+            'errors': errors,
+        }
+
+    def __work(self, queue):
+        while True:
+            update = queue.get()
+            if update is None:
+                return
+
+            started = time.monotonic()
+            with self.__lock:
+                self.__busy += 1
+            try:
+                self.handler([update])
+            except Exception:
+                with self.__lock:
+                    self.errors += 1
+                logging.exception(f'Update {update.update_id} processing failed')
+            finally:
+                with self.__lock:
+                    self.__busy -= 1
+                    self.__busy_seconds += time.monotonic() - started
+                    self.processed += 1
+
+    @staticmethod
+    def get_chat_id(update):
+        """
+        Returns id of the chat update came from.
+        If update has no chat returns None.
+        """
+        if update.message:
+            return update.message.chat.id
+        if update.edited_message:
+            return update.edited_message.chat.id
+        if update.callback_query:
+            if update.callback_query.message:
+                return update.callback_query.message.chat.id
+            return update.callback_query.from_user.id
+        if update.inline_query:
+            return update.inline_query.from_user.id
+        return None
@@ -0,0 +1,5 @@
+from ShikiBotServer.UpdateDispatcher import UpdateDispatcher
+from ShikiBotServer.Metrics import Metrics
+from ShikiBotServer.TitleIndex import TitleIndex
+from ShikiBotServer.SendQueue import SendQueue
+from ShikiBotServer.LogQueue import LogQueue
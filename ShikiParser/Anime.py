@@ -2,9 +2,10 @@ from ShikiParser.Manga import Manga
 
 
 class Anime(Manga):
+    KIND = 'anime'
 
-    def __init__(self, title_url: str, title_html=None) -> None:
-        super().__init__(title_url, title_html)
+    def __init__(self, title_url: str, title_html=None, client=None) -> None:
+        super().__init__(title_url, title_html, client)
 
     def screenshots(self):
         pass
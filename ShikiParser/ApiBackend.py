@@ -0,0 +1,96 @@
+import re
+from urllib.parse import quote_plus
+from ShikiParser.Title import Title
+from ShikiParser.Manga import Manga
+from ShikiParser.ParserErrors import TitleNotFoundError, UpstreamError
+from ShikiParser.Steps import Fetch, Call
+
+
+class ApiBackend:
+    """
+    Gets title data from shikimori json API:
+    /api/animes?search= for search, /api/animes/:id for title data.
+    No html is downloaded or parsed.
+
+    Attributes:
+    - client {HttpClient|AsyncHttpClient}: client for requests to shikimori
+    - main_url {str}: site url
+
+    search and get_title are steps generators, like in HtmlBackend.
+    """
+    # [character=123]Name[/character], [i]text[/i], etc.
+    BBCODE_TAG = re.compile(r'\[/?[a-z_]+(?:=[^\]]*)?\]')
+    # [[Name]] wiki links
+    WIKI_LINK = re.compile(r'\[\[([^\]]*)\]\]')
+
+    def __init__(self, client, main_url) -> None:
+        self.client = client
+        self.main_url = main_url
+
+    def search(self, title: str, is_anime):
+        """
+        Search title on shikimori.
+        Returns Title record or raises TitleNotFoundError.
+        """
+        kind = 'anime' if is_anime else 'manga'
+        search_url = self.main_url + f'/api/{kind}s?search={quote_plus(title.lower())}&limit=1'
+        if is_anime:
+            # Same order as html search
+            search_url += '&order=aired_on'
+
+        found = yield from self.get_json(search_url, 'search_fetch')
+        if not found:
+            raise TitleNotFoundError(title)
+        return (yield from self.get_title(kind, found[0]['id']))
+
+    def get_title(self, kind: str, title_id: int):
+        """
+        Returns Title record with given kind and id
+        or raises TitleNotFoundError.
+        """
+        data = yield from self.get_json(self.main_url + f'/api/{kind}s/{title_id}', 'title_fetch')
+        if data is None:
+            raise TitleNotFoundError(f'{kind} {title_id}')
+        return (yield Call(self.make_title, (kind, data), 'title_parse'))
+
+    def get_json(self, url, stage=None):
+        """
+        Returns decoded json or None if server answered 404.
+        Raises UpstreamError on other error answers.
+        """
+        page = yield Fetch(url, stage)
+        if page.status_code == 404:
+            return None
+        if page.status_code >= 400:
+            raise UpstreamError(url, page.status_code)
+        return page.json()
+
+    def make_title(self, kind, data):
+        """
+        Make Title record from API title json.
+        """
+        name = data['name']
+        if data.get('russian'):
+            name = f"{data['russian']} / {data['name']}"
+        image = (data.get('image') or {}).get('original')
+        return Title(kind,
+                     data['id'],
+                     self.main_url + data['url'],
+                     name,
+                     data.get('score'),
+                     self.clean_description(data.get('description')),
+                     [genre['russian'] for genre in data.get('genres') or []],
+                     self.main_url + image if image else Manga.DEFAULT_IMAGE_URL)
+
+    @classmethod
+    def clean_description(cls, description):
+        """
+        Remove shikimori bbcode from description.
+        Example:
+        In: '[character=1]Гатс[/character] странствует'
+        Out: 'Гатс странствует'
+        """
+        if not description:
+            return ''
+        description = cls.WIKI_LINK.sub(r'\1', description)
+        return cls.BBCODE_TAG.sub('', description)
@@ -0,0 +1,130 @@
+import asyncio
+import aiohttp
+from random import choice
+from ShikiParser.HttpClient import HttpClient
+from ShikiParser.RateLimiter import RateLimiter
+from ShikiParser.ParserErrors import UpstreamError
+from ShikiParser.Steps import Page
+
+
+class AsyncHttpClient:
+    """
+    Asyncio HTTP client for requests to shikimori, works like HttpClient.
+
+    Attributes:
+    - connect_timeout {float}: seconds to wait for connection
+    - read_timeout {float}: seconds to wait for response data
+    - retries {int}: how many times to retry failed connection or 502/504 answer
+    - pool_size {int}: max kept-alive connections
+    - limiter {RateLimiter}: limiter for all requests, can be shared with HttpClient,
+      if None RateLimiter with default settings is created
+    - max_wait {float}: max seconds request can wait for the rate limiter,
+      after that UpstreamThrottledError is raised
+    - response_cache {ResponseCache}: stored pages which are revalidated
+      instead of downloaded again, if None every page is downloaded
+
+    Session is created on first request, inside the running event loop,
+    so client should be used from one loop. Call close() when work is done.
+    """
+    RETRY_STATUSES = (502, 504)
+    BACKOFF_FACTOR = 0.3
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, pool_size=10,
+                 limiter=None, max_wait=5, response_cache=None) -> None:
+        self.timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.pool_size = pool_size
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.max_wait = max_wait
+        self.response_cache = response_cache
+        self.user_agents = HttpClient.load_user_agents(HttpClient.USER_AGENTS_FILE)
+        self.session = None
+        self.__hooks = []
+
+    async def get(self, url, headers=None):
+        """
+        Attributes:
+        - url {str}: page url
+        - headers {dict}: request headers, if None random User-Agent is used
+
+        Returns Page.
+        Waits for the rate limiter, on 429/503 answer pauses all requests
+        and tries again while it fits into max_wait.
+        Raises UpstreamThrottledError if request can't be sent in max_wait,
+        UpstreamError if shikimori answered with other server error
+        or connection failed after retries.
+        If page is in the response cache and is not modified, stored page is returned.
+        """
+        if headers is None:
+            headers = self.random_headers()
+        cached = self.response_cache.get(url) if self.response_cache is not None else None
+        if cached is not None:
+            headers = {**headers, **cached[1]}
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while True:
+            wait = self.limiter.reserve(timeout=deadline - loop.time())
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                page, retry_after, response_headers = await self.__send(url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                raise UpstreamError(url, None) from error
+            if page.status_code in HttpClient.THROTTLE_STATUSES:
+                self.limiter.backoff(retry_after)
+                continue
+            if page.status_code >= 500:
+                raise UpstreamError(url, page.status_code)
+            self.limiter.reset_backoff()
+            if self.response_cache is None:
+                return page
+            if page.status_code == 304 and cached is not None:
+                self.response_cache.revalidated(url, cached[0])
+                return cached[0]
+            self.response_cache.put(url, page, response_headers)
+            return page
+
+    async def __send(self, url, headers):
+        """
+        Send request, retry connection errors and 502/504 answers.
+        Returns (Page, seconds from Retry-After header or None, response headers).
+        """
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+        for attempt in range(self.retries + 1):
+            is_last = attempt == self.retries
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    page = Page(str(response.url), response.status, await response.text())
+                    retry_after = HttpClient.get_retry_after(response)
+                    response_headers = response.headers
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if is_last:
+                    raise
+            else:
+                for hook in self.__hooks:
+                    hook(page)
+                if page.status_code not in self.RETRY_STATUSES or is_last:
+                    return page, retry_after, response_headers
+            await asyncio.sleep(self.BACKOFF_FACTOR * 2 ** attempt)
+
+    def add_response_hook(self, hook):
+        """
+        Attributes:
+        - hook {callable}: called with every Page, e.g. to count upstream status codes
+        """
+        self.__hooks.append(hook)
+
+    def random_headers(self):
+        return {'User-Agent': self.random_user_agent()}
+
+    def random_user_agent(self):
+        return choice(self.user_agents)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
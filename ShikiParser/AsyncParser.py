@@ -0,0 +1,105 @@
+import asyncio
+from contextlib import nullcontext
+from ShikiParser.Parser import ShikiParser
+from ShikiParser.AsyncClient import AsyncHttpClient
+from ShikiParser.HttpClient import get_client_settings
+from ShikiParser.SingleFlight import AsyncSingleFlight
+from ShikiParser.Steps import Fetch
+
+
+class AsyncShikiParser(ShikiParser):
+    """
+    Asyncio version of ShikiParser, returns the same Title records.
+
+    How to use:
+        parser = AsyncShikiParser()
+        title = await parser.search_title('Made in Abyss')
+        await parser.close()
+
+    Lookup steps, cache and local index are the same as in ShikiParser.
+    Requests go through AsyncHttpClient, html/json parsing and local index
+    queries run in executor, so event loop is not blocked by them.
+    """
+    def __init__(self, cache=None, client=None, main_url=None, backend=None, index=None,
+                 executor=None) -> None:
+        """
+        Attributes are the same as in ShikiParser, except:
+        - client {AsyncHttpClient}: if None client with settings from
+          environment variables is created
+        - executor {concurrent.futures.Executor}: executor for parsing,
+          if None default executor of the event loop is used
+        """
+        client = client if client is not None else AsyncHttpClient(**get_client_settings())
+        super().__init__(cache, client, main_url, backend, index)
+        self.flights = AsyncSingleFlight()
+        self.executor = executor
+
+    async def search_title(self, title: str, is_anime=True):
+        """
+        Same as ShikiParser.search_title.
+        """
+        cached = self.get_cached(title, is_anime)
+        if cached is not None:
+            return cached
+
+        key = ('search',) + self.cache.make_key(title, is_anime)
+        return await self.flights.do(key, lambda: self.run(self.search_steps(title, is_anime)))
+
+    async def refresh_title(self, title: str, is_anime=True):
+        """
+        Same as ShikiParser.refresh_title.
+        """
+        key = ('refresh',) + self.cache.make_key(title, is_anime)
+        return await self.flights.do(key, lambda: self.run(self.search_steps(title, is_anime, force=True)))
+
+    async def search_many(self, titles, is_anime=True, max_workers=4):
+        """
+        Same as ShikiParser.search_many,
+        max_workers is max number of titles searched at the same time.
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def search(title):
+            async with semaphore:
+                try:
+                    return await self.search_title(title, is_anime)
+                except Exception as error:
+                    return error
+
+        return list(await asyncio.gather(*[search(title) for title in titles]))
+
+    async def get_title(self, kind: str, title_id: int):
+        """
+        Same as ShikiParser.get_title.
+        """
+        cached = self.cache.get_by_id(kind, title_id)
+        if cached is not None:
+            return cached
+        return await self.flights.do(('title', kind, title_id),
+                                     lambda: self.run(self.title_steps(kind, title_id)))
+
+    async def run(self, steps):
+        """
+        Run lookup steps: Fetch steps with client, Call steps in executor.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            step = next(steps)
+            while True:
+                try:
+                    with self.timer(step.stage) if step.stage else nullcontext():
+                        if isinstance(step, Fetch):
+                            result = await self.client.get(step.url)
+                        else:
+                            result = await loop.run_in_executor(self.executor, step.run)
+                except Exception as error:
+                    step = steps.throw(error)
+                else:
+                    step = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            steps.close()
+
+    async def close(self):
+        await self.client.close()
@@ -0,0 +1,146 @@
+"""
+Offline parser benchmark, runs against FakeShikimori with saved pages.
+
+How to use (from repository root):
+    python -m ShikiParser.Benchmarks.Bench --output bench.json
+    python -m ShikiParser.Benchmarks.Bench --baseline bench.json --tolerance 0.25
+    python -m ShikiParser.Benchmarks.Bench --backend api
+
+Results are written as json: throughput (runs per second) and
+p50/p99 latency in milliseconds for every case.
+If baseline is given, exit code is 1 when p50 or p99 of any case
+is slower than baseline by more than tolerance.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+from ShikiParser import ShikiParser, TitleCache, Manga, TitleNotFoundError
+from ShikiParser import HttpClient, RateLimiter
+from ShikiParser.Benchmarks.FakeShikimori import FakeShikimori
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest-rank percentile of already sorted values.
+    """
+    index = max(0, int(round(percent / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def measure(function, iterations, warmup=5):
+    """
+    Run function warmup + iterations times.
+    Returns dict with timing results.
+    """
+    for _ in range(warmup):
+        function()
+
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        run_started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - run_started)
+    total = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'throughput': iterations / total,
+        'mean_ms': total / iterations * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+    }
+
+
+def search(parser, title, is_anime=True):
+    def run():
+        try:
+            parser.search_title(title, is_anime)
+        except TitleNotFoundError:
+            pass
+    return run
+
+
+def get_cases(fake, backend='html'):
+    """
+    Returns dict: case name -> function to measure.
+    """
+    # Cache and rate limit are disabled, every search goes to the server at once
+    client = HttpClient(limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6))
+    parser = ShikiParser(TitleCache(max_size=0), client, fake.url, backend)
+    huge_url = fake.title_url('mangas', 2)
+    huge_html = fake.page('title_huge_synopsis.html').decode('utf-8')
+    genres_url = fake.title_url('animes', 918)
+    genres_html = fake.page('title_many_genres.html').decode('utf-8')
+    huge_manga = Manga(huge_url, huge_html)
+
+    return {
+        'search_title:single_hit': search(parser, 'made in abyss'),
+        'search_title:redirect': search(parser, 'claymore'),
+        'search_title:not_found': search(parser, 'asfjkdgalr'),
+        'search_title:huge_synopsis': search(parser, 'berserk', is_anime=False),
+        'search_title:many_genres': search(parser, 'gintama'),
+        'manga:huge_synopsis': lambda: Manga(huge_url, huge_html),
+        'manga:many_genres': lambda: Manga(genres_url, genres_html),
+        'synopsis:huge_synopsis': huge_manga.synopsis,
+    }
+
+
+def run(iterations, backend='html'):
+    with FakeShikimori() as fake:
+        results = {name: measure(function, iterations)
+                   for name, function in get_cases(fake, backend).items()}
+    return {
+        'python': platform.python_version(),
+        'backend': backend,
+        'cases': results,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Returns list of messages about cases slower than baseline.
+    """
+    regressions = []
+    for name, base in baseline['cases'].items():
+        current = results['cases'].get(name)
+        if current is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f'{name} {metric}: {current[metric]:.3f} > '
+                                   f'{base[metric]:.3f} (+{tolerance:.0%})')
+    return regressions
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description='Offline ShikiParser benchmark')
+    arguments.add_argument('--iterations', type=int, default=200)
+    arguments.add_argument('--backend', choices=sorted(ShikiParser.BACKENDS), default='html')
+    arguments.add_argument('--output', help='file to write json results to')
+    arguments.add_argument('--baseline', help='json results to compare with')
+    arguments.add_argument('--tolerance', type=float, default=0.25,
+                           help='allowed slowdown against baseline, 0.25 is 25%%')
+    args = arguments.parse_args(argv)
+
+    results = run(args.iterations, args.backend)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+class FakeShikimori:
+    """
+    Local stand-in for shikimori.one which serves saved pages.
+    Used by offline tests and benchmarks.
+
+    How to use:
+        with FakeShikimori() as fake:
+            parser = ShikiParser(main_url=fake.url)
+
+    Known searches:
+    - anime 'made in abyss': search page with results
+    - anime 'claymore', 'gintama' and manga 'berserk': redirect to the title page
+    - anything else: search page without results
+
+    Json API (/api/animes?search=, /api/animes/:id) serves the same titles.
+
+    Set throttled to N to answer next N requests with 429 and Retry-After: 0,
+    forbidden to N to answer next N requests with 403 anti-bot page.
+    Set latency to delay every answer by seconds and error_rate to answer
+    that part of requests with 502, such answers are counted in errors.
+    Pages have ETag, request with the same If-None-Match gets 304 without body,
+    such answers are counted in not_modified.
+    """
+    FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+    # (kind, id): (url slug, fixture file)
+    TITLES = {
+        ('animes', 34599): ('z34599-made-in-abyss', 'title_made_in_abyss.html'),
+        ('animes', 1818): ('z1818-claymore', 'title_claymore.html'),
+        ('animes', 918): ('z918-gintama', 'title_many_genres.html'),
+        ('mangas', 2): ('2-berserk', 'title_huge_synopsis.html'),
+    }
+    # (kind, search): fixture file or (kind, id) to redirect to
+    SEARCHES = {
+        ('animes', 'made in abyss'): 'search_made_in_abyss.html',
+        ('animes', 'claymore'): ('animes', 1818),
+        ('animes', 'gintama'): ('animes', 918),
+        ('mangas', 'berserk'): ('mangas', 2),
+    }
+
+    # (kind, search): found title id
+    API_SEARCHES = {
+        ('animes', 'made in abyss'): 34599,
+        ('animes', 'claymore'): 1818,
+        ('animes', 'gintama'): 918,
+        ('mangas', 'berserk'): 2,
+    }
+    # Fields of title json which are returned in search results
+    API_SEARCH_FIELDS = ('id', 'name', 'russian', 'image', 'url', 'kind', 'score',
+                         'status', 'episodes', 'episodes_aired', 'volumes', 'chapters',
+                         'aired_on', 'released_on')
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0) -> None:
+        self.requests = 0
+        self.throttled = 0
+        self.forbidden = 0
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = 0
+        self.not_modified = 0
+        self.__pages = {}
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.__server.daemon_threads = True
+        self.url = f'http://{host}:{self.__server.server_address[1]}'
+        self.__thread = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def page(self, fixture):
+        """
+        Returns fixture html with links pointing to this server.
+        """
+        if fixture not in self.__pages:
+            with open(os.path.join(self.FIXTURES_DIR, fixture), encoding='utf-8') as file:
+                self.__pages[fixture] = file.read().replace('%BASE_URL%', self.url).encode('utf-8')
+        return self.__pages[fixture]
+
+    def api_title(self, kind, title_id):
+        """
+        Returns title json as dict or None if there is no such title.
+        """
+        path = os.path.join(self.FIXTURES_DIR, 'api', f'{kind}_{title_id}.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+
+    def title_url(self, kind, title_id):
+        slug = self.TITLES[(kind, title_id)][0]
+        return f'{self.url}/{kind}/{slug}'
+
+    def handle(self, request_path, request_headers=None):
+        """
+        Returns (status, headers, body) for request path with query.
+        """
+        with self.__lock:
+            self.requests += 1
+            if self.throttled > 0:
+                self.throttled -= 1
+                return 429, {'Retry-After': '0'}, b'Retry later'
+            if self.forbidden > 0:
+                self.forbidden -= 1
+                return 403, {}, b'<html><body><h1>Access denied</h1></body></html>'
+            is_error = self.error_rate > 0 and random.random() < self.error_rate
+            if is_error:
+                self.errors += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if is_error:
+            return 502, {}, b'Bad gateway'
+        url = urlsplit(request_path)
+        status, headers, body = self.route(url.path, parse_qs(url.query))
+        if status == 200:
+            headers['ETag'] = f'"{hashlib.md5(body).hexdigest()}"'
+            if (request_headers or {}).get('If-None-Match') == headers['ETag']:
+                with self.__lock:
+                    self.not_modified += 1
+                return 304, {'ETag': headers['ETag']}, b''
+        return status, headers, body
+
+    def route(self, path, query):
+        """
+        Returns (status, headers, body) for url path and parsed query.
+        """
+        parts = path.strip('/').split('/')
+        if parts[0] == 'api':
+            return self.route_api(parts[1:], query)
+
+        kind = parts[0]
+        search = query.get('search')
+        if kind in ('animes', 'mangas') and search is not None:
+            found = self.SEARCHES.get((kind, ' '.join(search[0].lower().split())))
+            if isinstance(found, tuple):
+                return 302, {'Location': self.title_url(*found)}, b''
+            return 200, {}, self.page(found or 'search_not_found.html')
+
+        if kind in ('animes', 'mangas') and len(parts) == 2:
+            for (title_kind, title_id), (slug, fixture) in self.TITLES.items():
+                if title_kind != kind:
+                    continue
+                if parts[1] == slug:
+                    return 200, {}, self.page(fixture)
+                if parts[1] == str(title_id):
+                    return 302, {'Location': self.title_url(kind, title_id)}, b''
+        return 404, {}, self.page('not_found_page.html')
+
+    def route_api(self, parts, query):
+        """
+        Returns (status, headers, body) for json API request.
+        """
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        kind = parts[0] if parts else None
+        if kind in ('animes', 'mangas') and len(parts) == 1:
+            search = ' '.join(query.get('search', [''])[0].lower().split())
+            found = []
+            title_id = self.API_SEARCHES.get((kind, search))
+            if title_id is not None:
+                title = self.api_title(kind, title_id)
+                found.append({key: title[key] for key in self.API_SEARCH_FIELDS if key in title})
+            return 200, headers, json.dumps(found, ensure_ascii=False).encode('utf-8')
+
+        if kind in ('animes', 'mangas') and len(parts) == 2 and parts[1].isdigit():
+            title = self.api_title(kind, int(parts[1]))
+            if title is not None:
+                return 200, headers, json.dumps(title, ensure_ascii=False).encode('utf-8')
+        return 404, headers, b'{"message":"Not found","code":404}'
+
+    def __make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, headers, body = fake.handle(self.path, self.headers)
+                self.send_response(status)
+                self.send_header('Content-Type', headers.pop('Content-Type', 'text/html; charset=utf-8'))
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
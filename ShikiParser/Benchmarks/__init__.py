@@ -0,0 +1 @@
+from ShikiParser.Benchmarks.FakeShikimori import FakeShikimori
\ No newline at end of file
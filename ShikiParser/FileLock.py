@@ -0,0 +1,27 @@
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # No file locks on windows, processes can lose writes of each other there
+    fcntl = None
+
+
+@contextmanager
+def lock_file(path):
+    """
+    Lock file against other processes while it's read and written.
+    Lock is taken on separate path.lock file, so the file itself
+    can be replaced with os.replace.
+    How to use:
+        with lock_file('popularity.json'):
+            ...
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f'{path}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,138 @@
+from bs4 import BeautifulSoup, SoupStrainer
+from ShikiParser.Manga import Manga
+from ShikiParser.Anime import Anime
+from ShikiParser.ParserErrors import TitleNotFoundError, UpstreamError
+from ShikiParser.Steps import Fetch, Call
+
+
+def is_search_result_tag(name, attrs):
+    """
+    SoupStrainer filter for search page.
+    Keeps only title links and h1, which is used to detect
+    redirect to the title page.
+    """
+    if name == 'h1':
+        return True
+    return name == 'a' and 'title' in (attrs.get('class') or '').split()
+
+
+class HtmlBackend:
+    """
+    Gets title data by parsing shikimori html pages:
+    search page, then the first found title page.
+
+    Attributes:
+    - client {HttpClient|AsyncHttpClient}: client whose user-agents are used
+    - main_url {str}: site url
+
+    search and get_title are steps generators (see ShikiParser.Steps),
+    so the same code is used by sync and async parsers.
+    """
+    # Parse only needed tags, the rest of the page is skipped
+    SEARCH_STRAINER = SoupStrainer(is_search_result_tag)
+
+    def __init__(self, client, main_url) -> None:
+        self.client = client
+        self.main_url = main_url
+
+    def search(self, title: str, is_anime):
+        """
+        Search title on shikimori.
+        Returns Title record or raises TitleNotFoundError.
+        """
+        search_pattern = title.lower().replace(' ', '+')
+        search_url = self.get_search_url(search_pattern, is_anime)
+
+        page = yield from self.get_page(search_url, title, 'search_fetch')
+        title_url, is_already_title = yield Call(self.parse_search, (page.text, title),
+                                                 'search_parse')
+
+        if (title_url is None) and not is_already_title:
+            raise TitleNotFoundError(title)
+        elif is_already_title:
+            # Shikimori redirected search to the title page
+            return (yield from self.make_title(page.url, page.text, is_anime))
+        return (yield from self.make_title(title_url, None, is_anime))
+
+    def get_page(self, url, title, stage=None):
+        """
+        Returns downloaded page.
+        Raises TitleNotFoundError(title) if server answered 404,
+        UpstreamError on other error answers, e.g. 403 of anti-bot page,
+        so error page isn't parsed as title or cached as not found.
+        """
+        page = yield Fetch(url, stage)
+        if page.status_code == 404:
+            raise TitleNotFoundError(title)
+        if page.status_code >= 400:
+            raise UpstreamError(url, page.status_code)
+        return page
+
+    def parse_search(self, search_html, title):
+        """
+        Returns (url of the first found title or None,
+        True if search page is already the title page).
+        """
+        soup = BeautifulSoup(search_html, 'html.parser', parse_only=self.SEARCH_STRAINER)
+        title_tag_a = soup.find('a', {'class': 'title'})
+        is_already_title = self.is_already_title(soup, title)
+        title_url = title_tag_a['href'] if title_tag_a is not None else None
+        soup.decompose()
+        return title_url, is_already_title
+
+    def get_title(self, kind: str, title_id: int):
+        """
+        Returns Title record with given kind and id
+        or raises TitleNotFoundError.
+        """
+        return (yield from self.make_title(self.get_title_url(kind, title_id), None,
+                                           kind == 'anime'))
+
+    def make_title(self, title_url, title_html, is_anime):
+        """
+        Parse title page, if title_html is None page is downloaded.
+        Returns Title record.
+        """
+        if title_html is None:
+            page = yield from self.get_page(title_url, title_url, 'title_fetch')
+            # Url after redirects is the full title url
+            title_url, title_html = page.url, page.text
+        return (yield Call(self.parse_title, (title_url, title_html, is_anime), 'title_parse'))
+
+    def parse_title(self, title_url, title_html, is_anime):
+        if is_anime:
+            return Anime(title_url, title_html, self.client).to_title()
+        return Manga(title_url, title_html, self.client).to_title()
+
+    def get_title_url(self, kind, title_id):
+        """
+        Get title page url by kind ('anime' or 'manga') and shikimori id.
+        Shikimori redirects it to the full title url.
+        """
+        return self.main_url + f'/{kind}s/{title_id}'
+
+    def get_search_url(self, search_pattern, is_anime):
+        """
+        Attributes:
+        - search_pattern {str}: pattern of title name in form like "word+word+word...".
+        - is_anime {bool}: if True than 'anime', else 'manga'.
+
+        Get the search url for anime or manga.
+        """
+        if is_anime:
+            return self.main_url + f'/animes/order-by/aired_on?search={search_pattern}'
+        return self.main_url + f'/mangas?search={search_pattern}'
+
+    @staticmethod
+    def is_already_title(soup: BeautifulSoup, title_name: str):
+        """
+        Attributes:
+        - soup {BeatifulSoup}: prepeared soup with title_html
+        - title_name {str}: name of the title
+
+        Return True if title_name in 'h1.text' else False
+        """
+        h1 = soup.find('h1')
+        if h1 is None:
+            return False
+        return h1.text.lower().find(title_name.lower()) != -1
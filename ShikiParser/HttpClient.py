@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+import requests
+from random import choice
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+from ShikiParser.RateLimiter import RateLimiter
+from ShikiParser.ResponseCache import ResponseCache
+from ShikiParser.ParserErrors import UpstreamError
+from ShikiParser.Steps import Page
+
+
+class HttpClient:
+    """
+    Shared HTTP client for requests to shikimori.
+
+    Attributes:
+    - connect_timeout {float}: seconds to wait for connection
+    - read_timeout {float}: seconds to wait for response data
+    - retries {int}: how many times to retry failed connection or read
+    - pool_size {int}: max kept-alive connections per host
+    - limiter {RateLimiter}: limiter for all requests,
+      if None RateLimiter with default settings is created
+    - max_wait {float}: max seconds request can wait for the rate limiter,
+      after that UpstreamThrottledError is raised
+    - response_cache {ResponseCache}: stored pages which are revalidated
+      instead of downloaded again, if None every page is downloaded
+
+    Connections are kept alive in a pool, so the same object
+    should be used for all requests. Object is thread-safe.
+    Pages are requested compressed: gzip/deflate, and br if brotli is installed.
+    User-agents are read from file only once, when client is created.
+    """
+    USER_AGENTS_FILE = os.path.join(os.path.dirname(__file__), 'user-agents.json')
+    # Answers after which requests are paused
+    THROTTLE_STATUSES = (429, 503)
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, pool_size=10,
+                 limiter=None, max_wait=5, response_cache=None) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.max_wait = max_wait
+        self.response_cache = response_cache
+        self.user_agents = self.load_user_agents(self.USER_AGENTS_FILE)
+
+        retry = Retry(total=retries,
+                      connect=retries,
+                      read=retries,
+                      status=retries,
+                      backoff_factor=0.3,
+                      status_forcelist=(502, 504),
+                      allowed_methods=frozenset(['GET']),
+                      # 429/503 are handled by the rate limiter for all requests
+                      respect_retry_after_header=False,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session = requests.Session()
+        # urllib3 adds br only when it can decode it
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, headers=None):
+        """
+        Attributes:
+        - url {str}: page url
+        - headers {dict}: request headers, if None random User-Agent is used
+
+        Returns requests.Response object.
+        Waits for the rate limiter, on 429/503 answer pauses all requests
+        and tries again while it fits into max_wait.
+        Raises UpstreamThrottledError if request can't be sent in max_wait,
+        UpstreamError if shikimori answered with other server error
+        or connection failed after retries.
+        If page is in the response cache and is not modified,
+        response is made from the stored page.
+        """
+        if headers is None:
+            headers = self.random_headers()
+        cached = self.response_cache.get(url) if self.response_cache is not None else None
+        if cached is not None:
+            headers = {**headers, **cached[1]}
+
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            self.limiter.acquire(timeout=deadline - time.monotonic())
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as error:
+                raise UpstreamError(url, None) from error
+            if response.status_code in self.THROTTLE_STATUSES:
+                self.limiter.backoff(self.get_retry_after(response))
+                continue
+            if response.status_code >= 500:
+                raise UpstreamError(url, response.status_code)
+            self.limiter.reset_backoff()
+            if self.response_cache is not None:
+                return self.__use_cache(url, response, cached)
+            return response
+
+    def __use_cache(self, url, response, cached):
+        """
+        Returns stored page on 304 answer, stores new page otherwise.
+        """
+        if response.status_code == 304 and cached is not None:
+            page = cached[0]
+            self.response_cache.revalidated(url, page)
+            stored = requests.Response()
+            stored.status_code = page.status_code
+            stored.url = page.url
+            stored.headers = response.headers
+            stored.request = response.request
+            stored.encoding = 'utf-8'
+            stored._content = page.text.encode('utf-8')
+            return stored
+        self.response_cache.put(url, Page(response.url, response.status_code, response.text),
+                                response.headers)
+        return response
+
+    def add_response_hook(self, hook):
+        """
+        Attributes:
+        - hook {callable}: called with every requests.Response,
+          e.g. to count upstream status codes
+        """
+        def response_hook(response, *args, **kwargs):
+            hook(response)
+
+        self.session.hooks['response'].append(response_hook)
+
+    def random_headers(self):
+        """
+        Returns headers dict with random User-Agent.
+        """
+        return {'User-Agent': self.random_user_agent()}
+
+    def random_user_agent(self):
+        return choice(self.user_agents)
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def get_retry_after(response):
+        """
+        Returns seconds from Retry-After header or None if there is no header.
+        Header can be number of seconds or http date.
+        """
+        retry_after = response.headers.get('Retry-After')
+        if not retry_after:
+            return None
+        if retry_after.isdigit():
+            return int(retry_after)
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def load_user_agents(path):
+        """
+        Read user-agents list from json file.
+        """
+        with open(path) as file:
+            return [agent['user-agent'] for agent in json.load(file)]
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """
+    Returns HttpClient shared by all parser objects.
+    Client is created on first call, timeouts and retries
+    are taken from environment variables.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient(**get_client_settings())
+        return _default_client
+
+
+def get_client_settings(processes=1):
+    """
+    Returns client arguments from environment variables,
+    used for both HttpClient and AsyncHttpClient.
+    SHIKI_RATE and SHIKI_BURST are limits of all processes together,
+    every one of processes gets its part of them.
+    """
+    return {
+        'connect_timeout': float(os.environ.get('SHIKI_CONNECT_TIMEOUT', 3.05)),
+        'read_timeout': float(os.environ.get('SHIKI_READ_TIMEOUT', 10)),
+        'retries': int(os.environ.get('SHIKI_RETRIES', 2)),
+        'pool_size': int(os.environ.get('SHIKI_POOL_SIZE', 10)),
+        'limiter': RateLimiter(
+            rate=float(os.environ.get('SHIKI_RATE', 5)) / processes,
+            burst=max(1, int(os.environ.get('SHIKI_BURST', 10)) // processes)
+        ),
+        'max_wait': float(os.environ.get('SHIKI_MAX_WAIT', 5)),
+        # Response cache is off if file is not set
+        'response_cache': ResponseCache(
+            path=os.environ['SHIKI_RESPONSE_CACHE'],
+            max_bytes=int(os.environ.get('SHIKI_RESPONSE_CACHE_MB', 64)) * 1024 * 1024
+        ) if os.environ.get('SHIKI_RESPONSE_CACHE') else None,
+    }
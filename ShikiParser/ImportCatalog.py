@@ -0,0 +1,45 @@
+"""
+Bulk import of titles catalog dump to LocalTitleIndex.
+
+How to use (from repository root):
+    python -m ShikiParser.ImportCatalog animes.json --kind anime --database titles.db
+
+Dump is json list (or json object per line) of shikimori API titles,
+only 'id', 'name' and 'russian' fields are used.
+"""
+import sys
+import json
+import time
+import argparse
+from ShikiParser import LocalTitleIndex
+
+
+def read_catalog(path):
+    """
+    Read json list or json lines file with titles.
+    """
+    with open(path, encoding='utf-8') as file:
+        text = file.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description='Import titles catalog to LocalTitleIndex')
+    arguments.add_argument('catalog', help='json file with shikimori API titles')
+    arguments.add_argument('--kind', choices=['anime', 'manga'], required=True)
+    arguments.add_argument('--database', default='titles.db', help='index SQLite file')
+    args = arguments.parse_args(argv)
+
+    index = LocalTitleIndex(args.database)
+    started = time.perf_counter()
+    count = index.add_names(read_catalog(args.catalog), args.kind)
+    print(f'Imported {count} titles in {time.perf_counter() - started:.2f}s, '
+          f'{len(index)} titles in index')
+    index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
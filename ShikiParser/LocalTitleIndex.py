@@ -0,0 +1,198 @@
+import re
+import time
+import sqlite3
+import threading
+from ShikiParser.Title import Title
+
+
+class LocalTitleIndex:
+    """
+    Maps russian and english title names to shikimori ids.
+    Parser looks here before search on the site.
+
+    Attributes:
+    - path {str}: SQLite database file, ':memory:' for index without file
+    - max_age {int|float}: seconds stored title data is fresh,
+      older titles are requested again by id
+
+    Name matches only if normalized query is equal to one of title names
+    (or to earlier query which found this title) and no other title
+    of the same kind has this name.
+    Names of all catalog titles can be imported with ShikiParser.ImportCatalog.
+    Object is thread-safe.
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS titles ('
+        '  rowid INTEGER PRIMARY KEY,'
+        '  kind TEXT NOT NULL,'
+        '  id INTEGER NOT NULL,'
+        '  names TEXT NOT NULL,'
+        '  data BLOB,'
+        '  updated REAL,'
+        '  UNIQUE (kind, id))',
+        "CREATE VIRTUAL TABLE IF NOT EXISTS title_names USING fts5(names, tokenize='unicode61')",
+    )
+    # Rows checked for exact name match
+    CANDIDATES = 20
+
+    def __init__(self, path=':memory:', max_age=86400) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.lookups = 0
+        self.hits = 0
+        self.fresh_hits = 0
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__lock, self.__connection:
+            if path != ':memory:':
+                self.__connection.execute('PRAGMA journal_mode=WAL')
+            for statement in self.SCHEMA:
+                self.__connection.execute(statement)
+
+    @staticmethod
+    def normalize(text):
+        """
+        Lower case, 'ё' -> 'е', only letters and digits separated by one space.
+        """
+        text = text.lower().replace('ё', 'е')
+        return ' '.join(re.sub(r'[^\w]+', ' ', text).split())
+
+    @classmethod
+    def get_names(cls, name):
+        """
+        Returns normalized name parts.
+        Example:
+        In: 'Клеймор / Claymore'
+        Out: ['клеймор', 'claymore']
+        """
+        names = [cls.normalize(part) for part in name.split(' / ')]
+        return [name for name in names if name]
+
+    def find(self, title: str, is_anime=True):
+        """
+        Returns (title id, Title) for confident match,
+        Title is None if stored data is older than max_age or there is no data.
+        If there is no confident match returns None.
+        """
+        query = self.normalize(title)
+        kind = 'anime' if is_anime else 'manga'
+        if not query:
+            return None
+        match = ' '.join(f'"{word}"' for word in query.split())
+
+        with self.__lock:
+            self.lookups += 1
+            rows = self.__connection.execute(
+                'SELECT titles.id, titles.names, titles.data, titles.updated FROM title_names '
+                'JOIN titles ON titles.rowid = title_names.rowid '
+                'WHERE title_names MATCH ? AND titles.kind = ? '
+                'ORDER BY title_names.rank LIMIT ?',
+                (match, kind, self.CANDIDATES)
+            ).fetchall()
+            found = [row for row in rows if query in row[1].split('\n')]
+            if len(found) != 1:
+                return None
+            self.hits += 1
+            title_id, _, data, updated = found[0]
+            if data is None or updated + self.max_age <= time.time():
+                return title_id, None
+            self.fresh_hits += 1
+            return title_id, Title.from_bytes(data)
+
+    def get(self, kind: str, title_id: int):
+        """
+        Returns stored Title if it's fresh, else None.
+        """
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT data, updated FROM titles WHERE kind = ? AND id = ?', (kind, title_id)
+            ).fetchone()
+        if row is None or row[0] is None or row[1] + self.max_age <= time.time():
+            return None
+        return Title.from_bytes(row[0])
+
+    def add(self, title, alias=None):
+        """
+        Attributes:
+        - title {Title}: found title, its names and data are stored
+        - alias {str}: query which found this title, stored as one more name
+        """
+        names = self.get_names(title.name)
+        if alias:
+            names.append(self.normalize(alias))
+        with self.__lock, self.__connection:
+            self.__upsert(title.kind, title.id, names, title.to_bytes(), time.time())
+
+    def add_names(self, records, kind):
+        """
+        Bulk add titles without data, only names.
+        Attributes:
+        - records {iterable}: shikimori API titles, dicts with 'id', 'name' and 'russian'
+        - kind {str}: 'anime' or 'manga'
+        Returns number of added records.
+        """
+        count = 0
+        with self.__lock, self.__connection:
+            for record in records:
+                names = self.get_names(' / '.join(
+                    name for name in (record.get('russian'), record.get('name')) if name
+                ))
+                if names:
+                    self.__upsert(kind, int(record['id']), names, None, None)
+                    count += 1
+        return count
+
+    def remove(self, kind: str, title_id: int):
+        with self.__lock, self.__connection:
+            row = self.__connection.execute(
+                'SELECT rowid FROM titles WHERE kind = ? AND id = ?', (kind, title_id)
+            ).fetchone()
+            if row is not None:
+                self.__connection.execute('DELETE FROM title_names WHERE rowid = ?', row)
+                self.__connection.execute('DELETE FROM titles WHERE rowid = ?', row)
+
+    def stats(self):
+        return {
+            'titles': len(self),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'fresh_hits': self.fresh_hits,
+            'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+        }
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __upsert(self, kind, title_id, names, data, updated):
+        """
+        Insert or update title row, old names are kept.
+        Title data is not replaced with None.
+        """
+        row = self.__connection.execute(
+            'SELECT rowid, names FROM titles WHERE kind = ? AND id = ?', (kind, title_id)
+        ).fetchone()
+        if row is None:
+            names_text = '\n'.join(dict.fromkeys(names))
+            rowid = self.__connection.execute(
+                'INSERT INTO titles (kind, id, names, data, updated) VALUES (?, ?, ?, ?, ?)',
+                (kind, title_id, names_text, data, updated)
+            ).lastrowid
+        else:
+            rowid, old_names = row
+            names_text = '\n'.join(dict.fromkeys(old_names.split('\n') + names))
+            self.__connection.execute(
+                'UPDATE titles SET names = ?, data = COALESCE(?, data), '
+                'updated = COALESCE(?, updated) WHERE rowid = ?',
+                (names_text, data, updated, rowid)
+            )
+            if names_text == old_names:
+                return
+            self.__connection.execute('DELETE FROM title_names WHERE rowid = ?', (rowid,))
+        self.__connection.execute('INSERT INTO title_names (rowid, names) VALUES (?, ?)',
+                                  (rowid, names_text))
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM titles').fetchone()[0]
+
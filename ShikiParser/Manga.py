@@ -1,27 +1,51 @@
-import requests
-import json
-from random import randint
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from ShikiParser.HttpClient import get_default_client
+from ShikiParser.Title import Title
+from ShikiParser.ParserErrors import TitleNotFoundError
+
+
+def is_title_data_tag(name, attrs):
+    """
+    SoupStrainer filter for title page.
+    Keeps only tags with title data: h1, img, score, genres and synopsis.
+    """
+    if name in ('h1', 'img'):
+        return True
+    classes = (attrs.get('class') or '').split()
+    if name == 'div':
+        return 'score-value' in classes or 'b-text_with_paragraphs' in classes
+    return name == 'span' and 'genre-ru' in classes
 
 
 class Manga:
-    USER_AGENTS_FILE = 'ShikiParser/user-agents.json'
+    KIND = 'manga'
+    DEFAULT_IMAGE_URL = r'https://www.google.com/url?sa=i&url=https%3A%2F%2F4pda.ru%2Fforum%2Findex.php%3Fshowtopic%3D903970&psig=AOvVaw2K6hTbV197cQPE07_kcg3_&ust=1615993649391000&source=images&cd=vfe&ved=0CAIQjRxqFwoTCICu0M2Lte8CFQAAAAAdAAAAABAI'
+    # Parse only needed tags, the rest of the page is skipped
+    TITLE_STRAINER = SoupStrainer(is_title_data_tag)
 
-    def __init__(self, title_url: str, title_html=None) -> None:
+    def __init__(self, title_url: str, title_html=None, client=None) -> None:
+        self.client = client if client is not None else get_default_client()
         self.HEADERS = {'User-Agent': ''}
         self.change_user_agent()
+        self.url = title_url
         if title_html is None:
-            self.url = title_url
-            self.__html = requests.get(title_url, headers=self.HEADERS).text
-        else:
-            self.__html = title_html
-
-        self.__soup = BeautifulSoup(self.__html, 'html.parser')
-        self.__name = self.__soup.find('h1').text
-        self.image_url = self.__soup.find('img')
-        self.score = self.__soup.find('div', {'class': 'score-value'})
-        self.genres = self.__soup.find_all('span', class_='genre-ru')
-        
+            response = self.client.get(title_url, headers=self.HEADERS)
+            # Url after redirects is the full title url
+            self.url, title_html = response.url, response.text
+
+        # All data is taken at once, so neither html nor soup is kept
+        soup = BeautifulSoup(title_html, 'html.parser', parse_only=self.TITLE_STRAINER)
+        name = soup.find('h1')
+        if name is None:
+            raise TitleNotFoundError(title_url)
+        self.__name = name.text
+        self.image_url = soup.find('img')
+        self.score = soup.find('div', {'class': 'score-value'})
+        self.genres = soup.find_all('span', class_='genre-ru')
+        synopsis = soup.find('div', {'class': 'b-text_with_paragraphs'})
+        self.__synopsis = synopsis.text if synopsis else ''
+        soup.decompose()
+
     @property
     def name(self):
         return self.__name
@@ -62,27 +86,34 @@ class Manga:
         Set the image by given <img> tag
         If givent html is None set to default img
         """
-        self.__image_url = r'https://www.google.com/url?sa=i&url=https%3A%2F%2F4pda.ru%2Fforum%2Findex.php%3Fshowtopic%3D903970&psig=AOvVaw2K6hTbV197cQPE07_kcg3_&ust=1615993649391000&source=images&cd=vfe&ved=0CAIQjRxqFwoTCICu0M2Lte8CFQAAAAAdAAAAABAI'
+        self.__image_url = self.DEFAULT_IMAGE_URL
         if image_html:
             self.__image_url = image_html['src']
 
 
     def synopsis(self):
         """
-        Search title synopsis.
+        Returns title synopsis.
         If not found returns an empty string
         """
-        synopsis = self.__soup.find('div', {'class': 'b-text_with_paragraphs'})
-        if synopsis:
-            return synopsis.text
-        return ''
+        return self.__synopsis
 
 
+    def to_title(self):
+        """
+        Returns Title record with data of this title.
+        """
+        return Title(self.KIND,
+                     Title.parse_id(self.url),
+                     self.url,
+                     self.name,
+                     self.score,
+                     self.synopsis(),
+                     self.genres,
+                     self.image_url)
+
     def change_user_agent(self):
         """
         Choose different user-agent.
         """
-        with open(self.USER_AGENTS_FILE) as file:
-            user_agents = json.load(file)
-            random_max = len(user_agents)-1
-            self.HEADERS['User-Agent'] = user_agents[randint(0, random_max)]['user-agent']
+        self.HEADERS['User-Agent'] = self.client.random_user_agent()
@@ -1,22 +1,58 @@
-import requests
+import os
 import re
-import json
-from random import randint
-from ShikiParser.Manga import Manga
-from ShikiParser.Anime import Anime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from ShikiParser.ParserErrors import TitleNameFormatError, TitleNotFoundError
-from bs4 import BeautifulSoup
+from ShikiParser.TitleCache import TitleCache
+from ShikiParser.HttpClient import get_default_client
+from ShikiParser.HtmlBackend import HtmlBackend
+from ShikiParser.ApiBackend import ApiBackend
+from ShikiParser.SingleFlight import SingleFlight
+from ShikiParser.Steps import Call, run_steps
 
 
 class ShikiParser:
-    USER_AGENTS_FILE = 'ShikiParser/user-agents.json'
+    BACKENDS = {
+        'html': HtmlBackend,
+        'api': ApiBackend,
+    }
 
-    def __init__(self) -> None:
+    def __init__(self, cache=None, client=None, main_url=None, backend=None, index=None) -> None:
         """
-        Sets the main url to: https://shikimori.one.
+        Attributes:
+        - cache {TitleCache}: cache for found titles,
+          if None creates TitleCache with default settings
+        - client {HttpClient}: client for requests to shikimori,
+          if None shared default client is used
+        - main_url {str}: site url, if None it's taken from
+          SHIKI_URL environment variable or set to https://shikimori.one
+        - backend {str}: 'html' to parse site pages or 'api' to use json API,
+          if None it's taken from SHIKI_BACKEND environment variable or set to 'html'
+        - index {LocalTitleIndex}: local title names index, which is checked
+          before search on the site, if None every search goes to the site
+
+        refresher attribute can be set to TitleRefresher, then searches are
+        counted for popularity and stale cached titles are refreshed in background.
+
+        Stage timing:
+        timer attribute is called with stage name ('search_fetch', 'search_parse',
+        'title_fetch', 'title_parse') and should return context manager,
+        which is entered for the stage duration. By default does nothing.
+
+        Lookups are written once as steps generators (search_steps, title_steps),
+        this class runs them synchronously, AsyncShikiParser runs the same steps
+        with asyncio.
         """
-        self.HEADERS = {'User-Agent': ''}
-        self.__main_url = 'https://shikimori.one'
+        main_url = main_url or os.environ.get('SHIKI_URL', 'https://shikimori.one')
+        backend = backend or os.environ.get('SHIKI_BACKEND', 'html')
+        self.cache = cache if cache is not None else TitleCache()
+        self.client = client if client is not None else get_default_client()
+        self.backend = self.BACKENDS[backend](self.client, main_url)
+        self.index = index
+        self.refresher = None
+        # Same concurrent lookups share one request to shikimori
+        self.flights = SingleFlight()
+        self.timer = lambda stage: nullcontext()
 
     def search_title(self, title: str, is_anime=True):
         """
@@ -24,56 +60,149 @@ class ShikiParser:
             title {str}: Title name, where words splitted with spaces
             is_anime {bool}: if True title_type is 'anime' else 'manga'
 
-        Returns a new Anime object.
+        Returns Title record.
+        If title was found recently returns cached title,
+        stale cached title is returned too, while it's refreshed by refresher.
+        If the same title is being searched by other thread,
+        waits for its result instead of making new requests.
+        """
+        cached = self.get_cached(title, is_anime)
+        if cached is not None:
+            return cached
+
+        key = ('search',) + self.cache.make_key(title, is_anime)
+        return self.flights.do(key, lambda: self.run(self.search_steps(title, is_anime)))
+
+    def refresh_title(self, title: str, is_anime=True):
+        """
+        Search title on the site even if it's cached or in the local index,
+        and update both. Returns Title record.
+        """
+        key = ('refresh',) + self.cache.make_key(title, is_anime)
+        return self.flights.do(key, lambda: self.run(self.search_steps(title, is_anime, force=True)))
+
+    def search_many(self, titles, is_anime=True, max_workers=4):
+        """
+        Attributes:
+        - titles {list}: title names
+        - is_anime {bool}: if True title_type is 'anime' else 'manga'
+        - max_workers {int}: max number of titles searched at the same time
+
+        Search titles concurrently.
+        Returns list in the same order as titles, every item is Title record
+        or exception raised by its search (TitleNotFoundError etc.).
+        """
+        def search(title):
+            try:
+                return self.search_title(title, is_anime)
+            except Exception as error:
+                return error
+
+        if len(titles) <= 1:
+            return [search(title) for title in titles]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(titles))) as executor:
+            return list(executor.map(search, titles))
+
+    def get_cached(self, title: str, is_anime):
+        """
+        Check title name and look for it in the cache.
+        Returns cached Title or None.
+        Raises TitleNameFormatError or cached TitleNotFoundError.
         """
         if not self.is_title_valid(title):
             raise TitleNameFormatError(title)
 
-        search_pattern = title.lower().replace(' ', '+')
-        search_url = self.get_search_url(search_pattern, is_anime)
-
-        self.change_user_agent() 
-        title_html = requests.get(search_url, headers=self.HEADERS).text
-        soup = BeautifulSoup(title_html, 'html.parser')
-        title_tag_a = soup.find('a', {'class': 'title'})
-        
-        if (title_tag_a is None) and not (self.is_already_title(soup, title)):
+        cached, is_stale = self.cache.get_entry(title, is_anime)
+        if self.refresher is not None:
+            self.refresher.record(title, is_anime)
+            if is_stale:
+                self.refresher.schedule(title, is_anime)
+        if isinstance(cached, TitleNotFoundError):
             raise TitleNotFoundError(title)
-        elif self.is_already_title(soup, title):
-            return Anime(None, title_html) if is_anime else Manga(None, title_html)
-        return Anime(title_tag_a['href']) if is_anime else Manga(title_tag_a['href'])
+        return cached
 
-    def change_user_agent(self):
+    def search_steps(self, title: str, is_anime, force=False):
         """
-        Choose different user-agent.
+        Search title with backend and put result to the cache.
+        Cache is checked again first: search which missed the cache could
+        start right after other search of the same title put its result.
+        If force is True cache and local index are skipped,
+        both are updated with the found title.
         """
-        with open(self.USER_AGENTS_FILE) as file:
-            user_agents = json.load(file)
-            random_max = len(user_agents)-1
-            self.HEADERS['User-Agent'] = user_agents[randint(0, random_max)]['user-agent']
+        if not force:
+            cached, _ = self.cache.peek(title, is_anime)
+            if isinstance(cached, TitleNotFoundError):
+                raise TitleNotFoundError(title)
+            if cached is not None:
+                return cached
+        found = None
+        if self.index is not None and not force:
+            found = yield from self.index_steps(title, is_anime)
+        if found is None:
+            try:
+                found = yield from self.backend.search(title, is_anime)
+            except TitleNotFoundError as error:
+                self.cache.add(title, is_anime, error)
+                raise
+            if self.index is not None:
+                yield Call(self.index.add, (found, title))
+        self.cache.add(title, is_anime, found)
+        return found
 
-    def get_search_url(self, search_pattern, is_anime):
+    def index_steps(self, title: str, is_anime):
         """
-        Attributes:
-        - search_pattern {str}: pattern of title name in form like "word+word+word...".
-        - is_anime {bool}: if True than 'anime', else 'manga'.
-
-        Get the search url for anime or manga.
+        Find title in local index, without search page.
+        Title page is requested only if index has no fresh data.
+        Returns None if index has no confident match.
         """
-        if is_anime:
-            return self.__main_url + f'/animes/order-by/aired_on?search={search_pattern}'
-        return self.__main_url + f'/mangas?search={search_pattern}'
+        match = yield Call(self.index.find, (title, is_anime))
+        if match is None:
+            return None
+        title_id, found = match
+        if found is not None:
+            return found
 
-    @staticmethod
-    def is_already_title(soup: BeautifulSoup, title_name: str):
+        kind = 'anime' if is_anime else 'manga'
+        try:
+            found = yield from self.backend.get_title(kind, title_id)
+        except TitleNotFoundError:
+            # Title was removed from the site
+            yield Call(self.index.remove, (kind, title_id))
+            return None
+        yield Call(self.index.add, (found,))
+        return found
+
+    def get_title(self, kind: str, title_id: int):
         """
         Attributes:
-        - soup {BeatifulSoup}: prepeared soup with title_html
-        - title_name {str}: name of the title
+        - kind {str}: 'anime' or 'manga'
+        - title_id {int}: shikimori title id
+
+        Returns Title record, cached one if it's not expired.
+        Raises TitleNotFoundError if there is no title with given id.
+        """
+        cached = self.cache.get_by_id(kind, title_id)
+        if cached is not None:
+            return cached
+        return self.flights.do(('title', kind, title_id),
+                               lambda: self.run(self.title_steps(kind, title_id)))
+
+    def title_steps(self, kind, title_id):
+        title = None
+        if self.index is not None:
+            title = yield Call(self.index.get, (kind, title_id))
+        if title is None:
+            title = yield from self.backend.get_title(kind, title_id)
+            if self.index is not None:
+                yield Call(self.index.add, (title,))
+        self.cache.add_by_id(title)
+        return title
 
-        Return True if title_name in 'h1.text' else False
+    def run(self, steps):
+        """
+        Run lookup steps with this parser client and timer.
         """
-        return soup.find('h1').text.lower().find(title_name.lower()) != -1
+        return run_steps(steps, self.client, self.timer)
 
     @staticmethod
     def is_title_valid(title: str):
@@ -18,3 +18,31 @@ class TitleNotFoundError(Exception):
 
     def __str__(self):
         return f'Title {self.title} not found.'
+
+
+class UpstreamError(Exception):
+    """
+    Should be raised when shikimori answers with server error,
+    or can't be reached at all, then status is None.
+    """
+    def __init__(self, url='', status=None):
+        self.url = url
+        self.status = status
+
+    def __str__(self):
+        if self.status is None:
+            return f'Shikimori is unreachable for {self.url}.'
+        return f'Shikimori answered {self.status} for {self.url}.'
+
+
+class UpstreamThrottledError(UpstreamError):
+    """
+    Should be raised when request to shikimori would wait
+    for the rate limit longer than allowed.
+    """
+    def __init__(self, wait=0.0):
+        super().__init__(status=429)
+        self.wait = wait
+
+    def __str__(self):
+        return f'Shikimori rate limit, request would wait {self.wait:.1f}s.'
@@ -0,0 +1,75 @@
+import time
+import threading
+from ShikiParser.ParserErrors import UpstreamThrottledError
+
+
+class RateLimiter:
+    """
+    Token bucket limiter for requests to shikimori.
+
+    Attributes:
+    - rate {float}: requests per second in the long run
+    - burst {int}: how many requests can go at once after idle time
+    - min_backoff {float}: first pause in seconds after 429/503 answer
+    - max_backoff {float}: max pause, every next 429/503 doubles the pause
+
+    Object is thread-safe, one limiter should be shared by all requests.
+    """
+    def __init__(self, rate=5, burst=10, min_backoff=1, max_backoff=60) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoffs = 0
+        self.__backoff = min_backoff
+        self.__blocked_until = 0.0
+        # Time when bucket will be full again
+        self.__full_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """
+        Wait until request can be sent.
+        If wait is longer than timeout seconds raises UpstreamThrottledError
+        without waiting.
+        """
+        wait = self.reserve(timeout)
+        if wait > 0:
+            time.sleep(wait)
+
+    def reserve(self, timeout=None):
+        """
+        Take place for request without waiting.
+        Returns seconds to wait before request is sent,
+        so async client can wait with asyncio.sleep.
+        Raises UpstreamThrottledError like acquire.
+        """
+        interval = 1 / self.rate
+        with self.__lock:
+            now = time.monotonic()
+            full_at = max(self.__full_at, now)
+            allowed_at = max(full_at - (self.burst - 1) * interval, self.__blocked_until, now)
+            wait = allowed_at - now
+            if timeout is not None and wait > timeout:
+                raise UpstreamThrottledError(wait)
+            self.__full_at = max(full_at, allowed_at) + interval
+        return wait
+
+    def backoff(self, retry_after=None):
+        """
+        Stop requests after 429/503 answer.
+        Pause is retry_after seconds if server sent it,
+        else it grows exponentially with every answer in a row.
+        """
+        with self.__lock:
+            pause = retry_after if retry_after is not None else self.__backoff
+            self.__blocked_until = max(self.__blocked_until, time.monotonic() + pause)
+            self.__backoff = min(self.__backoff * 2, self.max_backoff)
+            self.backoffs += 1
+
+    def reset_backoff(self):
+        """
+        Called after successful answer.
+        """
+        with self.__lock:
+            self.__backoff = self.min_backoff
@@ -0,0 +1,173 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+from ShikiParser.Steps import Page
+
+
+class ResponseCache:
+    """
+    On-disk cache of shikimori pages for HttpClient and AsyncHttpClient.
+    Stored page is revalidated with If-None-Match/If-Modified-Since,
+    so on 304 answer only headers go over the wire.
+
+    Attributes:
+    - path {str}: SQLite database file, can be shared by processes
+    - max_bytes {int}: max size of compressed bodies, least recently used
+      pages are evicted when limit is reached
+    - compress_level {int}: zlib level for stored bodies
+
+    Keys are request urls, final url after redirects is stored with the body.
+    Only 200 answers with ETag or Last-Modified header are stored.
+    Size is checked once per TRIM_EVERY writes, so file can be
+    a bit bigger than max_bytes between checks.
+    Connection is opened on first use, so object can be created before
+    server forks workers.
+    Object is thread-safe.
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS responses ('
+        '  url TEXT PRIMARY KEY,'
+        '  final_url TEXT NOT NULL,'
+        '  etag TEXT,'
+        '  last_modified TEXT,'
+        '  body BLOB NOT NULL,'
+        '  size INTEGER NOT NULL,'
+        '  accessed REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)',
+    )
+    TRIM_EVERY = 20
+
+    def __init__(self, path='responses.db', max_bytes=64 * 1024 * 1024, compress_level=6) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.saved_bytes = 0
+        self.__connection = None
+        self.__pid = None
+        self.__writes = 0
+        self.__lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Returns (Page, headers for conditional request) or None if url is not stored.
+        """
+        with self.__lock:
+            row = self.__connect().execute(
+                'SELECT final_url, etag, last_modified, body FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+        final_url, etag, last_modified, body = row
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return Page(final_url, 200, zlib.decompress(body).decode('utf-8')), headers
+
+    def revalidated(self, url, page):
+        """
+        Mark stored page as used after 304 answer.
+        """
+        with self.__lock:
+            connection = self.__connect()
+            with connection:
+                connection.execute('UPDATE responses SET accessed = ? WHERE url = ?',
+                                   (time.time(), url))
+            self.hits += 1
+            self.saved_bytes += len(page.text)
+
+    def put(self, url, page, headers):
+        """
+        Attributes:
+        - url {str}: request url
+        - page {Page}: downloaded page
+        - headers {Mapping}: response headers with ETag/Last-Modified
+
+        Returns True if page is stored.
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if page.status_code != 200 or not (etag or last_modified):
+            return False
+        body = zlib.compress(page.text.encode('utf-8'), self.compress_level)
+        with self.__lock:
+            connection = self.__connect()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, page.url, etag, last_modified, body, len(body), time.time())
+                )
+                self.__trim(connection)
+            self.stored += 1
+        return True
+
+    def size(self):
+        """
+        Returns (number of pages, size of compressed bodies).
+        """
+        with self.__lock:
+            count, size = self.__connect().execute(
+                'SELECT COUNT(*), TOTAL(size) FROM responses'
+            ).fetchone()
+        return count, int(size)
+
+    def stats(self):
+        count, size = self.size()
+        lookups = self.hits + self.misses
+        return {
+            'pages': count,
+            'bytes': size,
+            'revalidated': self.hits,
+            'misses': self.misses,
+            'stored': self.stored,
+            'saved_bytes': self.saved_bytes,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self.__lock:
+            connection = self.__connect()
+            with connection:
+                connection.execute('DELETE FROM responses')
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def __trim(self, connection):
+        """
+        Delete least recently used pages which don't fit into max_bytes.
+        """
+        self.__writes += 1
+        if self.__writes % self.TRIM_EVERY:
+            return
+        connection.execute(
+            'DELETE FROM responses WHERE url IN ('
+            '  SELECT url FROM (SELECT url, SUM(size) OVER (ORDER BY accessed DESC, url) AS total'
+            '                   FROM responses)'
+            '  WHERE total > ?)', (self.max_bytes,)
+        )
+
+    def __connect(self):
+        """
+        Returns connection of this process, opens it on first call.
+        """
+        if self.__connection is None or self.__pid != os.getpid():
+            self.__connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self.__pid = os.getpid()
+            with self.__connection:
+                if self.path != ':memory:':
+                    self.__connection.execute('PRAGMA journal_mode=WAL')
+                    self.__connection.execute('PRAGMA synchronous=NORMAL')
+                for statement in self.SCHEMA:
+                    self.__connection.execute(statement)
+        return self.__connection
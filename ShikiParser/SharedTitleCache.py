@@ -0,0 +1,201 @@
+import os
+import time
+import sqlite3
+import threading
+from ShikiParser.Title import Title
+from ShikiParser.TitleCache import TitleCache
+from ShikiParser.ParserErrors import TitleNotFoundError
+
+
+class SharedTitleCache(TitleCache):
+    """
+    TitleCache which is shared by processes through SQLite file,
+    so every server worker doesn't request the same titles again.
+
+    Attributes:
+    - path {str}: SQLite database file, the same for all processes
+    - max_size {int}: max number of stored queries (and titles) in the file,
+      and in the in-process cache in front of it
+    - ttl {int|float}: seconds found title is kept
+    - not_found_ttl {int|float}: seconds TitleNotFoundError is kept
+    - stale_ttl {int|float}: seconds found title is returned as stale after its ttl
+
+    Records are read from the in-process cache first, then from the file.
+    Connection is opened on first use, so object can be created before
+    server forks workers.
+    Object is thread-safe.
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS queries ('
+        '  query TEXT NOT NULL,'
+        '  is_anime INTEGER NOT NULL,'
+        '  kind TEXT,'
+        '  id INTEGER,'
+        '  expires REAL NOT NULL,'
+        '  PRIMARY KEY (query, is_anime))',
+        'CREATE TABLE IF NOT EXISTS titles ('
+        '  kind TEXT NOT NULL,'
+        '  id INTEGER NOT NULL,'
+        '  data BLOB NOT NULL,'
+        '  expires REAL NOT NULL,'
+        '  PRIMARY KEY (kind, id))',
+        'CREATE INDEX IF NOT EXISTS queries_expires ON queries (expires)',
+        'CREATE INDEX IF NOT EXISTS titles_expires ON titles (expires)',
+    )
+    # Expired and extra rows are deleted once per this number of writes
+    TRIM_EVERY = 100
+
+    def __init__(self, path='title_cache.db', max_size=1024, ttl=3600, not_found_ttl=60,
+                 stale_ttl=0) -> None:
+        super().__init__(max_size, ttl, not_found_ttl, stale_ttl)
+        self.path = path
+        self.shared_hits = 0
+        self.__connection = None
+        self.__pid = None
+        self.__writes = 0
+        self.__lock = threading.Lock()
+
+    def get_entry(self, title: str, is_anime=True):
+        cached = super().get_entry(title, is_anime)
+        if cached[0] is not None:
+            return cached
+
+        found = self.__select(title, is_anime)
+        if found is None:
+            return None, False
+        value, expires = found
+        self.__put_local(title, is_anime, value, expires)
+        return value, expires <= time.time()
+
+    def peek(self, title: str, is_anime=True):
+        cached = super().peek(title, is_anime)
+        if cached[0] is not None:
+            return cached
+        found = self.__select(title, is_anime)
+        if found is None:
+            return None, False
+        return found[0], found[1] <= time.time()
+
+    def get_by_id(self, kind: str, title_id: int):
+        cached = super().get_by_id(kind, title_id)
+        if cached is not None:
+            return cached
+
+        with self.__lock:
+            row = self.__connect().execute(
+                'SELECT data, expires FROM titles WHERE kind = ? AND id = ? AND expires > ?',
+                (kind, title_id, time.time() - self.stale_ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        title = Title.from_bytes(row[0])
+        super().add_by_id(title, ttl=row[1] - time.time())
+        self.shared_hits += 1
+        return title
+
+    def add(self, title: str, is_anime, value, ttl=None):
+        super().add(title, is_anime, value, ttl)
+        query, is_anime = self.make_key(title, is_anime)
+        now = time.time()
+        with self.__lock:
+            connection = self.__connect()
+            with connection:
+                if isinstance(value, TitleNotFoundError):
+                    connection.execute(
+                        'INSERT OR REPLACE INTO queries VALUES (?, ?, NULL, NULL, ?)',
+                        (query, is_anime, now + (ttl if ttl is not None else self.not_found_ttl))
+                    )
+                else:
+                    expires = now + (ttl if ttl is not None else self.ttl)
+                    self.__put_title(connection, value, expires)
+                    connection.execute(
+                        'INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?, ?)',
+                        (query, is_anime, value.kind, value.id, expires)
+                    )
+                self.__trim(connection, now)
+
+    def add_by_id(self, title, ttl=None):
+        super().add_by_id(title, ttl)
+        now = time.time()
+        with self.__lock:
+            connection = self.__connect()
+            with connection:
+                self.__put_title(connection, title, now + (ttl if ttl is not None else self.ttl))
+                self.__trim(connection, now)
+
+    def clear(self):
+        super().clear()
+        with self.__lock:
+            connection = self.__connect()
+            with connection:
+                connection.execute('DELETE FROM queries')
+                connection.execute('DELETE FROM titles')
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def __select(self, title, is_anime):
+        """
+        Returns (Title or TitleNotFoundError, expires) from the file
+        or None if there is no record.
+        """
+        query, is_anime = self.make_key(title, is_anime)
+        with self.__lock:
+            row = self.__connect().execute(
+                'SELECT queries.kind, titles.data, queries.expires FROM queries '
+                'LEFT JOIN titles ON titles.kind = queries.kind AND titles.id = queries.id '
+                'WHERE query = ? AND is_anime = ? '
+                # Not found record is never stale
+                'AND queries.expires > CASE WHEN queries.kind IS NULL THEN ? ELSE ? END',
+                (query, is_anime, time.time(), time.time() - self.stale_ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        kind, data, expires = row
+        if kind is not None and data is None:
+            # Title row was trimmed, query has to be made again
+            return None
+        value = TitleNotFoundError(title) if kind is None else Title.from_bytes(data)
+        return value, expires
+
+    def __put_local(self, title, is_anime, value, expires):
+        """
+        Put record from the file to the in-process cache,
+        it expires at the same time as in the file.
+        """
+        self.shared_hits += 1
+        super().add(title, is_anime, value, ttl=expires - time.time())
+
+    @staticmethod
+    def __put_title(connection, title, expires):
+        connection.execute('INSERT OR REPLACE INTO titles VALUES (?, ?, ?, ?)',
+                           (title.kind, title.id, title.to_bytes(), expires))
+
+    def __trim(self, connection, now):
+        self.__writes += 1
+        if self.__writes % self.TRIM_EVERY:
+            return
+        for table in ('queries', 'titles'):
+            connection.execute(f'DELETE FROM {table} WHERE expires <= ?', (now - self.stale_ttl,))
+            connection.execute(
+                f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} '
+                f'ORDER BY expires DESC LIMIT -1 OFFSET ?)', (self.max_size,)
+            )
+
+    def __connect(self):
+        """
+        Returns connection of this process, opens it on first call.
+        Connection opened before fork is not used in the child process.
+        """
+        if self.__connection is None or self.__pid != os.getpid():
+            self.__connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self.__pid = os.getpid()
+            with self.__connection:
+                self.__connection.execute('PRAGMA journal_mode=WAL')
+                self.__connection.execute('PRAGMA synchronous=NORMAL')
+                for statement in self.SCHEMA:
+                    self.__connection.execute(statement)
+        return self.__connection
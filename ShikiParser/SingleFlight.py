@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+
+class Flight:
+    """
+    One running call and its result.
+    """
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs only one call per key at a time.
+    Threads which call do() with the same key while the call is running
+    don't run function again, they wait and get the same result
+    or the same exception.
+    Object is thread-safe.
+    """
+    def __init__(self) -> None:
+        self.calls = 0
+        self.shared = 0
+        self.__flights = {}
+        self.__lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Attributes:
+        - key: hashable key of the call
+        - function {callable}: function without arguments
+
+        Returns function result or raises its exception.
+        """
+        with self.__lock:
+            flight = self.__flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Flight()
+                self.__flights[key] = flight
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+            return flight.result
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+    def __len__(self):
+        return len(self.__flights)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines of one event loop.
+    Coroutines which call do() with the same key while the call is running
+    await the same result or the same exception.
+    """
+    def __init__(self) -> None:
+        self.calls = 0
+        self.shared = 0
+        self.__flights = {}
+
+    async def do(self, key, function):
+        """
+        Attributes:
+        - key: hashable key of the call
+        - function {callable}: coroutine function without arguments
+
+        Returns function result or raises its exception.
+        """
+        flight = self.__flights.get(key)
+        if flight is not None:
+            self.shared += 1
+            # shield: cancelled waiter doesn't cancel the running call
+            return await asyncio.shield(flight)
+
+        self.calls += 1
+        flight = asyncio.ensure_future(function())
+        self.__flights[key] = flight
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            if flight.done():
+                del self.__flights[key]
+            else:
+                flight.add_done_callback(lambda _: self.__flights.pop(key, None))
+
+    def __len__(self):
+        return len(self.__flights)
@@ -0,0 +1,88 @@
+import json
+from contextlib import nullcontext
+
+
+class Page:
+    """
+    Downloaded page, the same for sync and async clients.
+
+    Attributes:
+    - url {str}: url after redirects
+    - status_code {int}: http status
+    - text {str}: decoded body
+    """
+    __slots__ = ('url', 'status_code', 'text')
+
+    def __init__(self, url, status_code, text) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class Fetch:
+    """
+    Step which downloads url.
+    Result of the step is Page.
+    """
+    __slots__ = ('url', 'stage')
+
+    def __init__(self, url, stage=None) -> None:
+        self.url = url
+        self.stage = stage
+
+    def run(self, client):
+        response = client.get(self.url)
+        return Page(response.url, response.status_code, response.text)
+
+
+class Call:
+    """
+    Step which calls function without network, e.g. html parsing.
+    Async parser runs it in executor, so event loop is not blocked.
+    Result of the step is function result.
+    """
+    __slots__ = ('function', 'args', 'stage')
+
+    def __init__(self, function, args=(), stage=None) -> None:
+        self.function = function
+        self.args = args
+        self.stage = stage
+
+    def run(self):
+        return self.function(*self.args)
+
+
+def run_steps(steps, client, timer=None):
+    """
+    Run steps generator synchronously.
+    Attributes:
+    - steps {generator}: yields Fetch and Call steps, gets back their results
+    - client {HttpClient}: client for Fetch steps
+    - timer {callable}: called with stage name, returns context manager
+      entered for the step duration
+
+    Returns generator return value.
+    Step exception is thrown into generator, as if it was raised there.
+    How steps generator looks:
+        page = yield Fetch(url, 'title_fetch')
+        title = yield Call(parse, (page.text,), 'title_parse')
+        return title
+    """
+    timer = timer or (lambda stage: nullcontext())
+    try:
+        step = next(steps)
+        while True:
+            try:
+                with timer(step.stage) if step.stage else nullcontext():
+                    result = step.run(client) if isinstance(step, Fetch) else step.run()
+            except Exception as error:
+                step = steps.throw(error)
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        steps.close()
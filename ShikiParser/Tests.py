@@ -1,6 +1,17 @@
+import time
+import socket
+import asyncio
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from ShikiParser import ShikiParser
-from ShikiParser import TitleNotFoundError, TitleNameFormatError
+from ShikiParser import TitleNotFoundError, TitleNameFormatError, TitleCache
+from ShikiParser import Title, SingleFlight, HttpClient, RateLimiter
+from ShikiParser import UpstreamError, UpstreamThrottledError, LocalTitleIndex
+from ShikiParser import AsyncShikiParser, AsyncHttpClient, SharedTitleCache, TitleRefresher
+from ShikiParser import ResponseCache
+from ShikiParser.HttpClient import get_client_settings
+from ShikiParser.Benchmarks import FakeShikimori
+from ShikiParser.Benchmarks import Bench
 
 
 class TestShikiParser:
@@ -37,14 +48,9 @@ class TestShikiParser:
 
     def test_user_agent_change(self):
         """
-        Test if User-Agent changes for each title.
+        Test if User-Agent changes for each request.
         """
-        title_names = ['Claymore', 'Made in Abyss', 'Attack on Titan']
-        headers = []
-
-        for name in title_names:
-            headers.append(self.parser.search_title(name).HEADERS)
-        
+        headers = [self.parser.client.random_headers() for _ in range(3)]
         assert (headers[0] != headers[1]) or (headers[0] != headers[2])
 
 
@@ -76,13 +82,13 @@ class TestTitle:
         If the score on the page same as title.score
         Change the test expected score.
         """
-        assert self.title.score == '8.74'
+        assert self.title.score == 8.74
 
     def test_title_synopsis(self):
         """
         Test is synopsis correct.
         """
-        title_synopsis = self.title.synopsis()
+        title_synopsis = self.title.synopsis
         expected_start = 'Человечество всегда тяготело к изучению неизведанного'
         expected_end = 'Бездну, Бездна в ответ пристально глядит на тебя?'
         assert title_synopsis.startswith(expected_start) and \
@@ -92,5 +98,636 @@ class TestTitle:
         """
         Test is genres correct.
         """
-        expected = ['Фантастика', 'Приключения', 'Детектив', 'Драма', 'Фэнтези']
+        expected = ('Фантастика', 'Приключения', 'Детектив', 'Драма', 'Фэнтези')
         assert self.title.genres == expected
+
+
+def make_title(name, title_id=1):
+    return Title('anime',
+                 title_id,
+                 f'https://shikimori.one/animes/z{title_id}-title',
+                 name,
+                 8.0,
+                 f'{name} synopsis',
+                 ['Драма'],
+                 'https://shikimori.one/poster.jpg')
+
+
+class TestTitleCache:
+    @pytest.fixture(autouse=True)
+    def cache(self):
+        self.cache = TitleCache(max_size=2, ttl=60, not_found_ttl=60)
+
+    def test_query_normalized(self):
+        """
+        Test if same title with different case and spaces hits the cache.
+        """
+        self.cache.add('Made in Abyss', True, make_title('Made in Abyss'))
+        cached = self.cache.get('  made IN   abyss', True)
+        assert cached.name == 'Made in Abyss'
+        assert cached.synopsis == 'Made in Abyss synopsis'
+        assert self.cache.get('made in abyss', False) is None
+
+    def test_get_by_id(self):
+        """
+        Test if found title can be got by kind and shikimori id.
+        """
+        self.cache.add('Made in Abyss', True, make_title('Made in Abyss', 34599))
+        assert self.cache.get_by_id('anime', 34599).name == 'Made in Abyss'
+        assert self.cache.get_by_id('manga', 34599) is None
+
+    def test_lru_eviction(self):
+        """
+        Test if least recently used title is evicted when cache is full.
+        """
+        self.cache.add('first', True, make_title('first'))
+        self.cache.add('second', True, make_title('second'))
+        self.cache.get('first', True)
+        self.cache.add('third', True, make_title('third'))
+        assert self.cache.get('second', True) is None
+        assert self.cache.get('first', True) is not None
+
+    def test_ttl_expired(self):
+        """
+        Test if expired title is not returned.
+        """
+        self.cache.ttl = 0
+        self.cache.add('first', True, make_title('first'))
+        assert self.cache.get('first', True) is None
+
+    def test_not_found_never_stale(self):
+        """
+        Test if stale_ttl keeps only found titles after ttl.
+        """
+        cache = TitleCache(ttl=0, not_found_ttl=0, stale_ttl=60)
+        cache.add('first', True, make_title('first'))
+        cache.add('asfjkdgalr', True, TitleNotFoundError('asfjkdgalr'))
+        assert cache.get_entry('first', True)[1] is True
+        assert cache.get('asfjkdgalr', True) is None
+
+    def test_not_found_cached(self):
+        """
+        Test if parser raises TitleNotFoundError from cache without request.
+        """
+        parser = ShikiParser(self.cache)
+        self.cache.add('asfjkdgalr', True, TitleNotFoundError('asfjkdgalr'))
+        with pytest.raises(TitleNotFoundError):
+            parser.search_title('asfjkdgalr')
+
+
+class TestSharedTitleCache:
+    def test_shared_between_caches(self, tmp_path):
+        """
+        Test if record added by one process cache is found by the other.
+        """
+        path = str(tmp_path / 'title_cache.db')
+        first, second = SharedTitleCache(path), SharedTitleCache(path)
+        first.add('Made in Abyss', True, make_title('Made in Abyss', 34599))
+        first.add('asfjkdgalr', True, TitleNotFoundError('asfjkdgalr'))
+        assert second.get_by_id('anime', 34599).name == 'Made in Abyss'
+        assert second.get('made in abyss', True).id == 34599
+        assert isinstance(second.get('asfjkdgalr', True), TitleNotFoundError)
+        assert second.shared_hits == 3
+
+    def test_ttl_expired(self, tmp_path):
+        path = str(tmp_path / 'title_cache.db')
+        first, second = SharedTitleCache(path, ttl=0), SharedTitleCache(path)
+        first.add('Made in Abyss', True, make_title('Made in Abyss'))
+        assert second.get('made in abyss', True) is None
+
+    def test_not_found_never_stale(self, tmp_path):
+        path = str(tmp_path / 'title_cache.db')
+        first = SharedTitleCache(path, not_found_ttl=0, stale_ttl=60)
+        second = SharedTitleCache(path, stale_ttl=60)
+        first.add('asfjkdgalr', True, TitleNotFoundError('asfjkdgalr'))
+        assert second.get('asfjkdgalr', True) is None
+
+
+class TestTitleRecord:
+    def test_serialization(self):
+        """
+        Test if Title is the same after to_bytes/from_bytes.
+        """
+        title = make_title('Созданный в Бездне / Made in Abyss', 34599)
+        assert Title.from_bytes(title.to_bytes()) == title
+        assert Title.from_dict(title.to_dict()) == title
+
+    def test_immutable(self):
+        """
+        Test if Title fields can't be changed.
+        """
+        title = make_title('Claymore')
+        with pytest.raises(AttributeError):
+            title.score = 10
+
+    def test_parse_id(self):
+        """
+        Test if shikimori id is taken from title url.
+        """
+        assert Title.parse_id('https://shikimori.one/animes/z34599-made-in-abyss') == 34599
+        assert Title.parse_id('https://shikimori.one/mangas/25-berserk') == 25
+        assert Title.parse_id(None) is None
+
+
+@pytest.fixture(scope='module')
+def fake_shikimori():
+    with FakeShikimori() as fake:
+        yield fake
+
+
+@pytest.fixture(scope='module')
+def offline_client():
+    """
+    Client without rate limit for the local server.
+    """
+    return HttpClient(limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6))
+
+
+class TestOfflineParser:
+    """
+    Same checks as TestShikiParser and TestTitle, but against saved pages.
+    """
+    @pytest.fixture(autouse=True)
+    def parser(self, fake_shikimori, offline_client):
+        self.fake = fake_shikimori
+        self.parser = ShikiParser(client=offline_client, main_url=fake_shikimori.url)
+
+    def test_search_results(self):
+        """
+        Test if first title from search page is returned.
+        """
+        title = self.parser.search_title('Made in Abyss')
+        assert title.name == 'Созданный в Бездне / Made in Abyss'
+        assert title.id == 34599
+        assert title.score == 8.74
+        assert title.genres == ('Фантастика', 'Приключения', 'Детектив', 'Драма', 'Фэнтези')
+        assert title.synopsis.startswith('Человечество всегда тяготело к изучению неизведанного')
+        assert title.image_url.endswith('/system/animes/original/34599.jpg')
+
+    def test_redirect_to_title(self):
+        """
+        Test if title is parsed when search redirects to the title page.
+        """
+        title = self.parser.search_title('Claymore')
+        assert title.name == 'Клеймор / Claymore'
+        assert title.id == 1818
+
+    def test_title_not_found(self):
+        with pytest.raises(TitleNotFoundError):
+            self.parser.search_title('asfjkdgalr')
+
+    def test_manga_huge_synopsis(self):
+        title = self.parser.search_title('Berserk', is_anime=False)
+        assert title.kind == 'manga'
+        assert len(title.synopsis) > 50000
+        assert len(title.genres) == 9
+
+    def test_cache_hit_without_request(self):
+        """
+        Test if second search of the same title doesn't go to the server.
+        """
+        self.parser.search_title('Gintama')
+        requests_made = self.fake.requests
+        title = self.parser.search_title('gintama')
+        assert len(title.genres) == 30
+        assert self.fake.requests == requests_made
+
+    def test_cache_checked_in_flight(self, monkeypatch):
+        """
+        Test if search which missed the cache right before other search
+        of the same title put its result doesn't go to the server.
+        """
+        self.parser.search_title('Gintama')
+        with pytest.raises(TitleNotFoundError):
+            self.parser.search_title('asfjkdgalr')
+        monkeypatch.setattr(self.parser, 'get_cached', lambda title, is_anime: None)
+        requests_made = self.fake.requests
+        assert self.parser.search_title('gintama').id == 918
+        with pytest.raises(TitleNotFoundError):
+            self.parser.search_title('asfjkdgalr')
+        assert self.fake.requests == requests_made
+
+    def test_search_many(self):
+        """
+        Test if results and errors are returned in input order.
+        """
+        found = self.parser.search_many(['Claymore', 'asfjkdgalr', 'Made in Abyss', 'Bad-name'])
+        assert [title.id for title in found[::2]] == [1818, 34599]
+        assert isinstance(found[1], TitleNotFoundError)
+        assert isinstance(found[3], TitleNameFormatError)
+
+    def test_get_title_by_id(self):
+        title = self.parser.get_title('anime', 1818)
+        assert title.name == 'Клеймор / Claymore'
+        with pytest.raises(TitleNotFoundError):
+            self.parser.get_title('anime', 5)
+
+    def test_error_page_not_parsed(self):
+        """
+        Test if 404 page with h1 is not found, and 403 anti-bot page
+        is upstream error which isn't cached as not found.
+        """
+        with pytest.raises(TitleNotFoundError):
+            self.parser.get_title('manga', 1818)
+        self.fake.forbidden = 1
+        with pytest.raises(UpstreamError):
+            self.parser.search_title('Claymore')
+        assert self.parser.search_title('Claymore').id == 1818
+
+
+class TestOfflineApiParser(TestOfflineParser):
+    """
+    Same checks with json API backend.
+    """
+    @pytest.fixture(autouse=True)
+    def parser(self, fake_shikimori, offline_client):
+        self.fake = fake_shikimori
+        self.parser = ShikiParser(client=offline_client, main_url=fake_shikimori.url, backend='api')
+
+    def test_description_cleaned(self):
+        """
+        Test if bbcode is removed from description.
+        """
+        title = self.parser.search_title('Made in Abyss')
+        assert '[' not in title.synopsis
+        assert 'Огромная Бездна' in title.synopsis
+
+
+class TestOfflineAsyncParser:
+    """
+    AsyncShikiParser against saved pages.
+    """
+    @pytest.fixture(autouse=True)
+    def fake(self, fake_shikimori):
+        self.fake = fake_shikimori
+
+    def search(self, *searches, backend='html'):
+        """
+        Run searches concurrently with new parser.
+        Returns list of Title or exception objects.
+        """
+        async def run():
+            client = AsyncHttpClient(limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6))
+            parser = AsyncShikiParser(client=client, main_url=self.fake.url, backend=backend)
+            try:
+                return await asyncio.gather(*[parser.search_title(title, is_anime)
+                                              for title, is_anime in searches],
+                                            return_exceptions=True)
+            finally:
+                await parser.close()
+        return asyncio.run(run())
+
+    @pytest.mark.parametrize('backend', ['html', 'api'])
+    def test_same_titles_as_sync(self, backend, offline_client):
+        searches = [('Made in Abyss', True), ('Claymore', True), ('Berserk', False)]
+        parser = ShikiParser(client=offline_client, main_url=self.fake.url, backend=backend)
+        assert self.search(*searches, backend=backend) == \
+            [parser.search_title(title, is_anime) for title, is_anime in searches]
+
+    def test_title_not_found(self):
+        found, = self.search(('asfjkdgalr', True))
+        assert isinstance(found, TitleNotFoundError)
+
+    def test_concurrent_searches_coalesced(self):
+        """
+        Test if the same concurrent searches make requests only once.
+        """
+        requests_made = self.fake.requests
+        found = self.search(*[('Gintama', True)] * 50)
+        assert all(title.id == 918 for title in found)
+        # Search redirects to the title page
+        assert self.fake.requests == requests_made + 2
+
+
+class TestLocalTitleIndex:
+    @pytest.fixture(autouse=True)
+    def parser(self, fake_shikimori, offline_client):
+        self.fake = fake_shikimori
+        self.client = offline_client
+        self.index = LocalTitleIndex()
+        self.parser = self.make_parser()
+
+    def make_parser(self):
+        """
+        Parser with empty cache and shared index.
+        Json API backend gets title by id with one request.
+        """
+        return ShikiParser(client=self.client, main_url=self.fake.url, backend='api',
+                           index=self.index)
+
+    def test_fresh_title_without_request(self):
+        """
+        Test if title found earlier is returned by other name without requests.
+        """
+        self.parser.search_title('Made in Abyss')
+        requests_made = self.fake.requests
+        title = self.make_parser().search_title('Созданный в Бездне')
+        assert title.id == 34599
+        assert self.fake.requests == requests_made
+        assert self.index.stats()['fresh_hits'] == 1
+
+    def test_stale_title_requested_by_id(self):
+        """
+        Test if only title page is requested when stored data is old.
+        """
+        self.index.max_age = 0
+        self.parser.search_title('Claymore')
+        requests_made = self.fake.requests
+        title = self.make_parser().search_title('Клеймор')
+        assert title.name == 'Клеймор / Claymore'
+        assert self.fake.requests == requests_made + 1
+
+    def test_imported_names(self):
+        """
+        Test if title from catalog dump is found without search page.
+        """
+        self.index.add_names([{'id': 918, 'name': 'Gintama', 'russian': 'Гинтама'}], 'anime')
+        requests_made = self.fake.requests
+        title = self.parser.search_title('гинтама')
+        assert len(title.genres) == 30
+        assert self.fake.requests == requests_made + 1
+        assert self.index.find('gintama', is_anime=False) is None
+
+    def test_ambiguous_name_not_matched(self):
+        self.index.add_names([{'id': 1, 'name': 'Same'}, {'id': 2, 'name': 'Same'}], 'anime')
+        assert self.index.find('same') is None
+        assert self.index.stats()['hits'] == 0
+
+
+class TestTitleRefresher:
+    @pytest.fixture(autouse=True)
+    def parser(self, fake_shikimori, offline_client):
+        self.fake = fake_shikimori
+        # Every found title is stale at once
+        cache = TitleCache(ttl=0, stale_ttl=60)
+        self.parser = ShikiParser(cache, offline_client, fake_shikimori.url)
+        self.refresher = TitleRefresher(self.parser, budget=6000, prewarm_interval=60)
+        self.parser.refresher = self.refresher
+        yield
+        self.refresher.stop()
+
+    def wait_refreshed(self, count):
+        deadline = time.monotonic() + 5
+        while self.refresher.refreshed < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.refresher.refreshed == count
+
+    def test_stale_title_refreshed_in_background(self):
+        """
+        Test if stale title is returned without requests and refreshed after that.
+        """
+        self.refresher.start()
+        self.parser.search_title('Claymore')
+        requests_made = self.fake.requests
+        title = self.parser.search_title('claymore')
+        assert title.id == 1818
+        assert self.fake.requests == requests_made
+        self.wait_refreshed(1)
+        assert self.fake.requests > requests_made
+
+    def test_refresh_skips_local_index(self):
+        """
+        Test if refresh requests the site even if local index has fresh title.
+        """
+        self.parser.index = LocalTitleIndex(max_age=86400)
+        self.refresher.start()
+        self.parser.search_title('Claymore')
+        requests_made = self.fake.requests
+        self.parser.search_title('Claymore')
+        self.wait_refreshed(1)
+        assert self.fake.requests > requests_made
+        assert self.parser.index.get('anime', 1818).id == 1818
+
+    def test_popular_searches_prewarmed(self):
+        for _ in range(3):
+            self.refresher.record('Gintama', True)
+        self.refresher.record('Claymore', True)
+        assert self.refresher.most_popular(1) == [(('gintama', True), 3)]
+        self.refresher.start()
+        self.wait_refreshed(2)
+        assert self.parser.cache.get('gintama', True).id == 918
+
+    def test_prewarm_not_counted_in_cache_stats(self):
+        self.refresher.record('Gintama', True)
+        self.refresher.prewarm()
+        assert (self.parser.cache.hits, self.parser.cache.misses) == (0, 0)
+
+    def test_popularity_merged_between_processes(self, tmp_path):
+        """
+        Test if workers saving to the same file keep counts of each other.
+        """
+        path = str(tmp_path / 'popularity.json')
+        first = TitleRefresher(self.parser, popularity_path=path)
+        second = TitleRefresher(self.parser, popularity_path=path)
+        first.record('Gintama', True)
+        second.record('Gintama', True)
+        second.record('Claymore', True)
+        first.save(path)
+        second.save(path)
+        first.save(path)
+        assert dict(TitleRefresher.read(path)) == {('gintama', True): 2, ('claymore', True): 1}
+
+
+    def test_async_parser_refreshed_on_its_loop(self):
+        """
+        Test if refresh of AsyncShikiParser title runs on the parser loop.
+        """
+        async def run():
+            client = AsyncHttpClient(limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6))
+            parser = AsyncShikiParser(TitleCache(ttl=0, stale_ttl=60), client, self.fake.url)
+            refresher = TitleRefresher(parser, budget=6000, prewarm_interval=60)
+            parser.refresher = refresher
+            refresher.start()
+            try:
+                await parser.search_title('Claymore')
+                requests_made = self.fake.requests
+                assert (await parser.search_title('claymore')).id == 1818
+                deadline = time.monotonic() + 5
+                while refresher.refreshed < 1 and time.monotonic() < deadline:
+                    await asyncio.sleep(0.01)
+                return refresher.refreshed, self.fake.requests > requests_made
+            finally:
+                await asyncio.get_running_loop().run_in_executor(None, refresher.stop, 5)
+                await parser.close()
+        assert asyncio.run(run()) == (1, True)
+
+
+class TestResponseCache:
+    @pytest.fixture(autouse=True)
+    def client(self, fake_shikimori, tmp_path):
+        self.fake = fake_shikimori
+        self.cache = ResponseCache(str(tmp_path / 'responses.db'))
+        self.client = HttpClient(limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6),
+                                 response_cache=self.cache)
+        yield
+        self.cache.close()
+
+    def test_not_modified_page_from_cache(self):
+        """
+        Test if stored page is revalidated and returned without body download.
+        """
+        url = f'{self.fake.url}/animes?search=claymore'
+        first = self.client.get(url)
+        not_modified = self.fake.not_modified
+        second = self.client.get(url)
+        assert self.fake.not_modified == not_modified + 1
+        assert (second.url, second.status_code, second.text) == \
+               (first.url, first.status_code, first.text)
+        assert second.url == self.fake.title_url('animes', 1818)
+        assert self.cache.stats()['revalidated'] == 1
+
+    def test_size_limit(self):
+        """
+        Test if least recently used pages are evicted when size limit is reached.
+        """
+        self.cache.TRIM_EVERY = 1
+        urls = [self.fake.title_url(*key) for key in self.fake.TITLES]
+        for url in urls[:-1]:
+            self.client.get(url)
+        self.cache.max_bytes = self.cache.size()[1]
+        self.client.get(urls[-1])
+        assert self.cache.get(urls[0]) is None
+        assert self.cache.get(urls[-1]) is not None
+        assert self.cache.size()[1] <= self.cache.max_bytes
+
+
+class TestSingleFlight:
+    def test_one_call_for_concurrent_requests(self):
+        """
+        Test if concurrent calls with the same key run function once.
+        """
+        flights = SingleFlight()
+        calls = []
+
+        def slow_search():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'title'
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: flights.do('key', slow_search), range(8)))
+        assert results == ['title'] * 8
+        assert len(calls) == 1
+        assert len(flights) == 0
+
+    def test_same_exception_for_waiters(self):
+        """
+        Test if every waiter gets TitleNotFoundError.
+        """
+        flights = SingleFlight()
+
+        def not_found():
+            time.sleep(0.2)
+            raise TitleNotFoundError('asfjkdgalr')
+
+        def search(_):
+            try:
+                flights.do('key', not_found)
+            except TitleNotFoundError as error:
+                return error
+
+        with ThreadPoolExecutor(4) as executor:
+            errors = list(executor.map(search, range(4)))
+        assert all(isinstance(error, TitleNotFoundError) for error in errors)
+        assert flights.calls == 1
+
+
+class TestRateLimiter:
+    def test_limit_divided_between_processes(self, monkeypatch):
+        """
+        Test if every process gets its part of SHIKI_RATE and SHIKI_BURST.
+        """
+        monkeypatch.setenv('SHIKI_RATE', '10')
+        monkeypatch.setenv('SHIKI_BURST', '10')
+        limiter = get_client_settings(processes=4)['limiter']
+        assert (limiter.rate, limiter.burst) == (2.5, 2)
+        assert get_client_settings(processes=20)['limiter'].burst == 1
+
+    def test_burst_then_fail_fast(self):
+        """
+        Test if burst requests go at once and the next one
+        fails fast when wait is longer than timeout.
+        """
+        limiter = RateLimiter(rate=1, burst=3)
+        started = time.monotonic()
+        for _ in range(3):
+            limiter.acquire(timeout=0)
+        assert time.monotonic() - started < 0.1
+        with pytest.raises(UpstreamThrottledError):
+            limiter.acquire(timeout=0.5)
+
+    def test_retry_after_honored(self):
+        """
+        Test if requests are paused for Retry-After seconds.
+        """
+        limiter = RateLimiter(rate=100, burst=10)
+        limiter.backoff(retry_after=30)
+        with pytest.raises(UpstreamThrottledError) as error:
+            limiter.acquire(timeout=1)
+        assert error.value.wait > 29
+
+    def test_client_retries_after_429(self, fake_shikimori):
+        """
+        Test if client pauses and repeats request after 429 answer.
+        """
+        client = HttpClient(limiter=RateLimiter(rate=100, burst=10, min_backoff=0.01))
+        fake_shikimori.throttled = 2
+        response = client.get(fake_shikimori.title_url('animes', 1818))
+        assert response.status_code == 200
+        assert client.limiter.backoffs == 2
+
+    def test_client_raises_after_502(self):
+        """
+        Test if 502 answer is retried and then raised as UpstreamError.
+        """
+        with FakeShikimori(error_rate=1) as fake:
+            client = HttpClient(retries=1, limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6))
+            with pytest.raises(UpstreamError):
+                client.get(f'{fake.url}/animes?search=claymore')
+            assert fake.errors == 2
+
+    @pytest.fixture
+    def closed_url(self):
+        """
+        Url of local port nobody listens to.
+        """
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        return f'http://127.0.0.1:{port}/animes'
+
+    def test_unreachable_host(self, closed_url):
+        """
+        Test if connection error is raised as UpstreamError, so bot can answer it.
+        """
+        client = HttpClient(retries=0, limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6))
+        with pytest.raises(UpstreamError) as error:
+            client.get(closed_url)
+        assert error.value.status is None
+
+    def test_unreachable_host_async(self, closed_url):
+        async def get():
+            client = AsyncHttpClient(retries=0, limiter=RateLimiter(rate=10 ** 6, burst=10 ** 6))
+            try:
+                await client.get(closed_url)
+            finally:
+                await client.close()
+
+        with pytest.raises(UpstreamError):
+            asyncio.run(get())
+
+
+class TestBench:
+    def test_results_format(self):
+        """
+        Test if benchmark returns latency for every case.
+        """
+        results = Bench.run(iterations=2)
+        assert 'search_title:single_hit' in results['cases']
+        for case in results['cases'].values():
+            assert case['p50_ms'] <= case['p99_ms']
+
+    def test_regression_found(self):
+        baseline = {'cases': {'case': {'p50_ms': 1.0, 'p99_ms': 2.0}}}
+        results = {'cases': {'case': {'p50_ms': 1.1, 'p99_ms': 3.0}}}
+        assert len(Bench.find_regressions(results, baseline, 0.25)) == 1
@@ -0,0 +1,92 @@
+import re
+import json
+
+
+class Title:
+    """
+    Immutable record with title data.
+    Holds only extracted fields, so it is cheap to keep in caches
+    and to store in database.
+
+    Attributes:
+    - kind {str}: 'anime' or 'manga'
+    - id {int}: shikimori title id
+    - url {str}: title page url
+    - name {str}: title name, like 'Клеймор / Claymore'
+    - score {float}: title score, 0 if title has no score
+    - synopsis {str}: title synopsis, empty string if not found
+    - genres {tuple}: genre names
+    - image_url {str}: poster url
+    """
+    __slots__ = ('kind', 'id', 'url', 'name', 'score', 'synopsis', 'genres', 'image_url')
+
+    def __init__(self, kind, id, url, name, score, synopsis, genres, image_url) -> None:
+        values = (kind, id, url, name, float(score or 0), synopsis, tuple(genres), image_url)
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Title is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Title is immutable')
+
+    @property
+    def is_anime(self):
+        return self.kind == 'anime'
+
+    def to_bytes(self):
+        """
+        Returns title as compact json list encoded in utf-8.
+        """
+        return json.dumps(self.to_list(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        return cls(*json.loads(data))
+
+    def to_list(self):
+        values = [getattr(self, field) for field in self.__slots__]
+        values[self.__slots__.index('genres')] = list(self.genres)
+        return values
+
+    def to_dict(self):
+        return dict(zip(self.__slots__, self.to_list()))
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    @staticmethod
+    def parse_id(url):
+        """
+        Get shikimori id from title url.
+        Example:
+        In: 'https://shikimori.one/animes/z34599-made-in-abyss'
+        Out: 34599
+        If url has no id returns None
+        """
+        match = re.search(r'/(?:animes|mangas|ranobe)/[a-z]*(\d+)', url or '')
+        if match:
+            return int(match.group(1))
+        return None
+
+    def __eq__(self, other):
+        if not isinstance(other, Title):
+            return NotImplemented
+        return self.to_list() == other.to_list()
+
+    def __hash__(self):
+        return hash((self.kind, self.id, self.url))
+
+    def __getstate__(self):
+        return self.to_list()
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return f'Title({self.kind}, {self.id}, {self.name!r})'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from ShikiParser.ParserErrors import TitleNotFoundError
+
+
+class TitleCache:
+    """
+    Bounded in-process cache for ShikiParser.search_title results.
+
+    Attributes:
+    - max_size {int}: max number of stored queries, least recently used
+      query is evicted when limit is reached
+    - ttl {int|float}: seconds found title is kept
+    - not_found_ttl {int|float}: seconds TitleNotFoundError is kept
+    - stale_ttl {int|float}: seconds found title is still returned after its ttl,
+      as stale record which should be refreshed,
+      TitleNotFoundError is never returned after not_found_ttl
+
+    Keys are (normalized title name, is_anime).
+    Found titles are also indexed by (kind, shikimori id).
+    Object is thread-safe, so one cache can be shared between threads.
+    """
+    def __init__(self, max_size=1024, ttl=3600, not_found_ttl=60, stale_ttl=0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.not_found_ttl = not_found_ttl
+        self.stale_ttl = stale_ttl
+        self.stale_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__ids = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def make_key(title: str, is_anime: bool):
+        """
+        Normalize title name: lower case, single spaces between words.
+        """
+        return ' '.join(title.lower().split()), is_anime
+
+    def get(self, title: str, is_anime=True):
+        """
+        Returns cached Title or TitleNotFoundError object.
+        If nothing cached or record expired returns None.
+        """
+        return self.get_entry(title, is_anime)[0]
+
+    def get_entry(self, title: str, is_anime=True):
+        """
+        Returns (cached Title, TitleNotFoundError or None,
+        True if record is older than ttl and should be refreshed).
+        """
+        with self.__lock:
+            return self.__get(self.__entries, self.make_key(title, is_anime))
+
+    def peek(self, title: str, is_anime=True):
+        """
+        Same as get_entry, but record isn't counted in hits/misses
+        and isn't moved in LRU order. Used by background checks.
+        """
+        with self.__lock:
+            return self.__get(self.__entries, self.make_key(title, is_anime), count=False)
+
+    def get_by_id(self, kind: str, title_id: int):
+        """
+        Returns cached Title with given kind ('anime' or 'manga') and id.
+        If nothing cached or record expired returns None.
+        """
+        with self.__lock:
+            return self.__get(self.__ids, (kind, title_id))[0]
+
+    def add(self, title: str, is_anime, value, ttl=None):
+        """
+        Attributes:
+        - title {str}: title name as user wrote it
+        - is_anime {bool}: title type
+        - value: Title or TitleNotFoundError
+        - ttl {int|float}: seconds record is kept, if None ttl or not_found_ttl is used
+        """
+        if ttl is None:
+            ttl = self.not_found_ttl if isinstance(value, TitleNotFoundError) else self.ttl
+        expires = time.monotonic() + ttl
+
+        with self.__lock:
+            self.__put(self.__entries, self.make_key(title, is_anime), expires, value)
+            if not isinstance(value, TitleNotFoundError):
+                self.__put(self.__ids, (value.kind, value.id), expires, value)
+
+    def add_by_id(self, title, ttl=None):
+        """
+        Add Title only to (kind, id) index.
+        Used for titles which were got by id, not by name.
+        """
+        expires = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self.__lock:
+            self.__put(self.__ids, (title.kind, title.id), expires, title)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__ids.clear()
+
+    def __get(self, entries, key, count=True):
+        entry = entries.get(key)
+        now = time.monotonic()
+        if entry is not None and isinstance(entry[1], TitleNotFoundError):
+            stale_ttl = 0
+        else:
+            stale_ttl = self.stale_ttl
+        if entry is None or entry[0] + stale_ttl <= now:
+            if entry is not None:
+                del entries[key]
+            if count:
+                self.misses += 1
+            return None, False
+        is_stale = entry[0] <= now
+        if count:
+            entries.move_to_end(key)
+            self.hits += 1
+            if is_stale:
+                self.stale_hits += 1
+        return entry[1], is_stale
+
+    def __put(self, entries, key, expires, value):
+        entries[key] = (expires, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__entries)
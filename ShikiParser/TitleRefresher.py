@@ -0,0 +1,231 @@
+import os
+import json
+import asyncio
+import inspect
+import logging
+import threading
+from collections import Counter
+from queue import Queue, Full
+from ShikiParser.FileLock import lock_file
+from ShikiParser.RateLimiter import RateLimiter
+from ShikiParser.ParserErrors import TitleNotFoundError, UpstreamError, UpstreamThrottledError
+
+
+class TitleRefresher:
+    """
+    Refreshes cached titles in background thread:
+    stale titles which were just returned from the cache,
+    and the most popular searches, which are prewarmed periodically.
+
+    Attributes:
+    - parser {ShikiParser|AsyncShikiParser}: parser whose cache is refreshed
+    - budget {float}: max refresh lookups per minute, refreshes share
+      the client rate limit with live searches, so budget should be
+      a small part of it
+    - top_n {int}: number of the most popular searches to prewarm
+    - prewarm_interval {float}: seconds between prewarms
+    - queue_size {int}: max number of waiting refreshes, the rest is dropped
+    - max_tracked {int}: max number of searches counted for popularity
+    - popularity_path {str}: json file to keep popularity between restarts,
+      if None popularity is kept only in memory. File can be shared
+      by server workers, every worker adds its counts to the file
+    - loop {asyncio.AbstractEventLoop}: loop of AsyncShikiParser, refreshes
+      run on it and refresh thread waits for them. If None running loop is
+      taken, so refresher of async parser should be made inside the loop.
+      Don't call stop() from the loop thread, it waits for the refresh thread.
+
+    How to use:
+        refresher = TitleRefresher(parser)
+        parser.refresher = refresher
+        refresher.start()
+    """
+    def __init__(self, parser, budget=30, top_n=50, prewarm_interval=3600, queue_size=100,
+                 max_tracked=10000, popularity_path=None, loop=None) -> None:
+        self.parser = parser
+        self.loop = None
+        if inspect.iscoroutinefunction(parser.refresh_title):
+            self.loop = loop if loop is not None else asyncio.get_running_loop()
+        self.top_n = top_n
+        self.prewarm_interval = prewarm_interval
+        self.max_tracked = max_tracked
+        self.popularity_path = popularity_path
+        self.limiter = RateLimiter(rate=budget / 60, burst=1)
+        self.refreshed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.__popularity = Counter()
+        # Counts which are already in the popularity file
+        self.__saved = Counter()
+        self.__queue = Queue(maxsize=queue_size)
+        self.__queued = set()
+        self.__lock = threading.Lock()
+        self.__save_lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__threads = []
+
+    def start(self):
+        """
+        Load popularity, start refresh and prewarm threads.
+        The first prewarm is made right after start.
+        """
+        self.__stop.clear()
+        if self.popularity_path is not None:
+            self.load(self.popularity_path)
+        for target, name in ((self.__refresh, 'title-refresher'),
+                             (self.__prewarm, 'title-prewarmer')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self, timeout=None):
+        self.__stop.set()
+        self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join(timeout)
+        self.__threads = []
+        if self.popularity_path is not None:
+            self.save(self.popularity_path)
+
+    def record(self, title: str, is_anime):
+        """
+        Count search for popularity.
+        """
+        key = self.parser.cache.make_key(title, is_anime)
+        with self.__lock:
+            self.__popularity[key] += 1
+            if len(self.__popularity) > self.max_tracked:
+                # Keep the more popular half
+                self.__popularity = Counter(dict(
+                    self.__popularity.most_common(self.max_tracked // 2)
+                ))
+
+    def schedule(self, title: str, is_anime):
+        """
+        Put search to the refresh queue, if it's not there yet.
+        Returns False if queue is full and refresh is dropped.
+        """
+        key = self.parser.cache.make_key(title, is_anime)
+        with self.__lock:
+            if key in self.__queued:
+                return True
+            try:
+                self.__queue.put_nowait(key)
+            except Full:
+                self.dropped += 1
+                return False
+            self.__queued.add(key)
+        return True
+
+    def prewarm(self):
+        """
+        Schedule refresh of the most popular searches
+        which are not in the cache or are stale.
+        Returns number of scheduled searches.
+        """
+        scheduled = 0
+        for (title, is_anime), _ in self.most_popular(self.top_n):
+            value, is_stale = self.parser.cache.peek(title, is_anime)
+            if (value is None or is_stale) and self.schedule(title, is_anime):
+                scheduled += 1
+        logging.info(f'Prewarm scheduled {scheduled} of {self.top_n} popular searches')
+        return scheduled
+
+    def most_popular(self, count):
+        """
+        Returns list of ((title, is_anime), number of searches).
+        """
+        with self.__lock:
+            return self.__popularity.most_common(count)
+
+    def stats(self):
+        return {
+            'queued': self.__queue.qsize(),
+            'tracked_searches': len(self.__popularity),
+            'refreshed': self.refreshed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+    def save(self, path):
+        """
+        Add searches counted since the last save to the file,
+        so counts of other processes in the file are kept.
+        """
+        with self.__save_lock, lock_file(path):
+            with self.__lock:
+                counted = self.__popularity.copy()
+            popularity = self.read(path)
+            popularity.update(counted - self.__saved)
+            popularity = popularity.most_common(self.max_tracked)
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump([[title, is_anime, count] for (title, is_anime), count in popularity],
+                          file, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_path, path)
+            self.__saved = counted
+
+    def load(self, path):
+        with lock_file(path):
+            popularity = self.read(path)
+        with self.__lock:
+            self.__popularity.update(popularity)
+            self.__saved.update(popularity)
+        return len(popularity)
+
+    @staticmethod
+    def read(path):
+        """
+        Returns Counter (title, is_anime) -> searches from the file,
+        empty if there is no file or it's broken.
+        """
+        if not os.path.exists(path):
+            return Counter()
+        try:
+            with open(path, encoding='utf-8') as file:
+                return Counter({(title, is_anime): count
+                                for title, is_anime, count in json.load(file)})
+        except (OSError, ValueError, TypeError):
+            logging.exception('Searches popularity is not loaded')
+            return Counter()
+
+    def __refresh(self):
+        while True:
+            key = self.__queue.get()
+            if key is None or self.__stop.is_set():
+                return
+            title, is_anime = key
+            try:
+                # Waits for the budget, so refreshes go one by one
+                self.limiter.acquire()
+                if self.loop is None:
+                    self.parser.refresh_title(title, is_anime)
+                else:
+                    asyncio.run_coroutine_threadsafe(self.parser.refresh_title(title, is_anime),
+                                                     self.loop).result()
+                self.refreshed += 1
+            except TitleNotFoundError:
+                # Title is gone, not found result is cached now
+                self.refreshed += 1
+            except UpstreamThrottledError:
+                # Live searches use all requests now, stale data is kept
+                self.failed += 1
+            except UpstreamError as error:
+                self.failed += 1
+                logging.warning(f'Refresh of ({title}) failed: {error}')
+            except Exception:
+                self.failed += 1
+                logging.exception(f'Refresh of ({title}) failed')
+            finally:
+                with self.__lock:
+                    self.__queued.discard(key)
+
+    def __prewarm(self):
+        while True:
+            try:
+                self.prewarm()
+                if self.popularity_path is not None:
+                    self.save(self.popularity_path)
+            except Exception:
+                logging.exception('Prewarm failed')
+            if self.__stop.wait(self.prewarm_interval):
+                return
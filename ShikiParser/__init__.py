@@ -1,3 +1,31 @@
 from ShikiParser.Parser import ShikiParser
 from ShikiParser.ParserErrors import TitleNotFoundError, TitleNameFormatError
-from ShikiParser.Anime import Anime
\ No newline at end of file
+from ShikiParser.ParserErrors import UpstreamError, UpstreamThrottledError
+from ShikiParser.Anime import Anime
+from ShikiParser.Manga import Manga
+from ShikiParser.Title import Title
+from ShikiParser.TitleCache import TitleCache
+from ShikiParser.SharedTitleCache import SharedTitleCache
+from ShikiParser.LocalTitleIndex import LocalTitleIndex
+from ShikiParser.TitleRefresher import TitleRefresher
+from ShikiParser.HttpClient import HttpClient
+from ShikiParser.ResponseCache import ResponseCache
+from ShikiParser.HtmlBackend import HtmlBackend
+from ShikiParser.ApiBackend import ApiBackend
+from ShikiParser.SingleFlight import SingleFlight, AsyncSingleFlight
+from ShikiParser.RateLimiter import RateLimiter
+from ShikiParser.FileLock import lock_file
+
+
+def __getattr__(name):
+    """
+    Async classes are imported on first use,
+    so sync bot doesn't spend start time on importing aiohttp.
+    """
+    if name == 'AsyncShikiParser':
+        from ShikiParser.AsyncParser import AsyncShikiParser
+        return AsyncShikiParser
+    if name == 'AsyncHttpClient':
+        from ShikiParser.AsyncClient import AsyncHttpClient
+        return AsyncHttpClient
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
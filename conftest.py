@@ -0,0 +1,25 @@
+import os
+import tempfile
+import pytest
+
+
+# ShikiBotDB makes its engine on import, so tests never touch the working database
+os.environ['SHIKIBOT_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'callbacks.db')
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Binds ShikiBotDB Session to an empty database in tmp_path.
+    """
+    from ShikiBotDB import init_db
+    from ShikiBotDB.Engine import ENGINE, Session, make_engine
+
+    engine = make_engine(f'sqlite:///{tmp_path / "callbacks.db"}')
+    init_db(engine)
+    Session.remove()
+    Session.configure(bind=engine)
+    yield engine
+    Session.remove()
+    Session.configure(bind=ENGINE)
+    engine.dispose()
@@ -1,14 +1,22 @@
+import atexit
 import logging
 import os
+import re
+import threading
+import time
 
 from enum import Enum
-from flask import Flask, request
-from telebot import TeleBot, types
+from flask import Flask, request, jsonify
+from telebot import TeleBot, types, apihelper
+from telebot.apihelper import ApiTelegramException
 from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
+from telebot.types import InlineQueryResultArticle, InputTextMessageContent
 from datetime import datetime
-from ShikiParser import ShikiParser
-from ShikiParser import TitleNotFoundError, TitleNameFormatError
-from ShikiBotDB import CallbackProxy
+from ShikiParser import ShikiParser, SharedTitleCache, LocalTitleIndex, TitleRefresher
+from ShikiParser import TitleNotFoundError, TitleNameFormatError, UpstreamError, HttpClient
+from ShikiParser.HttpClient import get_client_settings
+from ShikiBotDB import CallbackProxy, CallbackSweeper, init_db
+from ShikiBotServer import UpdateDispatcher, Metrics, TitleIndex, SendQueue, LogQueue
 
 
 # Need to add some emojies for this text
@@ -25,6 +33,9 @@ START_TEXT = \
 - Для поиска манги отправьте сообщение в формате:
   Манга *название манги*
 
+- Можно искать несколько тайтлов сразу, через точку с запятой:
+  Аниме *название*; *название*; *название*
+
 - Поиск работает как с английскими так и русскими названиями
 
 - Можно использовать только большие/маленькие буквы и цифры
@@ -40,11 +51,20 @@ P.S: Бот не является официальным.
 """
 
 
-# Logging
-FORMAT = '[%(asctime)s]   %(levelname)-8s   FILE: %(filename)s    MESSAGE: %(message)s'
-logging.basicConfig(level=logging.INFO, format=FORMAT, filename='logs.log')
+# Logging: json records are written to file by background thread.
+# Rotation isn't shared between processes, so '{pid}' in file name
+# gives every server worker its own file
+log_queue = LogQueue(
+    os.environ.get('SHIKIBOT_LOG_FILE', 'logs-{pid}.log'),
+    max_bytes=int(os.environ.get('SHIKIBOT_LOG_MAX_MB', 10)) * 1024 * 1024,
+    backup_count=int(os.environ.get('SHIKIBOT_LOG_BACKUPS', 5)),
+    sample_rate=float(os.environ.get('SHIKIBOT_LOG_SAMPLE_RATE', 0.1))
+)
 
 TITLE_NAME_STARTS = 6  # Position where title starts in message
+BATCH_SEPARATOR = ';'  # Separates titles in one message
+MAX_BATCH_SIZE = int(os.environ.get('SHIKIBOT_MAX_BATCH_SIZE', 10))
+BATCH_WORKERS = int(os.environ.get('SHIKIBOT_BATCH_WORKERS', 4))
 # New emoji should be defined here
 class Emoji(Enum):
     STAR = '\U00002B50'
@@ -60,6 +80,8 @@ class ErrorMessage(Enum):
     NO_SYNOPSIS = 'Описание отсутсвует'
     NO_SCORE = 'У тайтла пока нет рейтинга'
     NO_GENRES = 'У тайтла не указаны жанры'
+    UNAVAILABLE = 'Шикимори сейчас не отвечает, попробуйте чуть позже'
+    TOO_MANY = 'Слишком много тайтлов в одном сообщении, максимум'
     # OUT_OF_DATE = 'Скорее всего время исполнения запроса истекло :('
 
 
@@ -71,76 +93,167 @@ def get_token():
         return file.read()
 
 
-TOKEN = get_token()
-bot = TeleBot(TOKEN)
-server = Flask(__name__)
-parser = ShikiParser()
-
-
-def get_inline_keyboard(callback_id):
+# Created by create_app(), every server worker process has its own objects
+metrics = Metrics()
+bot = None
+server = None
+parser = None
+dispatcher = None
+outbox = None
+sweeper = None
+title_index = None
+startup = {}
+# If True inline buttons carry title kind and id instead of database record id,
+# so search doesn't write to the database
+STATELESS_CALLBACKS = os.environ.get('SHIKIBOT_STATELESS_CALLBACKS', '0') == '1'
+TITLE_INDEX_SNAPSHOT = os.environ.get('SHIKIBOT_INDEX_SNAPSHOT', 'title_index.json')
+# Number of server worker processes, same default as in Procfile.
+# Upstream, refresh and telegram rate limits are set for the whole server,
+# every worker gets its part of them
+WORKER_PROCESSES = max(1, int(os.environ.get('WEB_CONCURRENCY', 2)))
+_app_lock = threading.Lock()
+_IMPORTED_AT = time.time()
+
+
+def get_inline_keyboard(callback_key):
     """
     Attributes:
-    - title_name {str}: used in callback data
-    - is_anime {bool}: used in callback data
+    - callback_key {str|int}: callback record id or title key
+      from get_title_key, used in callback data
     Create and return inline keyboard for title.
     Callback data:
-    - chat_id {int}
-    - synopsis or score
+    - callback_key
+    - synopsis, score or genre
     """
     markup = InlineKeyboardMarkup()
     markup.row_width = 1
     markup.add(
         InlineKeyboardButton(
             f"{Emoji.CLOUD.value} Описание {Emoji.CLOUD.value}",
-            callback_data=f'{callback_id}|synopsis'),
+            callback_data=f'{callback_key}|synopsis'),
         InlineKeyboardButton(
             f"{Emoji.STAR.value} Рейтинг {Emoji.STAR.value}",
-            callback_data=f'{callback_id}|score'),
+            callback_data=f'{callback_key}|score'),
         InlineKeyboardButton(
             f"{Emoji.CLAPPER_BOARD.value} Жанры {Emoji.CLAPPER_BOARD.value}",
-            callback_data=f'{callback_id}|genre'
+            callback_data=f'{callback_key}|genre'
         )
     ) 
     return markup
 
 
+def get_title_key(title):
+    """
+    Compact title key for stateless callback data.
+    Example: anime with id 34599 -> 'a|34599'
+    """
+    return f'{title.kind[0]}|{title.id}'
+
+
+def get_genres_text(genres):
+    """
+    Genres from database are already a string,
+    genres from parser are a tuple of names.
+    """
+    if isinstance(genres, str):
+        return genres
+    return CallbackProxy.get_genres_ready(genres)
+
+
+# Characters which have to be escaped in MarkdownV2 text
+MARKDOWN_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+
+
+def escape_markdown(text):
+    """
+    Escape text for parse_mode='MarkdownV2', so user input
+    and title names are shown as is, also inside link text.
+    """
+    return MARKDOWN_SPECIAL.sub(r'\\\1', str(text))
+
+
+def escape_markdown_url(url):
+    """
+    Escape url inside (...) of MarkdownV2 link.
+    """
+    return url.replace('\\', '\\\\').replace(')', '\\)')
+
+
 def construct_message(title_name, title_info):
     return f'*{title_name}*\n\n{title_info}'
 
 
+def reply(chat_id, stage, function, *args, **kwargs):
+    """
+    Put telegram request to the send queue, it's made later in send queue thread.
+    Attributes:
+    - chat_id {int}: chat reply goes to
+    - stage {str}: stage name for request timing
+    - function {callable}: bot method, e.g. bot.send_message
+    - args, kwargs: function arguments
+    Returns Future with function result.
+    """
+    def timed_request():
+        with metrics.timer(stage):
+            return function(*args, **kwargs)
+    return outbox.send(chat_id, timed_request)
+
+
 def send_message(chat_id, title_name, title_info, title_error=None):
     if not title_error:
         title_name_check = title_name + f' {Emoji.CHECKMARK.value}'
     else:
         title_name_check = title_name + f' {Emoji.CROSSMARK.value}'
 
-    bot.send_message(chat_id,
-                    construct_message(
-                        title_name_check,
-                        title_info),
-                        parse_mode='Markdown'
+    reply(chat_id, 'telegram_send_message', bot.send_message,
+          chat_id,
+          construct_message(
+              title_name_check,
+              title_info),
+          parse_mode='Markdown'
     )
 
 
-@bot.message_handler(commands=['start'])
-def start_message(message):
+def send_poster(chat_id, title, keyboard):
     """
-    Bot send message with greeting and short instruction "how to"
+    Send title poster with name caption and keyboard.
+    Called in send queue thread.
+    Poster sent once is sent again by telegram file_id, so telegram
+    doesn't download it from shikimori every time.
+    If saved file_id isn't accepted anymore poster is sent by url.
     """
-    bot.send_message(message.chat.id, START_TEXT)
+    with metrics.timer('db_read_poster'), CallbackProxy() as callback_proxy:
+        file_id = callback_proxy.get_poster_file_id(title.image_url)
+
+    if file_id is not None:
+        try:
+            with metrics.timer('telegram_send_photo'):
+                bot.send_photo(chat_id, file_id, caption=f'*{title.name}*',
+                               reply_markup=keyboard, parse_mode='Markdown')
+            metrics.inc('poster_sends_total', {'source': 'file_id'})
+            return
+        except ApiTelegramException as error:
+            if error.error_code != 400:
+                raise
+            logging.warning(f'Poster file_id of ({title.name}) is stale: {error}')
+
+    with metrics.timer('telegram_send_photo'):
+        message = bot.send_photo(chat_id, title.image_url, caption=f'*{title.name}*',
+                                 reply_markup=keyboard, parse_mode='Markdown')
+    metrics.inc('poster_sends_total', {'source': 'url'})
+    # The biggest photo size is the last one
+    new_file_id = message.photo[-1].file_id if message.photo else None
+    with metrics.timer('db_write_poster'), CallbackProxy() as callback_proxy:
+        callback_proxy.set_poster_file_id(title.image_url, new_file_id)
 
 
-@bot.message_handler(content_type=['text'])
-def clear_old_records(message):
+def start_message(message):
     """
-    Every time when someone send a message to the bot
-    it deletes old records from database
+    Bot send message with greeting and short instruction "how to"
     """
-    callback_proxy = CallbackProxy()
-    callback_proxy.delete_old_callbacks(hours=1)
+    reply(message.chat.id, 'telegram_send_message', bot.send_message, message.chat.id, START_TEXT)
 
 
-@bot.message_handler(content_types=['text'])
 def search_title(message):
     """
     Bots react on every message which starts with "аниме" or "манга". 
@@ -151,41 +264,98 @@ def search_title(message):
     """
     message_text = message.text.lower()
     if message_text[:TITLE_NAME_STARTS-1] in ['аниме', 'манга']:
-        callback_proxy = CallbackProxy()
-
         title_name = message.text[TITLE_NAME_STARTS:]
         is_anime = True if message_text.startswith('аниме') else False
         chat_id = message.chat.id
+        if BATCH_SEPARATOR in title_name:
+            search_titles(chat_id, title_name.split(BATCH_SEPARATOR), is_anime)
+            return
 
+        metrics.inc('searches_total')
+        log_fields = {'chat_id': chat_id, 'title': title_name, 'is_anime': is_anime}
         try:
-            title = parser.search_title(title_name, is_anime)
-            # Adds callback to db
-            callback_id = callback_proxy.add_callback(
-                chat_id,
-                title.name,
-                float(title.score),
-                title.synopsis(),
-                title.genres
-            )
-            logging.info(f'Callback for user {chat_id} written to database.')
-
-            keyboard = get_inline_keyboard(callback_id)
-            bot.send_photo(
-                chat_id,
-                title.image_url,
-                caption=f'*{title.name}*',
-                reply_markup=keyboard,
-                parse_mode='Markdown'
-            )
+            started = time.perf_counter()
+            with metrics.timer('search_title'):
+                title = parser.search_title(title_name, is_anime)
+            log_fields['search_seconds'] = round(time.perf_counter() - started, 4)
+            title_index.add(title)
+            if STATELESS_CALLBACKS:
+                callback_key = get_title_key(title)
+            else:
+                # Adds callback to db
+                started = time.perf_counter()
+                with metrics.timer('db_write'), CallbackProxy() as callback_proxy:
+                    callback_key = callback_proxy.add_callback(chat_id, title)
+                log_fields['db_write_seconds'] = round(time.perf_counter() - started, 4)
+            logging.info(f'Title ({title.name}) found', extra={**log_fields, 'sampled': True})
+
+            outbox.send(chat_id, send_poster, chat_id, title, get_inline_keyboard(callback_key))
         except TitleNotFoundError:
-            bot.send_message(chat_id, f'{ErrorMessage.NOT_FOUND.value} {Emoji.CROSSMARK.value}')
-            logging.error(f'Title ({title_name}) not found')
+            metrics.inc('search_errors_total', {'error': 'not_found'})
+            reply(chat_id, 'telegram_send_message', bot.send_message,
+                  chat_id, f'{ErrorMessage.NOT_FOUND.value} {Emoji.CROSSMARK.value}')
+            logging.error(f'Title ({title_name}) not found', extra=log_fields)
         except TitleNameFormatError:
-            bot.send_message(chat_id, f'{ErrorMessage.BAD_NAME.value} {Emoji.CROSSMARK.value}')
-            logging.error(f'Title name ({title_name}) wrong format')
+            metrics.inc('search_errors_total', {'error': 'bad_name'})
+            reply(chat_id, 'telegram_send_message', bot.send_message,
+                  chat_id, f'{ErrorMessage.BAD_NAME.value} {Emoji.CROSSMARK.value}')
+            logging.error(f'Title name ({title_name}) wrong format', extra=log_fields)
+        except UpstreamError as error:
+            metrics.inc('search_errors_total', {'error': 'upstream'})
+            reply(chat_id, 'telegram_send_message', bot.send_message,
+                  chat_id, f'{ErrorMessage.UNAVAILABLE.value} {Emoji.CROSSMARK.value}')
+            logging.error(f'Title ({title_name}) search failed: {error}', extra=log_fields)
+
+
+def search_titles(chat_id, title_names, is_anime):
+    """
+    Search several titles at once and answer with one message:
+    title name with score for every found title, error for every not found.
+    """
+    title_names = [title_name.strip() for title_name in title_names if title_name.strip()]
+    if not title_names:
+        reply(chat_id, 'telegram_send_message', bot.send_message,
+              chat_id, f'{ErrorMessage.BAD_NAME.value} {Emoji.CROSSMARK.value}')
+        return
+    if len(title_names) > MAX_BATCH_SIZE:
+        reply(chat_id, 'telegram_send_message', bot.send_message, chat_id,
+              f'{ErrorMessage.TOO_MANY.value} {MAX_BATCH_SIZE} {Emoji.CROSSMARK.value}')
+        return
+
+    metrics.inc('batch_searches_total')
+    metrics.inc('searches_total', value=len(title_names))
+    with metrics.timer('search_many'):
+        found = parser.search_many(title_names, is_anime, BATCH_WORKERS)
+
+    lines = []
+    for number, (title_name, title) in enumerate(zip(title_names, found), 1):
+        if isinstance(title, TitleNotFoundError):
+            error, label = ErrorMessage.NOT_FOUND, 'not_found'
+        elif isinstance(title, TitleNameFormatError):
+            error, label = ErrorMessage.BAD_NAME, 'bad_name'
+        elif isinstance(title, UpstreamError):
+            error, label = ErrorMessage.UNAVAILABLE, 'upstream'
+        elif isinstance(title, Exception):
+            # Unexpected error of one title doesn't break the whole answer
+            error, label = ErrorMessage.UNAVAILABLE, 'unexpected'
+        else:
+            title_index.add(title)
+            score = f'{title.score} {Emoji.STAR.value}' if title.score else ErrorMessage.NO_SCORE.value
+            lines.append(f'{number}\\. [{escape_markdown(title.name)}]({escape_markdown_url(title.url)}) '
+                         f'{Emoji.CHECKMARK.value}\n{escape_markdown(score)}')
+            continue
+        metrics.inc('search_errors_total', {'error': label})
+        logging.error(f'Title ({title_name}) search failed: {title}',
+                      exc_info=title if label == 'unexpected' else None,
+                      extra={'chat_id': chat_id, 'title': title_name, 'is_anime': is_anime})
+        # User text is escaped, unbalanced '_' or '*' would make telegram reject the message
+        lines.append(f'{number}\\. {escape_markdown(title_name)} {Emoji.CROSSMARK.value}\n'
+                     f'{escape_markdown(error.value)}')
+
+    reply(chat_id, 'telegram_send_message', bot.send_message,
+          chat_id, '\n\n'.join(lines), parse_mode='MarkdownV2', disable_web_page_preview=True)
 
 
-@bot.callback_query_handler(func=lambda call: True)
 def callback_title(call):
     """
     React on InlineButton click event.
@@ -195,58 +365,301 @@ def callback_title(call):
     If there is no synopsis - send ERROR_MESSAGES['no synopsis']
     If there is no score - send ERROR_MESSAGES['no score']
     """
-    callback_proxy = CallbackProxy()
-
+    metrics.inc('callbacks_total')
     splitted = call.data.split('|')
-    callback_id, button_context = splitted[0], splitted[1]
-    callback = callback_proxy.get_callback_by_id(callback_id)
+    button_context = splitted[-1]
     title_info = ''
     title_error = ''
 
-    if callback is None:
-        logging.warning(f'Callback with chat id {callback.chat_id} NOT FOUND')
-        return
+    if len(splitted) == 3:
+        # Stateless callback: title kind and id.
+        # Messages sent via inline mode have no chat, answer to the user
+        chat_id = call.message.chat.id if call.message else call.from_user.id
+        kind = 'anime' if splitted[0] == 'a' else 'manga'
+        try:
+            with metrics.timer('callback_title_lookup'):
+                title = parser.get_title(kind, int(splitted[1]))
+            title_index.add(title)
+        except TitleNotFoundError:
+            metrics.inc('callback_errors_total', {'error': 'not_found'})
+            logging.warning(f'Title {kind} {splitted[1]} NOT FOUND', extra={'chat_id': chat_id})
+            return
+        except UpstreamError as error:
+            metrics.inc('callback_errors_total', {'error': 'upstream'})
+            logging.error(f'Title {kind} {splitted[1]} lookup failed: {error}',
+                          extra={'chat_id': chat_id})
+            send_message(chat_id, kind, ErrorMessage.UNAVAILABLE.value, True)
+            return
+    else:
+        callback_id = splitted[0]
+        with metrics.timer('callback_db_read'), CallbackProxy() as callback_proxy:
+            callback = callback_proxy.get_callback_by_id(callback_id)
+            if callback is None:
+                metrics.inc('callback_errors_total', {'error': 'not_found'})
+                logging.warning(f'Callback with id {callback_id} NOT FOUND')
+                return
+            chat_id = callback.chat_id
+            title = callback.title
+
+    log_fields = {'chat_id': chat_id, 'title': title.name, 'button': button_context,
+                  'sampled': True}
     if button_context == 'synopsis':
-        if callback.title_synopsis:
-            title_info = callback.title_synopsis
-            logging.info(f'Send ({callback.title_name}) synopsis for user {callback.chat_id}')
+        if title.synopsis:
+            title_info = title.synopsis
+            logging.info(f'Send ({title.name}) synopsis for user {chat_id}', extra=log_fields)
         else:
             title_error = ErrorMessage.NO_SYNOPSIS.value
-            logging.warning(f'Not found synopsis for ({callback.title_name})')
+            logging.warning(f'Not found synopsis for ({title.name})')
     if button_context == 'score':
-        if callback.title_score:
-            title_info = str(callback.title_score) + f' {Emoji.STAR.value}'
-            logging.info(f'Send ({callback.title_name}) for user {callback.chat_id}')
+        if title.score:
+            title_info = str(title.score) + f' {Emoji.STAR.value}'
+            logging.info(f'Send ({title.name}) for user {chat_id}', extra=log_fields)
         else:
             title_error = ErrorMessage.NO_SCORE.value
-            logging.warning(f'Not found score for ({callback.title_name})')
+            logging.warning(f'Not found score for ({title.name})')
     if button_context == 'genre':
-        if callback.title_genres:
-            title_info = callback.title_genres
-            logging.info(f'Send ({callback.title_name}) genres for user {callback.chat_id}')
+        if title.genres:
+            title_info = get_genres_text(title.genres)
+            logging.info(f'Send ({title.name}) genres for user {chat_id}', extra=log_fields)
         else:
             title_error = ErrorMessage.NO_GENRES.value
-            logging.warning(f'Not found genres for ({callback.title_name})')
+            logging.warning(f'Not found genres for ({title.name})')
+
 
+    send_message(chat_id, title.name, title_info, title_error)
 
-    send_message(callback.chat_id, callback.title_name, title_info, title_error)
 
 
+def inline_title(query):
+    """
+    Suggest already known titles while user types "@bot name".
+    "аниме"/"манга" at the start of query limits suggestions to this kind.
+    Titles are taken from title_index only, shikimori is not requested.
+    Buttons of suggested message use stateless callbacks.
+    Answer is sent at once, not through the send queue: inline answers
+    are not chat messages and have no per-chat flood limit.
+    """
+    text = query.query.strip()
+    kind = None
+    if text[:TITLE_NAME_STARTS-1].lower() in ['аниме', 'манга']:
+        kind = 'anime' if text.lower().startswith('аниме') else 'manga'
+        text = text[TITLE_NAME_STARTS-1:]
+
+    metrics.inc('inline_queries_total')
+    with metrics.timer('inline_index_search'):
+        titles = title_index.search(text, kind)
+    results = [
+        InlineQueryResultArticle(
+            id=get_title_key(title),
+            title=title.name,
+            description=f'{title.score} {Emoji.STAR.value}' if title.score else None,
+            thumb_url=title.image_url,
+            input_message_content=InputTextMessageContent(
+                f'[{Emoji.CLAPPER_BOARD.value}]({title.image_url}) *{title.name}*',
+                parse_mode='Markdown'
+            ),
+            reply_markup=get_inline_keyboard(get_title_key(title))
+        )
+        for title in titles
+    ]
+    try:
+        with metrics.timer('telegram_answer_inline_query'):
+            bot.answer_inline_query(query.id, results, cache_time=60)
+    except apihelper.ApiException as error:
+        # Answer is useless a few seconds later, so it's not retried
+        logging.warning(f'Inline answer failed: {error}', extra={'chat_id': query.from_user.id})
+
 
-@server.route('/bot', methods=['POST'])
 def get_message():
-    bot.process_new_updates([types.Update.de_json(request.stream.read().decode('utf-8'))])
+    """
+    Put update to the dispatcher queue and answer telegram immediately.
+    If queue is full update is dropped.
+    """
+    dispatcher.dispatch(types.Update.de_json(request.stream.read().decode('utf-8')))
     return '!', 200
 
 
-@server.route('/')
+def stats():
+    return jsonify({
+        'dispatcher': dispatcher.stats(),
+        'send_queue': outbox.stats(),
+        'sweeper': sweeper.stats(),
+        'local_index': parser.index.stats(),
+        'refresher': parser.refresher.stats(),
+        'logging': log_queue.stats(),
+        'response_cache': parser.client.response_cache.stats()
+        if parser.client.response_cache is not None else None,
+        'startup': startup
+    })
+
+
+def get_metrics():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
 def webhook():
     bot.remove_webhook()
     bot.set_webhook(url='https://shiki-bot.herokuapp.com/bot')
     return '!', 200
 
+def create_app():
+    """
+    App factory for WSGI server:
+        gunicorn 'main:create_app()'
+    Every worker process calls it once and gets its own bot, parser,
+    background threads and connections. Title data is shared between
+    workers through SharedTitleCache and LocalTitleIndex files.
+    Time from process start to ready app is logged, exported
+    as cold_start_seconds and shown on /stats.
+    """
+    global bot, server, parser, dispatcher, outbox, sweeper, title_index
+    with _app_lock:
+        if server is not None:
+            return server
+        started = time.perf_counter()
+        # Started here, so writer thread runs in every forked worker
+        log_queue.start()
+        atexit.register(log_queue.stop)
+        # Tables are created and migrated here, importing ShikiBotDB doesn't touch database
+        init_db()
+
+        # Load test points the bot at FakeTelegram
+        if os.environ.get('SHIKIBOT_TELEGRAM_API_URL'):
+            apihelper.API_URL = os.environ['SHIKIBOT_TELEGRAM_API_URL']
+        # Handlers run in dispatcher workers, not in telebot thread pool
+        bot = TeleBot(get_token(), threaded=False)
+        bot.message_handler(commands=['start'])(start_message)
+        bot.message_handler(content_types=['text'])(search_title)
+        bot.callback_query_handler(func=lambda call: True)(callback_title)
+        bot.inline_handler(func=lambda query: True)(inline_title)
+
+        app = Flask(__name__)
+        app.add_url_rule('/bot', view_func=get_message, methods=['POST'])
+        app.add_url_rule('/stats', view_func=stats)
+        app.add_url_rule('/metrics', view_func=get_metrics)
+        app.add_url_rule('/', view_func=webhook)
+
+        dispatcher = UpdateDispatcher(
+            bot.process_new_updates,
+            workers=int(os.environ.get('SHIKIBOT_WORKERS', 4)),
+            queue_size=int(os.environ.get('SHIKIBOT_QUEUE_SIZE', 100)),
+            put_timeout=float(os.environ.get('SHIKIBOT_QUEUE_TIMEOUT', 1.0))
+        )
+        dispatcher.start()
+        # Replies are sent by send queue threads within telegram flood limits
+        outbox = SendQueue(
+            workers=int(os.environ.get('SHIKIBOT_SEND_WORKERS', 4)),
+            global_rate=float(os.environ.get('SHIKIBOT_SEND_RATE', 30)) / WORKER_PROCESSES,
+            chat_rate=float(os.environ.get('SHIKIBOT_CHAT_RATE', 1)),
+            chat_burst=int(os.environ.get('SHIKIBOT_CHAT_BURST', 3))
+        )
+        outbox.latency_hook = lambda seconds: metrics.observe('send_queue_seconds', seconds)
+        outbox.start()
+        # At exit updates already accepted are handled first, then their replies are sent.
+        # atexit calls functions in reverse order
+        atexit.register(outbox.stop, 5)
+        atexit.register(dispatcher.stop, 5)
+        # Expired callbacks are deleted in background, not on message handling
+        sweeper = CallbackSweeper(
+            interval=float(os.environ.get('SHIKIBOT_SWEEP_INTERVAL', 300)),
+            max_age_minutes=int(os.environ.get('SHIKIBOT_CALLBACK_TTL_MINUTES', 60))
+        )
+        sweeper.start()
+        # Every worker has its part of the upstream rate limit
+        client = HttpClient(**get_client_settings(WORKER_PROCESSES))
+        # Titles found by one worker are not requested again by the others
+        parser = ShikiParser(SharedTitleCache(
+            os.environ.get('SHIKIBOT_SHARED_CACHE', 'title_cache.db'),
+            max_size=int(os.environ.get('SHIKIBOT_CACHE_SIZE', 1024)),
+            ttl=int(os.environ.get('SHIKIBOT_CACHE_TTL', 3600)),
+            not_found_ttl=int(os.environ.get('SHIKIBOT_CACHE_NOT_FOUND_TTL', 60)),
+            # Title older than ttl is returned at once and refreshed in background
+            stale_ttl=int(os.environ.get('SHIKIBOT_CACHE_STALE_TTL', 86400))
+        ), index=LocalTitleIndex(
+            os.environ.get('SHIKIBOT_LOCAL_INDEX', 'titles.db'),
+            max_age=int(os.environ.get('SHIKIBOT_LOCAL_INDEX_MAX_AGE', 86400))
+        ), client=client)
+        parser.timer = metrics.timer
+        parser.refresher = TitleRefresher(
+            parser,
+            budget=float(os.environ.get('SHIKIBOT_REFRESH_BUDGET', 30)) / WORKER_PROCESSES,
+            top_n=int(os.environ.get('SHIKIBOT_PREWARM_TOP', 50)),
+            prewarm_interval=float(os.environ.get('SHIKIBOT_PREWARM_INTERVAL', 3600)),
+            # Shared by workers, each one adds its counts to the file
+            popularity_path=os.environ.get('SHIKIBOT_POPULARITY', 'popularity.json')
+        )
+        parser.refresher.start()
+        atexit.register(parser.refresher.stop, 5)
+        parser.client.add_response_hook(
+            lambda response: metrics.inc('upstream_responses_total', {'status': response.status_code})
+        )
+        # Titles found by the bot, used for inline query suggestions
+        title_index = TitleIndex(max_titles=int(os.environ.get('SHIKIBOT_INDEX_SIZE', 10000)))
+        try:
+            title_index.load(TITLE_INDEX_SNAPSHOT)
+        except (OSError, ValueError, TypeError):
+            logging.exception('Title index snapshot is not loaded')
+        title_index.start_autosave(TITLE_INDEX_SNAPSHOT,
+                                   float(os.environ.get('SHIKIBOT_INDEX_SAVE_INTERVAL', 300)))
+        atexit.register(title_index.stop_autosave, TITLE_INDEX_SNAPSHOT)
+
+        register_gauges()
+        server = app
+        startup['create_app_seconds'] = time.perf_counter() - started
+        startup['cold_start_seconds'] = time.time() - get_process_start_time()
+        metrics.gauge('cold_start_seconds', lambda: startup['cold_start_seconds'])
+        logging.info(f"App is ready in {startup['cold_start_seconds']:.3f}s after process start, "
+                     f"create_app took {startup['create_app_seconds']:.3f}s")
+        return server
+
+
+def register_gauges():
+    metrics.gauge('title_index_size', lambda: len(title_index))
+    metrics.gauge('title_cache_hits_total', lambda: parser.cache.hits)
+    metrics.gauge('title_cache_misses_total', lambda: parser.cache.misses)
+    metrics.gauge('title_cache_shared_hits_total', lambda: parser.cache.shared_hits)
+    metrics.gauge('title_cache_size', lambda: len(parser.cache))
+    metrics.gauge('title_cache_stale_hits_total', lambda: parser.cache.stale_hits)
+    metrics.gauge('title_refreshes_total', lambda: parser.refresher.refreshed)
+    metrics.gauge('title_refresh_failures_total', lambda: parser.refresher.failed)
+    metrics.gauge('title_refresh_queue_depth', lambda: parser.refresher.stats()['queued'])
+    metrics.gauge('local_index_lookups_total', lambda: parser.index.lookups)
+    metrics.gauge('local_index_hits_total', lambda: parser.index.hits)
+    metrics.gauge('local_index_fresh_hits_total', lambda: parser.index.fresh_hits)
+    metrics.gauge('lookups_coalesced_total', lambda: parser.flights.shared)
+    metrics.gauge('upstream_backoffs_total', lambda: parser.client.limiter.backoffs)
+    metrics.gauge('update_queue_depth', lambda: dispatcher.stats()['queue_depth'])
+    metrics.gauge('update_workers_busy', lambda: dispatcher.stats()['busy_workers'])
+    metrics.gauge('update_workers_utilization', lambda: dispatcher.stats()['utilization'])
+    metrics.gauge('updates_dropped_total', lambda: dispatcher.dropped)
+    metrics.gauge('send_queue_depth', lambda: outbox.stats()['queued'])
+    metrics.gauge('send_retries_total', lambda: outbox.retried)
+    metrics.gauge('send_failures_total', lambda: outbox.failed)
+    metrics.gauge('log_records_dropped_total', lambda: log_queue.stats()['dropped'])
+    if parser.client.response_cache is not None:
+        response_cache = parser.client.response_cache
+        metrics.gauge('response_cache_revalidated_total', lambda: response_cache.hits)
+        metrics.gauge('response_cache_misses_total', lambda: response_cache.misses)
+        metrics.gauge('response_cache_saved_bytes_total', lambda: response_cache.saved_bytes)
+
+
+def get_process_start_time():
+    """
+    Returns process start time (unix time), taken from /proc on linux.
+    If it can't be read returns time when this module was imported.
+    """
+    try:
+        with open('/proc/self/stat') as stat_file:
+            start_ticks = int(stat_file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
+
+
 if __name__ == '__main__':
-    server.run(host="0.0.0.0", port=int(os.environ.get('PORT', 80)))
+    create_app().run(host="0.0.0.0", port=int(os.environ.get('PORT', 80)))
     # while True:
     #     try:
     #         bot.polling(none_stop=True)